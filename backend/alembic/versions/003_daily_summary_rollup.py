@@ -0,0 +1,33 @@
+"""Add record rollup columns to daily_summary
+
+Revision ID: 003_daily_summary_rollup
+Revises: 002_add_record_time
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '003_daily_summary_rollup'
+down_revision: Union[str, None] = '002_add_record_time'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 写侧预聚合：LifeStream 写入时同步更新当日记录数、分类分布、维度评分
+    op.add_column('daily_summary',
+        sa.Column('record_count', sa.Integer(), nullable=True, comment='当日有效记录数'))
+    op.add_column('daily_summary',
+        sa.Column('category_counts', sa.Text(), nullable=True, comment='当日分类分布（含副分类）'))
+    op.add_column('daily_summary',
+        sa.Column('top_dimensions', sa.Text(), nullable=True, comment='当日最近的维度评分'))
+
+
+def downgrade() -> None:
+    op.drop_column('daily_summary', 'top_dimensions')
+    op.drop_column('daily_summary', 'category_counts')
+    op.drop_column('daily_summary', 'record_count')
@@ -0,0 +1,28 @@
+"""Add per-day summary cache to daily_summary
+
+Revision ID: 004_daily_summary_json
+Revises: 003_daily_summary_rollup
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_daily_summary_json'
+down_revision: Union[str, None] = '003_daily_summary_rollup'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 已结束日期的记录汇总，AI 周度分析按天合并复用
+    op.add_column('daily_summary',
+        sa.Column('summary_json', sa.Text(), nullable=True,
+                  comment='当日记录汇总（AI 周度分析复用，记录变更时清空）'))
+
+
+def downgrade() -> None:
+    op.drop_column('daily_summary', 'summary_json')
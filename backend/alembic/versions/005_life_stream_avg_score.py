@@ -0,0 +1,46 @@
+"""Add avg_score to life_stream
+
+Revision ID: 005_life_stream_avg_score
+Revises: 004_daily_summary_json
+Create Date: 2026-10-16
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.life_stream import mean_dimension_score
+
+# revision identifiers, used by Alembic.
+revision: str = '005_life_stream_avg_score'
+down_revision: Union[str, None] = '004_daily_summary_json'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 维度得分平均值，按天/按分类的统计直接在 SQL 中聚合
+    op.add_column('life_stream',
+        sa.Column('avg_score', sa.Float(), nullable=True,
+                  comment='维度得分平均值（写入时计算，供 SQL 聚合）'))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, dimension_scores FROM life_stream WHERE dimension_scores IS NOT NULL"
+    )).fetchall()
+    for row_id, scores_raw in rows:
+        try:
+            avg = mean_dimension_score(json.loads(scores_raw))
+        except (TypeError, ValueError):
+            continue
+        if avg is not None:
+            conn.execute(
+                sa.text("UPDATE life_stream SET avg_score = :avg WHERE id = :id"),
+                {"avg": avg, "id": row_id},
+            )
+
+
+def downgrade() -> None:
+    op.drop_column('life_stream', 'avg_score')
@@ -0,0 +1,25 @@
+"""Add (category, created_at) index to life_stream
+
+Revision ID: 006_life_stream_category_time
+Revises: 005_life_stream_avg_score
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '006_life_stream_category_time'
+down_revision: Union[str, None] = '005_life_stream_avg_score'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 分类统计按 category 等值 + created_at 范围过滤，走索引范围扫描
+    op.create_index('ix_life_stream_category_time', 'life_stream', ['category', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_life_stream_category_time', table_name='life_stream')
@@ -0,0 +1,30 @@
+"""Add (is_deleted, category, created_at) covering index to life_stream
+
+Revision ID: 007_life_stream_active_category
+Revises: 006_life_stream_category_time
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '007_life_stream_active_category'
+down_revision: Union[str, None] = '006_life_stream_category_time'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 概览统计按未删除过滤、按类别分组并按时间条件计数，覆盖索引即可完成，无需回表
+    op.create_index(
+        'ix_life_stream_active_category_time',
+        'life_stream',
+        ['is_deleted', 'category', 'created_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_life_stream_active_category_time', table_name='life_stream')
@@ -0,0 +1,34 @@
+"""Add score rollup columns to daily_summary
+
+Revision ID: 008_daily_summary_scores
+Revises: 007_life_stream_active_category
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models.daily_summary import rebuild_record_rollups
+
+# revision identifiers, used by Alembic.
+revision: str = '008_daily_summary_scores'
+down_revision: Union[str, None] = '007_life_stream_active_category'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 每日平均分的分子分母，按天统计直接读取汇总行而不扫描 life_stream
+    op.add_column('daily_summary',
+        sa.Column('score_sum', sa.Float(), nullable=True, comment='当日记录维度平均分之和'))
+    op.add_column('daily_summary',
+        sa.Column('scored_count', sa.Integer(), nullable=True, comment='当日有维度评分的记录数'))
+
+    rebuild_record_rollups(op.get_bind())
+
+
+def downgrade() -> None:
+    op.drop_column('daily_summary', 'scored_count')
+    op.drop_column('daily_summary', 'score_sum')
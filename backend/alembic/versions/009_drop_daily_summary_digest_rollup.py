@@ -0,0 +1,30 @@
+"""Drop unused digest rollup columns from daily_summary
+
+Revision ID: 009_drop_digest_rollup
+Revises: 008_daily_summary_scores
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009_drop_digest_rollup'
+down_revision: Union[str, None] = '008_daily_summary_scores'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 今日洞察改由合并分析的记录窗口生成，分类分布与维度评分不再写侧预聚合
+    op.drop_column('daily_summary', 'top_dimensions')
+    op.drop_column('daily_summary', 'category_counts')
+
+
+def downgrade() -> None:
+    op.add_column('daily_summary',
+        sa.Column('category_counts', sa.Text(), nullable=True, comment='当日分类分布（含副分类）'))
+    op.add_column('daily_summary',
+        sa.Column('top_dimensions', sa.Text(), nullable=True, comment='当日最近的维度评分'))
@@ -41,6 +41,9 @@ class Settings(BaseSettings):
     simple_text_model: str = "glm-4.7-flash"    # 简单文本任务 (免费)
     embedding_model: str = "embedding-3"        # 嵌入模型
     
+    # 全进程 AI 请求速率上限（次/秒），0 表示不限制；低于服务商 RPM 限制可避免 429 重试
+    ai_requests_per_second: float = 0.0
+    
     def get_ai_api_key(self) -> str:
         """获取当前 AI 提供商的 API Key"""
         if self.ai_provider == "zhipu":
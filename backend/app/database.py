@@ -32,6 +32,7 @@ else:
 engine = create_engine(
     database_url,
     echo=False,  # 关闭 SQL 日志输出（生产安全，debug 用 logging 级别控制）
+    query_cache_size=1200,  # 编译后 SQL 缓存条目数（默认 500），各服务的统计查询都能常驻
     connect_args=connect_args,
     **engine_kwargs,
 )
@@ -88,9 +88,61 @@ def run_migrations():
                     pass
             if migrated > 0:
                 logger.info(f"数据迁移: 从 meta_data 提取 sub_categories，共迁移 {migrated} 条记录")
-        
+
+        # 添加 avg_score 列（v0.6 维度平均分写入时计算，供 SQL 聚合）
+        if "avg_score" not in columns:
+            cursor.execute("ALTER TABLE life_stream ADD COLUMN avg_score FLOAT")
+            logger.info("自动迁移: 添加 avg_score 列")
+            
+            from app.models.life_stream import mean_dimension_score
+            import json as _json
+            cursor.execute("SELECT id, dimension_scores FROM life_stream WHERE dimension_scores IS NOT NULL")
+            backfill = []
+            for row_id, scores_raw in cursor.fetchall():
+                try:
+                    avg = mean_dimension_score(_json.loads(scores_raw))
+                except Exception:
+                    continue
+                if avg is not None:
+                    backfill.append((avg, row_id))
+            cursor.executemany("UPDATE life_stream SET avg_score = ? WHERE id = ?", backfill)
+            if backfill:
+                logger.info(f"数据迁移: 回填 avg_score，共 {len(backfill)} 条记录")
+
+        # 按类别 + 时间范围查询的复合索引（v0.6）
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_life_stream_category_time ON life_stream (category, created_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_life_stream_active_category_time "
+            "ON life_stream (is_deleted, category, created_at)"
+        )
+
+        # daily_summary 记录汇总列（v0.6 写侧预聚合）
+        cursor.execute("PRAGMA table_info(daily_summary)")
+        summary_columns = [col[1] for col in cursor.fetchall()]
+        rebuild_rollups = False
+        if summary_columns:
+            for col_name, col_type in (
+                ("record_count", "INTEGER"),
+                ("summary_json", "TEXT"),
+                ("score_sum", "FLOAT"),
+                ("scored_count", "INTEGER"),
+            ):
+                if col_name not in summary_columns:
+                    cursor.execute(f"ALTER TABLE daily_summary ADD COLUMN {col_name} {col_type}")
+                    logger.info(f"自动迁移: 添加 daily_summary.{col_name} 列")
+                    rebuild_rollups = True
+
         conn.commit()
         conn.close()
+
+        # 新增汇总列后按天重算历史汇总（按天统计直接读取 daily_summary）
+        if rebuild_rollups:
+            from app.models.daily_summary import rebuild_record_rollups
+            with engine.begin() as connection:
+                days = rebuild_record_rollups(connection)
+            logger.info(f"数据迁移: 重算每日记录汇总，共 {days} 天")
     except Exception as e:
         logger.error(f"自动迁移失败: {e}")
 
@@ -128,8 +180,20 @@ async def lifespan(app: FastAPI):
     loop.run_in_executor(None, auto_index_rag)
     logger.info("RAG 索引检查已在后台启动")
 
+    # 后台预热 AI 连接池（不阻塞启动）
+    from app.services.ai_client import get_ai_client
+    warmup_task = asyncio.create_task(get_ai_client().warmup())
+
     yield
-    # 关闭时的清理工作（如需要）
+
+    if not warmup_task.done():
+        warmup_task.cancel()
+
+    # 写入尚未落库的 Token 用量，关闭共享的 AI HTTP 连接池
+    from app.services.token_tracker import flush_usage
+    from app.services.ai_client import close_shared_http_client
+    await flush_usage()
+    await close_shared_http_client()
 
 app = FastAPI(
     title="Vibing u API",
@@ -1,6 +1,11 @@
-from sqlalchemy import Column, Date, Float, Integer, Text, DateTime
-from datetime import datetime
+from sqlalchemy import Column, Date, Float, Integer, Text, DateTime, event, inspect, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, date, time, timedelta
 from app.database import Base
+from app.models.life_stream import LifeStream, JSONType
+
+# 汇总行写入使用 INSERT ... ON CONFLICT，并发写入同一天的首条记录时不会主键冲突
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
 
 
 class DailySummary(Base):
@@ -17,8 +22,79 @@ class DailySummary(Base):
     energy_level = Column(Integer, nullable=True, comment="主观能量值(1-10)")
     daily_summary_text = Column(Text, nullable=True, comment="AI生成的当天日记摘要")
     
+    # 记录汇总（LifeStream 写入时同步更新，读侧无需扫描当天全部记录）
+    record_count = Column(Integer, nullable=True, comment="当日有效记录数")
+    score_sum = Column(Float, nullable=True, comment="当日记录维度平均分之和")
+    scored_count = Column(Integer, nullable=True, comment="当日有维度评分的记录数")
+    summary_json = Column(JSONType, nullable=True, comment="当日记录汇总（AI 周度分析复用，记录变更时清空）")
+    
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     def __repr__(self):
         return f"<DailySummary(date={self.date}, vibe_score={self.vibe_score})>"
+
+
+def refresh_record_rollup(connection, day: date) -> None:
+    """重算指定日期的记录汇总并写入 daily_summary（按天重算，兼容更新与软删除）"""
+    ls = LifeStream.__table__
+    start = datetime.combine(day, time.min)
+    record_count, score_sum, scored_count = connection.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(ls.c.avg_score), 0.0),
+            func.count(ls.c.avg_score),
+        )
+        .where(
+            ls.c.created_at >= start,
+            ls.c.created_at < start + timedelta(days=1),
+            ls.c.is_deleted == False,
+        )
+    ).one()
+    
+    now = datetime.now()
+    values = {
+        "record_count": record_count,
+        "score_sum": score_sum,
+        "scored_count": scored_count,
+        # 当天记录已变化，AI 分析用的汇总需要重新生成
+        "summary_json": None,
+        "updated_at": now,
+    }
+    table = DailySummary.__table__
+    insert = _UPSERT_INSERTS[connection.dialect.name](table)
+    connection.execute(
+        insert.values(date=day, created_at=now, **values)
+        .on_conflict_do_update(index_elements=[table.c.date], set_=values)
+    )
+
+
+def rebuild_record_rollups(connection) -> int:
+    """为所有有记录的日期重算汇总（新增汇总列后回填历史数据），返回重算的天数"""
+    ls = LifeStream.__table__
+    days = {
+        created_at.date()
+        for (created_at,) in connection.execute(
+            select(ls.c.created_at).distinct().where(ls.c.created_at.isnot(None))
+        )
+    }
+    for day in sorted(days):
+        refresh_record_rollup(connection, day)
+    return len(days)
+
+
+@event.listens_for(LifeStream, "after_insert")
+@event.listens_for(LifeStream, "after_update")
+@event.listens_for(LifeStream, "after_delete")
+def _sync_record_rollup(mapper, connection, target):
+    """LifeStream 写入后在同一事务内刷新当天汇总；created_at 改到其他日期时原日期一并刷新"""
+    days = {previous.date() for previous in inspect(target).attrs.created_at.history.deleted if previous}
+    if target.created_at:
+        days.add(target.created_at.date())
+    for day in sorted(days):
+        refresh_record_rollup(connection, day)
+
+
+@event.listens_for(LifeStream.created_at, "set", active_history=True)
+def _track_created_at(target, value, oldvalue, initiator):
+    """修改 created_at 时先加载旧值，_sync_record_rollup 才能从属性历史中取到原日期"""
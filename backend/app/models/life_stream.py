@@ -2,7 +2,9 @@ import uuid
 import enum
 import json
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, Enum, TypeDecorator, Boolean, Index
+from typing import Optional
+import orjson
+from sqlalchemy import Column, String, Text, DateTime, Enum, TypeDecorator, Boolean, Index, Float, event
 from app.database import Base
 
 
@@ -51,7 +53,11 @@ class JSONType(TypeDecorator):
     
     def process_result_value(self, value, dialect):
         if value is not None:
-            return json.loads(value)
+            # 每行读取都要解码，优先 orjson；NaN 等 orjson 不接受的旧数据交给标准库
+            try:
+                return orjson.loads(value)
+            except orjson.JSONDecodeError:
+                return json.loads(value)
         return None
 
 
@@ -67,6 +73,10 @@ class LifeStream(Base):
         Index("ix_life_stream_record_time", "record_time"),
         # 复合索引：常见查询模式（未删除 + 按时间排序）
         Index("ix_life_stream_active_time", "is_deleted", "created_at"),
+        # 复合索引：按类别 + 时间范围查询（睡眠/心情/运动等分类统计）
+        Index("ix_life_stream_category_time", "category", "created_at"),
+        # 覆盖索引：概览按类别分组统计总数与近 7 天数，只读索引不回表
+        Index("ix_life_stream_active_category_time", "is_deleted", "category", "created_at"),
     )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()), comment="唯一标识")
@@ -93,6 +103,7 @@ class LifeStream(Base):
     
     # 八维度得分 (0-100)
     dimension_scores = Column(JSONType, nullable=True, comment="维度得分")
+    avg_score = Column(Float, nullable=True, comment="维度得分平均值（写入时计算，供 SQL 聚合）")
     
     # 可见性与删除状态
     is_public = Column(Boolean, default=False, comment="是否公开可见")
@@ -101,3 +112,18 @@ class LifeStream(Base):
     
     def __repr__(self):
         return f"<LifeStream(id={self.id}, category={self.category}, created_at={self.created_at})>"
+
+
+def mean_dimension_score(scores) -> Optional[float]:
+    """维度得分的平均值；没有数值得分时返回 None"""
+    if not isinstance(scores, dict):
+        return None
+    values = [v for v in scores.values() if isinstance(v, (int, float))]
+    return sum(values) / len(values) if values else None
+
+
+@event.listens_for(LifeStream, "before_insert")
+@event.listens_for(LifeStream, "before_update")
+def _sync_avg_score(mapper, connection, target):
+    """写入前根据 dimension_scores 计算 avg_score"""
+    target.avg_score = mean_dimension_score(target.dimension_scores)
@@ -6,7 +6,7 @@ from fastapi import APIRouter, Query
 from typing import Optional
 from pydantic import BaseModel
 
-from app.services.ai_analyzer import get_ai_analyzer
+from app.services.ai_analyzer import get_ai_analyzer, COMBINED_DAYS
 
 router = APIRouter(prefix="/api/ai", tags=["ai-analysis"])
 
@@ -29,7 +29,7 @@ async def get_weekly_analysis():
 
 @router.get("/trends")
 async def get_trend_analysis(
-    days: int = Query(30, ge=7, le=90, description="分析天数")
+    days: int = Query(COMBINED_DAYS, ge=7, le=90, description="分析天数")
 ):
     """
     获取 AI 趋势分析
@@ -37,6 +37,9 @@ async def get_trend_analysis(
     分析指定天数内的数据趋势和模式
     """
     analyzer = get_ai_analyzer()
+    if days == COMBINED_DAYS:
+        # 默认周期与仪表盘合并分析一致，直接复用合并结果
+        return (await analyzer.combined_insights())["trends"]
     return await analyzer.analyze_trends(days)
 
 
@@ -48,7 +51,7 @@ async def get_daily_digest():
     合并了健康提醒、异常检测、智能建议为一次 LLM 调用
     """
     analyzer = get_ai_analyzer()
-    return await analyzer.generate_daily_digest()
+    return (await analyzer.combined_insights())["digest"]
 
 
 @router.get("/suggestions")
@@ -56,10 +59,21 @@ async def get_smart_suggestions():
     """
     获取 AI 智能建议
     
-    基于历史数据生成个性化建议
+    基于最近 14 天的数据生成个性化建议（与仪表盘合并分析共用一次 LLM 调用）
     """
     analyzer = get_ai_analyzer()
-    return await analyzer.generate_smart_suggestions()
+    return (await analyzer.combined_insights())["suggestions"]
+
+
+@router.get("/dashboard-insights")
+async def get_dashboard_insights():
+    """
+    获取仪表盘合并分析
+
+    一次 LLM 调用同时返回 digest、trends、suggestions，结果缓存 5 分钟
+    """
+    analyzer = get_ai_analyzer()
+    return await analyzer.combined_insights()
 
 
 @router.post("/insight")
@@ -3,17 +3,19 @@
 import json
 import logging
 from datetime import datetime
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.database import get_db
 from app.models.chat import ChatConversation, ChatMessage
-from app.services.chat_assistant import get_chat_assistant
+from app.services.chat_assistant import get_chat_assistant, HISTORY_TURNS, HISTORY_MAX_CHARS
 
 logger = logging.getLogger(__name__)
 
@@ -277,11 +279,13 @@ async def stream_message(request: StreamChatRequest, db: Session = Depends(get_d
         raise HTTPException(status_code=500, detail="保存消息失败，请稍后重试")
 
     # 3) 从 DB 读取历史消息作为 context
+    # 只取助手会用到的最近几条（外加刚保存的 user message），内容在数据库端截断
     try:
         history_msgs = (
-            db.query(ChatMessage)
+            db.query(ChatMessage.role, func.substr(ChatMessage.content, 1, HISTORY_MAX_CHARS + 1))
             .filter(ChatMessage.conversation_id == conversation_id)
-            .order_by(ChatMessage.created_at.asc())
+            .order_by(ChatMessage.created_at.desc())
+            .limit(HISTORY_TURNS + 1)
             .all()
         )
     except SQLAlchemyError as e:
@@ -290,10 +294,8 @@ async def stream_message(request: StreamChatRequest, db: Session = Depends(get_d
         raise HTTPException(status_code=500, detail="读取历史消息失败，请稍后重试")
 
     # 转换为 history 格式（不包含刚才添加的 user message 中最后一条，因为 chat_stream 会自己加）
-    # 排除最后一条(就是刚保存的 user message)
-    history = []
-    for m in history_msgs[:-1]:
-        history.append({"role": m.role, "content": m.content})
+    # 排除最新一条(就是刚保存的 user message)，其余按时间正序
+    history = [{"role": role, "content": content} for role, content in reversed(history_msgs[1:])]
 
     # 4) 如果是首条消息，更新会话标题
     is_first_message = len(history_msgs) == 1
@@ -334,13 +336,13 @@ async def stream_message(request: StreamChatRequest, db: Session = Depends(get_d
                     yield f"data: {meta}\n\n"
                     new_conv_sent = True
 
-                # 解析 chunk 中的 content 来累积
-                if chunk.startswith("data: "):
+                # 解析 chunk 中的 content 来累积（chat_stream 产出 UTF-8 bytes 帧）
+                if chunk.startswith(b"data: "):
                     try:
-                        data = json.loads(chunk[6:].strip())
+                        data = orjson.loads(chunk[6:])
                         if data.get("content") and not data.get("done"):
                             accumulated += data["content"]
-                    except (json.JSONDecodeError, KeyError):
+                    except (orjson.JSONDecodeError, KeyError):
                         pass
 
                 yield chunk
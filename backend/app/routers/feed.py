@@ -10,8 +10,8 @@ from typing import Optional, List, AsyncGenerator
 from pydantic import BaseModel
 import base64
 import os
-import json
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -347,10 +347,9 @@ async def create_feed(
 
 # ========== SSE 流式进度端点 ==========
 
-def _sse_event(event_type: str, data: dict) -> str:
-    """格式化 SSE 事件"""
-    payload = json.dumps({**data, "type": event_type}, ensure_ascii=False)
-    return f"data: {payload}\n\n"
+def _sse_event(event_type: str, data: dict) -> bytes:
+    """格式化 SSE 事件（orjson 直接输出 UTF-8 字节，reply 增量每个片段都要编码一次）"""
+    return b"data: " + orjson.dumps({**data, "type": event_type}) + b"\n\n"
 
 
 @router.post("/stream")
@@ -366,6 +365,7 @@ async def create_feed_stream(
     
     事件类型:
     - phase: 阶段进度 {"phase": "xxx", "status": "start"|"done"|"error"}
+    - reply: AI 回复的增量文本 {"text": 当前已生成的 reply_text}
     - result: 最终结果 (等同于 FeedResponse)
     - error: 致命错误
     """
@@ -385,7 +385,7 @@ async def create_feed_stream(
                 yield _sse_event("error", {"message": f"图片大小超过限制（最大 10MB）"})
             return StreamingResponse(size_error(), media_type="text/event-stream")
 
-    async def event_generator() -> AsyncGenerator[str, None]:
+    async def event_generator() -> AsyncGenerator[bytes, None]:
         nonlocal db
         
         input_type = InputType.TEXT.value
@@ -426,25 +426,31 @@ async def create_feed_stream(
         yield _sse_event("phase", {"phase": "extract", "status": "start", "label": "AI 分析与提取"})
         nickname = get_nickname(db)
         extract_result = {}
+        if image_base64:
+            extract_kwargs = dict(
+                image_type=image_type or "other",
+                image_base64=image_base64,
+                text=text,
+                content_hint=classification_result.get("content_hint") if classification_result else None,
+                client_time=client_time,
+                nickname=nickname,
+                category_suggestion=classification_result.get("category_suggestion") if classification_result else None,
+            )
+        else:
+            extract_kwargs = dict(
+                image_type="other",
+                text=text,
+                client_time=client_time,
+                nickname=nickname,
+            )
         for attempt in range(2):
             try:
-                if image_base64:
-                    extract_result = await data_extractor.extract(
-                        image_type=image_type or "other",
-                        image_base64=image_base64,
-                        text=text,
-                        content_hint=classification_result.get("content_hint") if classification_result else None,
-                        client_time=client_time,
-                        nickname=nickname,
-                        category_suggestion=classification_result.get("category_suggestion") if classification_result else None,
-                    )
-                else:
-                    extract_result = await data_extractor.extract(
-                        image_type="other",
-                        text=text,
-                        client_time=client_time,
-                        nickname=nickname,
-                    )
+                # reply_text 边生成边推送，其余字段在提取完成后使用
+                async for event in data_extractor.extract_stream(**extract_kwargs):
+                    if "partial" in event:
+                        yield _sse_event("reply", {"text": event["partial"]})
+                    else:
+                        extract_result = event["result"]
                 break
             except Exception as e:
                 if attempt == 0:
@@ -1101,7 +1107,7 @@ async def chat_with_record(
         ai_client = get_ai_client()
         response = await ai_client.chat_completion(
             messages=messages,
-            model=ai_client.models["text"],
+            model=ai_client.models.text,
             task_type="record_chat",
             task_description=f"与记录 {record_id} 对话",
             record_id=record_id,
@@ -6,6 +6,7 @@ from sqlalchemy import func
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from collections import defaultdict
+from operator import itemgetter
 
 from app.database import get_db
 from app.models import LifeStream
@@ -40,7 +41,7 @@ async def get_tag_cloud(
                 tag_counts[tag] += 1
     
     # 排序并限制数量
-    sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+    sorted_tags = sorted(tag_counts.items(), key=itemgetter(1), reverse=True)[:limit]
     
     # 计算权重 (用于可视化)
     max_count = sorted_tags[0][1] if sorted_tags else 1
@@ -94,7 +95,7 @@ async def get_tag_hierarchy(
     # 转换为列表格式
     result = []
     for category, sub_tags in sorted(hierarchy.items(), key=lambda x: sum(x[1].values()), reverse=True):
-        sorted_subs = sorted(sub_tags.items(), key=lambda x: x[1], reverse=True)
+        sorted_subs = sorted(sub_tags.items(), key=itemgetter(1), reverse=True)
         result.append({
             "category": category,
             "count": sum(sub_tags.values()),
@@ -238,7 +239,7 @@ async def get_related_tags(
                     cooccurrence[other_tag] += 1
     
     # 排序
-    sorted_related = sorted(cooccurrence.items(), key=lambda x: x[1], reverse=True)[:limit]
+    sorted_related = sorted(cooccurrence.items(), key=itemgetter(1), reverse=True)[:limit]
     
     return {
         "source_tag": tag,
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 
@@ -10,6 +10,19 @@ class FeedRequest(BaseModel):
     category_hint: Optional[str] = None
 
 
+class ParseResult(BaseModel):
+    """AI 解析结果（模型返回的 JSON 直接按此校验）"""
+    category: Literal["SLEEP", "DIET", "SCREEN", "ACTIVITY", "MOOD", "GROWTH", "SOCIAL", "LEISURE"]
+    meta_data: Dict[str, Any] = {}
+    reply_text: str
+    tags: List[str] = []
+
+
+class ParseBatchResult(BaseModel):
+    """合并解析多条输入时的结果（按输入顺序）"""
+    results: List[ParseResult]
+
+
 class FeedResponse(BaseModel):
     """投喂响应"""
     id: str
@@ -2,22 +2,228 @@
 AI 分析器 - 基于历史数据生成深度洞察
 """
 
+import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, date, timedelta
+from sqlalchemy import and_, or_, func, case, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from collections import defaultdict
+from collections import Counter
+from dataclasses import dataclass, field
 
 from app.config import get_settings
 from app.database import SessionLocal
-from app.models import LifeStream
+from app.models import LifeStream, DailySummary
 from app.services.json_utils import safe_extract_json
 from app.services.ai_client import get_ai_client, AIClientError
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 今日洞察 prompt 只保留最近几条维度评分
+DIGEST_TOP_DIMENSIONS = 5
+
+# _summarize_records 中会读取 meta_data 的分类
+_META_CATEGORIES = frozenset({"MOOD", "SLEEP", "SCREEN", "ACTIVITY", "DIET"})
+
+# 汇总阶段只查询这些列，返回 Row 而非 ORM 实例：
+# ai_insight 在数据库端截断；meta_data 体积大，仅需要明细的分类（或带副分类的记录）才返回
+_SUMMARY_COLUMNS = (
+    LifeStream.id,
+    LifeStream.category,
+    LifeStream.sub_categories,
+    LifeStream.created_at,
+    LifeStream.tags,
+    LifeStream.dimension_scores,
+    LifeStream.is_deleted,
+    func.substr(LifeStream.ai_insight, 1, 200).label("ai_insight"),
+    case(
+        (
+            or_(
+                LifeStream.category.in_(sorted(_META_CATEGORIES)),
+                LifeStream.sub_categories.isnot(None),
+            ),
+            LifeStream.meta_data,
+        ),
+        else_=None,
+    ).label("meta_data"),
+)
+
+
+# ===== Prompt 前缀 =====
+# 静态说明（角色、输出格式、要求）放在最前面并保持逐字节不变，
+# 每次调用只在末尾拼接数据部分，便于服务端复用提示词前缀缓存。
+
+_DAILY_DIGEST_PREFIX = """你是 Vibing u 的私人生活分析师。请基于用户今日和本周的数据，生成一份简洁的综合洞察报告。
+
+请以 JSON 格式输出：
+{
+    "status_summary": "一句话概括今日整体状态（15-30字，要有温度）",
+    "status_emoji": "一个代表今日状态的 emoji",
+    "findings": [
+        {
+            "type": "positive/warning/neutral",
+            "icon": "emoji",
+            "title": "发现标题（5-10字）",
+            "detail": "具体说明（20-40字），基于数据"
+        }
+    ],
+    "suggestions": [
+        {
+            "icon": "emoji",
+            "action": "具体建议（10-20字）",
+            "reason": "原因（10-15字）"
+        }
+    ],
+    "encouragement": "一句温暖的鼓励（15-25字）"
+}
+
+要求：
+1. findings 2-4 条，正面/警告/中性混合，必须基于实际数据
+2. suggestions 2-3 条，具体可行
+3. 语气温暖但不空洞，像朋友一样
+4. 如果今日数据少，可以结合本周数据分析
+
+"""
+
+_WEEKLY_PREFIX = """你是 Vibing u 的数据分析师，擅长从生活记录中发现有价值的洞察。
+
+请根据下方用户过去一周的生活数据汇总，生成一份温暖、有洞察力的周度分析报告，以 JSON 格式输出：
+{
+    "summary": "一句话总结本周状态（20-40字）",
+    "highlights": ["亮点1", "亮点2", "亮点3"],
+    "concerns": ["需要关注的问题1", "问题2"],
+    "insights": [
+        {"title": "洞察标题", "content": "具体洞察内容（30-50字）", "emoji": "相关emoji"},
+        {"title": "洞察标题", "content": "具体洞察内容", "emoji": "emoji"}
+    ],
+    "suggestions": [
+        {"action": "具体建议", "reason": "原因", "priority": "high/medium/low"}
+    ],
+    "mood_trend": "up/down/stable",
+    "overall_score": 75
+}
+
+注意：
+1. 分析要有温度，像朋友一样关心用户
+2. 洞察要具体，基于数据而非泛泛而谈
+3. 建议要可行，能立即执行
+
+"""
+
+_TRENDS_PREFIX = """分析用户的生活数据趋势。
+
+请以 JSON 格式输出趋势分析：
+{
+    "overall_trend": "improving/declining/stable",
+    "trend_description": "整体趋势描述（30-50字）",
+    "patterns": [
+        {"name": "模式名称", "description": "描述", "impact": "positive/negative/neutral"}
+    ],
+    "correlations": [
+        {"factor1": "因素1", "factor2": "因素2", "relationship": "关系描述"}
+    ],
+    "predictions": [
+        {"area": "领域", "prediction": "预测内容", "confidence": "high/medium/low"}
+    ],
+    "action_items": ["建议1", "建议2"]
+}
+
+"""
+
+_SUGGESTIONS_PREFIX = """基于用户的生活数据，生成个性化的智能建议。
+
+请生成 3-5 条具体、可执行的建议，JSON 格式：
+{
+    "focus_area": "当前最需要关注的领域",
+    "focus_reason": "原因（20字内）",
+    "suggestions": [
+        {
+            "title": "建议标题",
+            "description": "具体描述和行动步骤（30-50字）",
+            "category": "sleep/activity/screen/mood/diet/social",
+            "difficulty": "easy/medium/hard",
+            "impact": "high/medium/low",
+            "emoji": "相关emoji"
+        }
+    ],
+    "encouragement": "一句鼓励的话"
+}
+
+"""
+
+_DEEP_INSIGHT_PREFIX = """你是用户的私人生活数据分析师。用户问了一个问题，请基于他的历史数据回答。
+
+请以 JSON 格式回答：
+{
+    "answer": "详细回答（100-200字）",
+    "confidence": "high/medium/low",
+    "data_points": ["支持结论的数据点1", "数据点2"],
+    "follow_up_questions": ["可能的追问1", "追问2"]
+}
+
+"""
+
+# 仪表盘合并分析：三段说明按原样拼接，一次调用同时产出 digest / trends / suggestions
+_COMBINED_PREFIX = """你是 Vibing u 的私人生活分析师。请基于下方数据一次性完成三项分析，以 JSON 格式输出：
+{
+    "digest": {今日洞察，格式见【digest】},
+    "trends": {趋势分析，格式见【trends】},
+    "suggestions": {智能建议，格式见【suggestions】}
+}
+
+【digest】
+""" + _DAILY_DIGEST_PREFIX + "【trends】\n" + _TRENDS_PREFIX + "【suggestions】\n" + _SUGGESTIONS_PREFIX
+
+# 合并分析的统计窗口与缓存有效期（趋势看 30 天，建议只看最近 14 天）
+COMBINED_DAYS = 30
+SUGGESTIONS_DAYS = 14
+_COMBINED_CACHE_TTL = 300
+
+
+@dataclass(slots=True)
+class _Summary:
+    """汇总过程中的可变状态，仅在输出时转换为 dict"""
+    total_records: int = 0
+    start: Optional[str] = None
+    end: Optional[str] = None
+    categories: Counter = field(default_factory=Counter)
+    daily_counts: Counter = field(default_factory=Counter)  # 日序号 -> 记录数
+    hourly: List[int] = field(default_factory=lambda: [0] * 24)
+    moods: List[Any] = field(default_factory=list)
+    sleep_data: List[Dict[str, Any]] = field(default_factory=list)
+    screen_data: List[Dict[str, Any]] = field(default_factory=list)
+    activity_data: List[Dict[str, Any]] = field(default_factory=list)
+    diet_data: List[Dict[str, Any]] = field(default_factory=list)
+    ai_insights: List[Dict[str, Any]] = field(default_factory=list)
+    tags: Counter = field(default_factory=Counter)
+
+    def to_dict(self, top_tags: Optional[int] = 20) -> Dict[str, Any]:
+        """转换为 prompt / JSON 使用的 dict（浅转换，列表直接复用）"""
+        return {
+            "total_records": self.total_records,
+            "date_range": {"start": self.start, "end": self.end},
+            "categories": dict(self.categories),
+            "daily_counts": {
+                date.fromordinal(day).isoformat(): count
+                for day, count in self.daily_counts.items()
+            },
+            "hourly_distribution": {
+                hour: count for hour, count in enumerate(self.hourly) if count
+            },
+            "moods": self.moods,
+            "sleep_data": self.sleep_data,
+            "screen_data": self.screen_data,
+            "activity_data": self.activity_data,
+            "diet_data": self.diet_data,
+            "ai_insights": self.ai_insights,
+            "tags": dict(self.tags.most_common(top_tags)),
+        }
+
 
 class AIAnalyzer:
     """AI 驱动的数据分析器"""
@@ -30,50 +236,170 @@ class AIAnalyzer:
         except Exception:
             self.ai_client = None
             self.has_ai = False
+        # 合并分析缓存: (数据指纹, 过期时间, 结果)
+        self._combined_cache: Optional[Tuple[tuple, float, Dict[str, Any]]] = None
+        self._combined_lock = asyncio.Lock()
     
+    def _ai_available(self) -> bool:
+        """AI 可用且不在故障冷却期；不可用时直接走 fallback，省去构建 prompt"""
+        return self.has_ai and self.ai_client.is_healthy()
+
     def _get_db(self) -> Session:
         return SessionLocal()
+
+    def _load_records(self, db: Session, *criteria, order_by, limit: Optional[int] = None) -> List[Row]:
+        """按条件加载汇总所需的列（Row 列表，字段名与 LifeStream 属性一致）"""
+        stmt = select(*_SUMMARY_COLUMNS).where(*criteria).order_by(order_by)
+        if limit:
+            stmt = stmt.limit(limit)
+        return db.execute(stmt).all()
     
+    def _load_daily_summaries(self, db: Session, start_day: date) -> List[Dict[str, Any]]:
+        """
+        获取 start_day 至今每天的汇总（按日期倒序）
+
+        已结束的日期汇总写入 daily_summary.summary_json 复用；
+        记录写入时 summary_json 会被清空，下次访问时重新生成。今天的数据仍在变化，每次现算。
+        """
+        today = date.today()
+        days = [today - timedelta(days=i) for i in range((today - start_day).days + 1)]
+        rows = {
+            row.date: row
+            for row in db.query(DailySummary).filter(DailySummary.date >= start_day)
+        }
+
+        summaries: Dict[date, Dict[str, Any]] = {}
+        missing: List[date] = []
+        for day in days:
+            row = rows.get(day)
+            if day != today:
+                if row is not None and row.summary_json is not None:
+                    summaries[day] = row.summary_json
+                    continue
+                if row is not None and row.record_count == 0:
+                    # 写入时维护的汇总表明当天没有记录，无需扫描
+                    summaries[day] = self._summarize_records([], top_tags=None)
+                    continue
+            missing.append(day)
+
+        if missing:
+            # 只加载缺失的日期，相邻日期合并为一个时间区间
+            ranges: List[List[date]] = []
+            for day in sorted(missing):
+                if ranges and ranges[-1][1] == day:
+                    ranges[-1][1] = day + timedelta(days=1)
+                else:
+                    ranges.append([day, day + timedelta(days=1)])
+            records = self._load_records(
+                db,
+                or_(*(
+                    and_(
+                        LifeStream.created_at >= datetime.combine(start, datetime.min.time()),
+                        LifeStream.created_at < datetime.combine(end, datetime.min.time()),
+                    )
+                    for start, end in ranges
+                )),
+                LifeStream.is_deleted == False,
+                order_by=LifeStream.created_at.desc(),
+            )
+            by_day: Dict[date, List[Row]] = {day: [] for day in missing}
+            for r in records:
+                bucket = by_day.get(r.created_at.date())
+                if bucket is not None:
+                    bucket.append(r)
+
+            for day, day_records in by_day.items():
+                summaries[day] = self._summarize_records(day_records, top_tags=None)
+                # 没有记录的日期不落库，避免读请求为空日期插入汇总行
+                if day != today and day_records:
+                    self._store_summary_json(db, day, summaries[day])
+            db.commit()
+
+        return [summaries[day] for day in days]
+
+    def _store_summary_json(self, db: Session, day: date, summary: Dict[str, Any]) -> None:
+        """
+        写入某天的 summary_json；汇总行不存在时插入，与记录写入时的汇总插入冲突则改为更新
+
+        缓存写入不改动 updated_at：数据指纹以 max(updated_at) 判断记录是否变化
+        """
+        table = DailySummary.__table__
+        update = (
+            table.update()
+            .where(table.c.date == day)
+            .values(summary_json=summary, updated_at=table.c.updated_at)
+        )
+        if db.execute(update).rowcount:
+            return
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(
+                    date=day, summary_json=summary, created_at=datetime.now(), updated_at=None,
+                ))
+        except IntegrityError:
+            # 并发的记录写入已插入该日期的汇总行
+            db.execute(update)
+
+    def _merge_summaries(self, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """合并按日期倒序排列的每日汇总，结构与 _summarize_records 一致"""
+        merged = _Summary()
+        for s in summaries:
+            if not s["total_records"]:
+                continue
+            merged.total_records += s["total_records"]
+            merged.start = s["date_range"]["start"]
+            if merged.end is None:
+                merged.end = s["date_range"]["end"]
+            merged.categories.update(s["categories"])
+            for day, count in s["daily_counts"].items():
+                merged.daily_counts[date.fromisoformat(day).toordinal()] += count
+            # JSON 往返后小时键变为字符串
+            for hour, count in s["hourly_distribution"].items():
+                merged.hourly[int(hour)] += count
+            merged.tags.update(s["tags"])
+            merged.moods.extend(s["moods"])
+            merged.sleep_data.extend(s["sleep_data"])
+            merged.screen_data.extend(s["screen_data"])
+            merged.activity_data.extend(s["activity_data"])
+            merged.diet_data.extend(s["diet_data"])
+            merged.ai_insights.extend(s["ai_insights"])
+        return merged.to_dict()
+
     async def analyze_weekly_data(self) -> Dict[str, Any]:
         """
         分析过去一周的数据，生成 AI 洞察
         """
-        db = self._get_db()
-        try:
-            start_date = datetime.now() - timedelta(days=7)
-            records = db.query(LifeStream).filter(
-                LifeStream.created_at >= start_date
-            ).order_by(LifeStream.created_at.desc()).all()
+        with self._get_db() as db:
+            # 按天复用预先汇总的结果，只有缺失的日期才扫描原始记录
+            start_day = (datetime.now() - timedelta(days=7)).date()
+            summary_data = self._merge_summaries(self._load_daily_summaries(db, start_day))
             
-            if not records:
+            if not summary_data["total_records"]:
                 return {
                     "has_data": False,
                     "summary": "暂无数据，开始记录你的生活吧！",
                     "insights": [],
                     "suggestions": []
                 }
-            
-            # 汇总数据
-            summary_data = self._summarize_records(records)
-            
-            if not self.has_ai:
-                return self._mock_analysis(summary_data)
-            
-            # AI 分析
-            return await self._ai_analyze_weekly(summary_data)
-        finally:
-            db.close()
+
+        # 汇总完成后即归还连接，LLM 调用期间不占用连接池
+        if not self._ai_available():
+            return self._mock_analysis(summary_data)
+        
+        # AI 分析
+        return await self._ai_analyze_weekly(summary_data)
     
     async def analyze_trends(self, days: int = 30) -> Dict[str, Any]:
         """
         分析趋势，找出模式和变化
         """
-        db = self._get_db()
-        try:
+        with self._get_db() as db:
             start_date = datetime.now() - timedelta(days=days)
-            records = db.query(LifeStream).filter(
-                LifeStream.created_at >= start_date
-            ).order_by(LifeStream.created_at).all()
+            records = self._load_records(
+                db,
+                LifeStream.created_at >= start_date,
+                order_by=LifeStream.created_at,
+            )
             
             if len(records) < 7:
                 return {
@@ -83,205 +409,223 @@ class AIAnalyzer:
                 }
             
             summary_data = self._summarize_records(records)
-            
-            if not self.has_ai:
-                return self._mock_trend_analysis(summary_data)
-            
-            return await self._ai_analyze_trends(summary_data, days)
-        finally:
-            db.close()
-    
-    async def generate_smart_suggestions(self) -> Dict[str, Any]:
-        """
-        生成智能建议
-        """
-        db = self._get_db()
-        try:
-            # 获取最近的数据
-            start_date = datetime.now() - timedelta(days=14)
-            records = db.query(LifeStream).filter(
-                LifeStream.created_at >= start_date
-            ).order_by(LifeStream.created_at.desc()).all()
-            
-            if not records:
-                return {
-                    "suggestions": ["开始记录你的生活，AI 将为你提供个性化建议"],
-                    "focus_area": None
-                }
-            
-            summary_data = self._summarize_records(records)
-            
-            if not self.has_ai:
-                return self._mock_suggestions(summary_data)
-            
-            return await self._ai_generate_suggestions(summary_data)
-        finally:
-            db.close()
+
+        if not self._ai_available():
+            return self._mock_trend_analysis(summary_data)
+        
+        return await self._ai_analyze_trends(summary_data, days)
     
-    async def generate_daily_digest(self) -> Dict[str, Any]:
-        """
-        生成今日 AI 综合洞察（合并了健康提醒 + 异常检测 + 建议）
-        """
-        db = self._get_db()
-        try:
-            # 获取今日数据
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_records = db.query(LifeStream).filter(
-                LifeStream.created_at >= today_start,
-                LifeStream.is_deleted == False,
-            ).order_by(LifeStream.created_at.desc()).all()
+    def _collect_dimensions(self, records: List[Row], limit: int = DIGEST_TOP_DIMENSIONS) -> List[Dict[str, Any]]:
+        """收集最近的维度评分（dimension_scores 由 JSONType 解析为 dict，prompt 只用前几条）"""
+        dimensions = []
+        for r in records:
+            if r.dimension_scores:
+                dimensions.append({
+                    "category": r.category,
+                    "scores": r.dimension_scores,
+                    "insight": (r.ai_insight or "")[:80],
+                })
+                if len(dimensions) >= limit:
+                    break
+        return dimensions
 
-            # 获取近 7 天数据做对比
-            week_start = datetime.now() - timedelta(days=7)
-            week_records = db.query(LifeStream).filter(
-                LifeStream.created_at >= week_start,
-                LifeStream.is_deleted == False,
-            ).order_by(LifeStream.created_at.desc()).all()
+    def _mock_daily_digest(self, today: Dict, week: Dict) -> Dict[str, Any]:
+        """无 AI 时的 fallback"""
+        total = today.get("total_records", 0)
+        cats = today.get("categories", {})
+        findings = []
 
-            if not today_records and not week_records:
-                return {
-                    "has_data": False,
-                    "status_summary": "还没有记录，开始记录你的生活吧！",
-                    "findings": [],
-                    "suggestions": [],
-                    "encouragement": "每一次记录都是对自己的关注",
-                }
+        if cats.get("SLEEP"):
+            findings.append({"type": "positive", "icon": "😴", "title": "睡眠已记录", "detail": f"今天记录了 {cats['SLEEP']} 条睡眠数据"})
+        if cats.get("ACTIVITY"):
+            findings.append({"type": "positive", "icon": "🏃", "title": "运动打卡", "detail": f"今天运动了 {cats['ACTIVITY']} 次"})
+        if not cats.get("ACTIVITY") and week.get("categories", {}).get("ACTIVITY", 0) < 2:
+            findings.append({"type": "warning", "icon": "⚡", "title": "运动不足", "detail": "本周运动次数较少，建议增加活动量"})
 
-            today_summary = self._summarize_records(today_records) if today_records else {}
-            week_summary = self._summarize_records(week_records) if week_records else {}
+        return {
+            "has_data": total > 0 or week.get("total_records", 0) > 0,
+            "status_summary": f"今天已记录 {total} 条数据" if total else "今天还没有记录",
+            "status_emoji": "📊" if total else "🌅",
+            "findings": findings or [{"type": "neutral", "icon": "📝", "title": "开始记录", "detail": "记录生活数据，解锁 AI 洞察"}],
+            "suggestions": [{"icon": "💡", "action": "记录今天的生活", "reason": "数据越多分析越准确"}],
+            "encouragement": "每一次记录都是对自己的关注",
+        }
+
+    def _data_fingerprint(self, db: Session) -> tuple:
+        """数据指纹：记录写入会刷新 daily_summary.updated_at，日期变化也会使缓存失效"""
+        count = db.query(func.count(LifeStream.id)).scalar()
+        last_update = db.query(func.max(DailySummary.updated_at)).scalar()
+        return (datetime.now().date(), count, last_update)
 
-            # 收集今日维度分数
-            today_dimensions = []
-            for r in today_records:
-                if r.dimension_scores and isinstance(r.dimension_scores, dict):
-                    today_dimensions.append({
-                        "category": r.category,
-                        "scores": r.dimension_scores,
-                        "insight": (r.ai_insight or "")[:80],
-                    })
+    async def combined_insights(self) -> Dict[str, Any]:
+        """
+        仪表盘合并分析：一次 LLM 调用同时生成今日洞察、趋势分析和智能建议
 
-            if not self.has_ai:
-                return self._mock_daily_digest(today_summary, week_summary)
+        结果按数据指纹缓存 5 分钟，单独的 digest / trends / suggestions 接口共用同一份结果
+        """
+        with self._get_db() as db:
+            fingerprint = self._data_fingerprint(db)
+
+        cached = self._combined_cache
+        if cached and cached[0] == fingerprint and cached[1] > time.monotonic():
+            return cached[2]
+
+        # 仪表盘并发请求多个接口时只触发一次生成
+        async with self._combined_lock:
+            cached = self._combined_cache
+            if cached and cached[0] == fingerprint and cached[1] > time.monotonic():
+                return cached[2]
+            result = await self._build_combined_insights()
+            self._combined_cache = (fingerprint, time.monotonic() + _COMBINED_CACHE_TTL, result)
+            return result
+
+    async def _build_combined_insights(self) -> Dict[str, Any]:
+        """加载一次数据窗口，拆分出各段汇总后合并生成"""
+        with self._get_db() as db:
+            now = datetime.now()
+            records = self._load_records(
+                db,
+                LifeStream.created_at >= now - timedelta(days=COMBINED_DAYS),
+                order_by=LifeStream.created_at.desc(),
+            )
 
-            return await self._ai_daily_digest(today_summary, week_summary, today_dimensions)
-        finally:
-            db.close()
+            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            week_start = now - timedelta(days=7)
+            active = [r for r in records if not r.is_deleted]
+            today_records = [r for r in active if r.created_at >= today_start]
+            week_records = [r for r in active if r.created_at >= week_start]
 
-    async def _ai_daily_digest(
+            today_summary = self._summarize_records(today_records) if today_records else {}
+            week_summary = self._summarize_records(week_records) if week_records else {}
+            today_dimensions = self._collect_dimensions(today_records)
+            # 趋势分析按时间正序汇总
+            period_summary = self._summarize_records(records[::-1]) if records else {}
+            suggestions_start = now - timedelta(days=SUGGESTIONS_DAYS)
+            suggestion_records = [r for r in records if r.created_at >= suggestions_start]
+            suggestions_summary = self._summarize_records(suggestion_records) if suggestion_records else {}
+
+        result = {}
+        if not today_records and not week_records:
+            result["digest"] = {
+                "has_data": False,
+                "status_summary": "还没有记录，开始记录你的生活吧！",
+                "findings": [],
+                "suggestions": [],
+                "encouragement": "每一次记录都是对自己的关注",
+            }
+        if len(records) < 7:
+            result["trends"] = {
+                "has_data": False,
+                "message": "数据不足，至少需要7条记录进行趋势分析",
+                "trends": [],
+            }
+        if not suggestion_records:
+            result["suggestions"] = {
+                "suggestions": ["开始记录你的生活，AI 将为你提供个性化建议"],
+                "focus_area": None,
+            }
+
+        if len(result) < 3 and self._ai_available():
+            content = await self._ai_combined(
+                today_summary, week_summary, today_dimensions, period_summary, suggestions_summary
+            )
+            for key in ("digest", "trends", "suggestions"):
+                section = content.get(key)
+                if key not in result and isinstance(section, dict) and section:
+                    result[key] = section
+                    if key == "digest":
+                        section["has_data"] = True
+                    elif key == "trends":
+                        section["has_data"] = True
+                        section["period_days"] = COMBINED_DAYS
+
+        # 未生成的部分使用规则兜底
+        result.setdefault("digest", self._mock_daily_digest(today_summary, week_summary))
+        result.setdefault("trends", self._mock_trend_analysis(period_summary))
+        result.setdefault("suggestions", self._mock_suggestions(suggestions_summary))
+        return result
+
+    async def _ai_combined(
         self,
         today: Dict,
         week: Dict,
         dimensions: List[Dict],
+        period: Dict,
+        recent: Dict,
     ) -> Dict[str, Any]:
-        """LLM 生成综合每日洞察"""
-        prompt = f"""你是 Vibing u 的私人生活分析师。请基于用户今日和本周的数据，生成一份简洁的综合洞察报告。
-
-【今日数据】
+        """LLM 合并生成，共享同一份数据汇总"""
+        prompt = _COMBINED_PREFIX + f"""【今日数据】
 - 记录数: {today.get('total_records', 0)}
 - 分类: {json.dumps(today.get('categories', {}), ensure_ascii=False)}
 - 心情: {today.get('moods', [])[:5] or '未记录'}
 - 睡眠: {json.dumps(today.get('sleep_data', [])[:2], ensure_ascii=False) or '未记录'}
 - 屏幕: {json.dumps(today.get('screen_data', [])[:2], ensure_ascii=False) or '未记录'}
 - 运动: {json.dumps(today.get('activity_data', [])[:2], ensure_ascii=False) or '未记录'}
-- 维度评分: {json.dumps(dimensions[:5], ensure_ascii=False) if dimensions else '无'}
+- 维度评分: {json.dumps(dimensions, ensure_ascii=False) if dimensions else '无'}
 
 【近7天参照】
 - 总记录: {week.get('total_records', 0)}
 - 分类分布: {json.dumps(week.get('categories', {}), ensure_ascii=False)}
 - 标签: {list(week.get('tags', {}).keys())[:10]}
 
-请以 JSON 格式输出：
-{{
-    "status_summary": "一句话概括今日整体状态（15-30字，要有温度）",
-    "status_emoji": "一个代表今日状态的 emoji",
-    "findings": [
-        {{
-            "type": "positive/warning/neutral",
-            "icon": "emoji",
-            "title": "发现标题（5-10字）",
-            "detail": "具体说明（20-40字），基于数据"
-        }}
-    ],
-    "suggestions": [
-        {{
-            "icon": "emoji",
-            "action": "具体建议（10-20字）",
-            "reason": "原因（10-15字）"
-        }}
-    ],
-    "encouragement": "一句温暖的鼓励（15-25字）"
-}}
-
-要求：
-1. findings 2-4 条，正面/警告/中性混合，必须基于实际数据
-2. suggestions 2-3 条，具体可行
-3. 语气温暖但不空洞，像朋友一样
-4. 如果今日数据少，可以结合本周数据分析"""
+【过去 {COMBINED_DAYS} 天汇总】（trends 基于此部分）
+- 总记录: {period.get('total_records', 0)}
+- 每日记录分布: {json.dumps(period.get('daily_counts', {}), ensure_ascii=False)}
+- 分类分布: {json.dumps(period.get('categories', {}), ensure_ascii=False)}
+- 时段分布: {json.dumps(period.get('hourly_distribution', {}), ensure_ascii=False)}
+- 心情: {period.get('moods', [])[:5] or '无'}
+- 睡眠: {len(period.get('sleep_data', []))} 条
+- 运动: {len(period.get('activity_data', []))} 条
+- 屏幕: {len(period.get('screen_data', []))} 条
+- 标签: {list(period.get('tags', {}).keys())[:10]}
+
+【过去 {SUGGESTIONS_DAYS} 天汇总】（suggestions 基于此部分）
+- 分类: {json.dumps(recent.get('categories', {}), ensure_ascii=False)}
+- 心情: {recent.get('moods', [])[:5] or '无'}
+- 睡眠: {len(recent.get('sleep_data', []))} 条记录
+- 运动: {len(recent.get('activity_data', []))} 条记录
+- 屏幕: {len(recent.get('screen_data', []))} 条记录
+- 标签: {list(recent.get('tags', {}).keys())[:10]}"""
 
         try:
             result = await self.ai_client.chat_completion(
                 messages=[
                     {"role": "system", "content": prompt},
-                    {"role": "user", "content": "生成今日洞察报告，只输出JSON。"}
+                    {"role": "user", "content": "生成 digest、trends、suggestions 三项分析，只输出JSON。"}
                 ],
-                model=self.ai_client.models["text"],
-                max_tokens=6000,
-                task_type="daily_digest",
-                task_description="今日 AI 洞察",
+                model=self.ai_client.models.text,
+                max_tokens=8000,
+                task_type="combined_insights",
+                task_description="仪表盘合并分析",
                 json_response=True,
             )
 
             content = result["content"]
-            if not content:
-                return self._mock_daily_digest(today, week)
-
             if isinstance(content, dict):
-                content["has_data"] = True
                 return content
-
-            parsed = safe_extract_json(content, "daily_digest")
-            if parsed and isinstance(parsed, dict):
-                parsed["has_data"] = True
-                return parsed
-            return self._mock_daily_digest(today, week)
+            if content:
+                parsed = safe_extract_json(content, "combined_insights")
+                if parsed and isinstance(parsed, dict):
+                    return parsed
+            return {}
 
         except Exception as e:
-            logger.error(f"Daily digest 生成错误: {e}")
-            return self._mock_daily_digest(today, week)
-
-    def _mock_daily_digest(self, today: Dict, week: Dict) -> Dict[str, Any]:
-        """无 AI 时的 fallback"""
-        total = today.get("total_records", 0)
-        cats = today.get("categories", {})
-        findings = []
-
-        if cats.get("SLEEP"):
-            findings.append({"type": "positive", "icon": "😴", "title": "睡眠已记录", "detail": f"今天记录了 {cats['SLEEP']} 条睡眠数据"})
-        if cats.get("ACTIVITY"):
-            findings.append({"type": "positive", "icon": "🏃", "title": "运动打卡", "detail": f"今天运动了 {cats['ACTIVITY']} 次"})
-        if not cats.get("ACTIVITY") and week.get("categories", {}).get("ACTIVITY", 0) < 2:
-            findings.append({"type": "warning", "icon": "⚡", "title": "运动不足", "detail": "本周运动次数较少，建议增加活动量"})
-
-        return {
-            "has_data": total > 0 or week.get("total_records", 0) > 0,
-            "status_summary": f"今天已记录 {total} 条数据" if total else "今天还没有记录",
-            "status_emoji": "📊" if total else "🌅",
-            "findings": findings or [{"type": "neutral", "icon": "📝", "title": "开始记录", "detail": "记录生活数据，解锁 AI 洞察"}],
-            "suggestions": [{"icon": "💡", "action": "记录今天的生活", "reason": "数据越多分析越准确"}],
-            "encouragement": "每一次记录都是对自己的关注",
-        }
+            logger.error(f"合并分析生成错误: {e}")
+            return {}
 
     async def deep_insight(self, question: str) -> Dict[str, Any]:
         """
         基于用户问题进行深度洞察
         """
-        db = self._get_db()
-        try:
+        with self._get_db() as db:
             # 获取相关数据
             start_date = datetime.now() - timedelta(days=30)
-            records = db.query(LifeStream).filter(
-                LifeStream.created_at >= start_date
-            ).order_by(LifeStream.created_at.desc()).limit(100).all()
+            records = self._load_records(
+                db,
+                LifeStream.created_at >= start_date,
+                order_by=LifeStream.created_at.desc(),
+                limit=100,
+            )
             
             if not records:
                 return {
@@ -290,59 +634,47 @@ class AIAnalyzer:
                 }
             
             summary_data = self._summarize_records(records)
-            
-            if not self.has_ai:
-                return {"answer": "AI 服务未配置，无法回答问题", "confidence": "low"}
-            
-            return await self._ai_deep_insight(question, summary_data)
-        finally:
-            db.close()
+
+        if not self._ai_available():
+            return {"answer": "AI 服务未配置，无法回答问题", "confidence": "low"}
+        
+        return await self._ai_deep_insight(question, summary_data)
     
-    def _summarize_records(self, records: List[LifeStream]) -> Dict[str, Any]:
-        """汇总记录数据"""
-        summary = {
-            "total_records": len(records),
-            "date_range": {
-                "start": records[-1].created_at.isoformat() if records else None,
-                "end": records[0].created_at.isoformat() if records else None
-            },
-            "categories": defaultdict(int),
-            "daily_counts": defaultdict(int),
-            "hourly_distribution": defaultdict(int),
-            "moods": [],
-            "sleep_data": [],
-            "screen_data": [],
-            "activity_data": [],
-            "diet_data": [],
-            "ai_insights": [],
-            "tags": defaultdict(int),
-        }
+    def _summarize_records(self, records: List[Row], top_tags: Optional[int] = 20) -> Dict[str, Any]:
+        """汇总记录数据（top_tags=None 时保留全部标签计数，供按天汇总后合并）"""
+        summary = _Summary(total_records=len(records))
+        if records:
+            summary.start = records[-1].created_at.isoformat()
+            summary.end = records[0].created_at.isoformat()
         
         for r in records:
             # 分类统计（包含副分类）
             if r.category:
-                summary["categories"][r.category] += 1
+                summary.categories[r.category] += 1
             if r.sub_categories:
-                for sc in r.sub_categories:
-                    summary["categories"][sc] += 1
+                summary.categories.update(r.sub_categories)
             
-            # 每日统计
+            # 每日统计（循环内用整数日序号计数，结束后统一格式化）
             if r.created_at:
-                day_key = r.created_at.strftime("%Y-%m-%d")
-                summary["daily_counts"][day_key] += 1
-                summary["hourly_distribution"][r.created_at.hour] += 1
+                summary.daily_counts[r.created_at.toordinal()] += 1
+                summary.hourly[r.created_at.hour] += 1
+
+            # 只有需要输出明细的记录才格式化时间，且每条最多一次
+            created_iso = (
+                r.created_at.isoformat()
+                if r.created_at and (r.ai_insight or r.meta_data) else None
+            )
             
             # 标签统计
             if r.tags:
-                for tag in r.tags:
-                    summary["tags"][tag] += 1
+                summary.tags.update(r.tags)
             
             # AI 洞察收集
             if r.ai_insight:
-                summary["ai_insights"].append({
-                    "date": r.created_at.isoformat() if r.created_at else None,
+                summary.ai_insights.append({
+                    "date": created_iso,
                     "category": r.category,
-                    "insight": r.ai_insight[:200]
+                    "insight": r.ai_insight
                 })
             
             # 分类数据提取（同时考虑副分类）
@@ -350,11 +682,11 @@ class AIAnalyzer:
             if "MOOD" in _all_cats and r.meta_data:
                 mood = r.meta_data.get("mood")
                 if mood:
-                    summary["moods"].append(mood)
+                    summary.moods.append(mood)
             
             if "SLEEP" in _all_cats and r.meta_data:
-                summary["sleep_data"].append({
-                    "date": r.created_at.isoformat() if r.created_at else None,
+                summary.sleep_data.append({
+                    "date": created_iso,
                     "duration": r.meta_data.get("duration_hours"),
                     "quality": r.meta_data.get("quality"),
                     "score": r.meta_data.get("score"),
@@ -362,8 +694,8 @@ class AIAnalyzer:
             
             if "SCREEN" in _all_cats and r.meta_data:
                 top_apps = r.meta_data.get("top_apps") or []
-                summary["screen_data"].append({
-                    "date": r.created_at.isoformat() if r.created_at else None,
+                summary.screen_data.append({
+                    "date": created_iso,
                     "total_time": r.meta_data.get("total_screen_time"),
                     "total_minutes": r.meta_data.get("total_minutes"),
                     "top_apps": top_apps[:3] if top_apps else [],
@@ -371,8 +703,8 @@ class AIAnalyzer:
                 })
             
             if "ACTIVITY" in _all_cats and r.meta_data:
-                summary["activity_data"].append({
-                    "date": r.created_at.isoformat() if r.created_at else None,
+                summary.activity_data.append({
+                    "date": created_iso,
                     "type": r.meta_data.get("activity_type"),
                     "duration": r.meta_data.get("duration_minutes"),
                     "calories": r.meta_data.get("calories_burned"),
@@ -380,26 +712,18 @@ class AIAnalyzer:
             
             if "DIET" in _all_cats and r.meta_data:
                 food_items = r.meta_data.get("food_items") or []
-                summary["diet_data"].append({
-                    "date": r.created_at.isoformat() if r.created_at else None,
+                summary.diet_data.append({
+                    "date": created_iso,
                     "foods": food_items,
                     "calories": r.meta_data.get("total_calories"),
                     "is_healthy": r.meta_data.get("is_healthy"),
                 })
         
-        # 转换为普通字典
-        summary["categories"] = dict(summary["categories"])
-        summary["daily_counts"] = dict(summary["daily_counts"])
-        summary["hourly_distribution"] = dict(summary["hourly_distribution"])
-        summary["tags"] = dict(sorted(summary["tags"].items(), key=lambda x: x[1], reverse=True)[:20])
-        
-        return summary
+        return summary.to_dict(top_tags)
     
     async def _ai_analyze_weekly(self, data: Dict) -> Dict[str, Any]:
         """AI 周度分析"""
-        prompt = f"""你是 Vibing u 的数据分析师，擅长从生活记录中发现有价值的洞察。
-
-以下是用户过去一周的生活数据汇总：
+        prompt = _WEEKLY_PREFIX + f"""以下是用户过去一周的生活数据汇总：
 - 总记录数: {data['total_records']}
 - 时间范围: {data['date_range']['start']} 到 {data['date_range']['end']}
 - 分类分布: {json.dumps(data['categories'], ensure_ascii=False)}
@@ -407,28 +731,7 @@ class AIAnalyzer:
 - 睡眠数据: {json.dumps(data['sleep_data'][:5], ensure_ascii=False) if data['sleep_data'] else '无'}
 - 屏幕时间: {json.dumps(data['screen_data'][:5], ensure_ascii=False) if data['screen_data'] else '无'}
 - 运动数据: {json.dumps(data['activity_data'][:5], ensure_ascii=False) if data['activity_data'] else '无'}
-- 高频标签: {json.dumps(list(data['tags'].items())[:10], ensure_ascii=False)}
-
-请生成一份温暖、有洞察力的周度分析报告，以 JSON 格式输出：
-{{
-    "summary": "一句话总结本周状态（20-40字）",
-    "highlights": ["亮点1", "亮点2", "亮点3"],
-    "concerns": ["需要关注的问题1", "问题2"],
-    "insights": [
-        {{"title": "洞察标题", "content": "具体洞察内容（30-50字）", "emoji": "相关emoji"}},
-        {{"title": "洞察标题", "content": "具体洞察内容", "emoji": "emoji"}}
-    ],
-    "suggestions": [
-        {{"action": "具体建议", "reason": "原因", "priority": "high/medium/low"}}
-    ],
-    "mood_trend": "up/down/stable",
-    "overall_score": 75
-}}
-
-注意：
-1. 分析要有温度，像朋友一样关心用户
-2. 洞察要具体，基于数据而非泛泛而谈
-3. 建议要可行，能立即执行"""
+- 高频标签: {json.dumps(list(data['tags'].items())[:10], ensure_ascii=False)}"""
 
         try:
             result = await self.ai_client.chat_completion(
@@ -436,7 +739,7 @@ class AIAnalyzer:
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": "请分析我的数据，只输出JSON，不要其他内容。"}
                 ],
-                model=self.ai_client.models["text"],
+                model=self.ai_client.models.text,
                 max_tokens=6000,
                 task_type="weekly_analysis",
                 task_description="AI 周度分析",
@@ -469,7 +772,7 @@ class AIAnalyzer:
     
     async def _ai_analyze_trends(self, data: Dict, days: int) -> Dict[str, Any]:
         """AI 趋势分析"""
-        prompt = f"""分析用户过去 {days} 天的生活数据趋势。
+        prompt = _TRENDS_PREFIX + f"""分析周期: 过去 {days} 天
 
 数据汇总：
 - 总记录: {data['total_records']}
@@ -478,23 +781,7 @@ class AIAnalyzer:
 - 时段分布: {json.dumps(data['hourly_distribution'], ensure_ascii=False)}
 - 睡眠: {len(data['sleep_data'])} 条
 - 运动: {len(data['activity_data'])} 条
-- 屏幕: {len(data['screen_data'])} 条
-
-请以 JSON 格式输出趋势分析：
-{{
-    "overall_trend": "improving/declining/stable",
-    "trend_description": "整体趋势描述（30-50字）",
-    "patterns": [
-        {{"name": "模式名称", "description": "描述", "impact": "positive/negative/neutral"}}
-    ],
-    "correlations": [
-        {{"factor1": "因素1", "factor2": "因素2", "relationship": "关系描述"}}
-    ],
-    "predictions": [
-        {{"area": "领域", "prediction": "预测内容", "confidence": "high/medium/low"}}
-    ],
-    "action_items": ["建议1", "建议2"]
-}}"""
+- 屏幕: {len(data['screen_data'])} 条"""
 
         try:
             result = await self.ai_client.chat_completion(
@@ -502,7 +789,7 @@ class AIAnalyzer:
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": "分析趋势，只输出JSON，不要其他内容。"}
                 ],
-                model=self.ai_client.models["text"],
+                model=self.ai_client.models.text,
                 max_tokens=5000,
                 task_type="trend_analysis",
                 task_description="AI 趋势分析",
@@ -529,69 +816,9 @@ class AIAnalyzer:
             logger.error(f"AI 趋势分析错误: {e}")
             return self._mock_trend_analysis(data)
     
-    async def _ai_generate_suggestions(self, data: Dict) -> Dict[str, Any]:
-        """AI 生成建议"""
-        prompt = f"""基于用户的生活数据，生成个性化的智能建议。
-
-数据概览：
-- 分类: {json.dumps(data['categories'], ensure_ascii=False)}
-- 心情: {data['moods'][:5] if data['moods'] else '无'}
-- 睡眠: {len(data['sleep_data'])} 条记录
-- 运动: {len(data['activity_data'])} 条记录
-- 屏幕: {len(data['screen_data'])} 条记录
-- 标签: {list(data['tags'].keys())[:10]}
-
-请生成 3-5 条具体、可执行的建议，JSON 格式：
-{{
-    "focus_area": "当前最需要关注的领域",
-    "focus_reason": "原因（20字内）",
-    "suggestions": [
-        {{
-            "title": "建议标题",
-            "description": "具体描述和行动步骤（30-50字）",
-            "category": "sleep/activity/screen/mood/diet/social",
-            "difficulty": "easy/medium/hard",
-            "impact": "high/medium/low",
-            "emoji": "相关emoji"
-        }}
-    ],
-    "encouragement": "一句鼓励的话"
-}}"""
-
-        try:
-            result = await self.ai_client.chat_completion(
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": "给我一些建议，只输出JSON，不要其他内容。"}
-                ],
-                model=self.ai_client.models["text"],
-                max_tokens=5000,
-                task_type="smart_suggestions",
-                task_description="AI 智能建议",
-                json_response=True,
-            )
-            
-            content = result["content"]
-            if not content:
-                return self._mock_suggestions(data)
-            
-            if isinstance(content, dict):
-                return content
-            
-            parsed = safe_extract_json(content, "suggestions")
-            if parsed and isinstance(parsed, dict):
-                return parsed
-            return self._mock_suggestions(data)
-                
-        except Exception as e:
-            logger.error(f"AI 建议生成错误: {e}")
-            return self._mock_suggestions(data)
-    
     async def _ai_deep_insight(self, question: str, data: Dict) -> Dict[str, Any]:
         """AI 深度洞察"""
-        prompt = f"""你是用户的私人生活数据分析师。用户问了一个问题，请基于他的历史数据回答。
-
-用户数据：
+        prompt = _DEEP_INSIGHT_PREFIX + f"""用户数据：
 - 总记录: {data['total_records']}
 - 分类: {json.dumps(data['categories'], ensure_ascii=False)}
 - 最近的 AI 洞察: {json.dumps(data['ai_insights'][:5], ensure_ascii=False)}
@@ -600,15 +827,7 @@ class AIAnalyzer:
 - 睡眠数据: {json.dumps(data['sleep_data'][:3], ensure_ascii=False) if data['sleep_data'] else '无'}
 - 屏幕数据: {json.dumps(data['screen_data'][:3], ensure_ascii=False) if data['screen_data'] else '无'}
 
-用户问题: {question}
-
-请以 JSON 格式回答：
-{{
-    "answer": "详细回答（100-200字）",
-    "confidence": "high/medium/low",
-    "data_points": ["支持结论的数据点1", "数据点2"],
-    "follow_up_questions": ["可能的追问1", "追问2"]
-}}"""
+用户问题: {question}"""
 
         try:
             result = await self.ai_client.chat_completion(
@@ -7,15 +7,26 @@
 4. Token 用量追踪
 5. 错误处理和日志
 6. 按模型并发控制（基于智谱 AI 并发数限制）
+7. 按模型熔断（服务故障时快速失败）
+8. 全进程请求速率限制（令牌桶）
 """
 import asyncio
+import base64
+import hashlib
 import json
 import httpx
 import logging
-from typing import Dict, Any, List, Optional, Callable
+import random
+import time
+from typing import Dict, Any, List, Optional, Callable, Deque, AsyncIterator, Set
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
 from functools import wraps
+from email.utils import parsedate_to_datetime
 
+import openai
 from openai import AsyncOpenAI
 from app.config import get_settings
 from app.services.token_tracker import record_usage
@@ -24,6 +35,53 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+class AIClientError(Exception):
+    """AI 客户端错误"""
+    def __init__(self, message: str, error_code: str = None, retryable: bool = False):
+        self.message = message
+        self.error_code = error_code
+        self.retryable = retryable
+        super().__init__(message)
+
+
+class RequestRateLimiter:
+    """令牌桶速率限制器（全进程共享）
+    
+    并发上限只限制在途请求数，短请求集中到达时仍可能超过服务商的 RPM 限制触发 429；
+    令牌桶把请求发起速率压在 rate 次/秒以内，允许最多 burst 个请求突发。
+    """
+    
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+    
+    async def wait(self):
+        """取一个令牌，不足时等待补充；rate <= 0 时不限制
+        
+        先预留令牌（余额可为负）再等待：计算与预留之间没有 await，不需要加锁，
+        等待期间不阻塞其他调用方，后来的请求按预留顺序依次顺延。
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            try:
+                await asyncio.sleep(-self._tokens / self.rate)
+            except asyncio.CancelledError:
+                # 被取消的请求不会发出，归还预留的令牌
+                self._tokens += 1
+                raise
+
+
+# 全局速率限制器实例
+_rate_limiter = RequestRateLimiter(settings.ai_requests_per_second)
+
+
 class ModelConcurrencyLimiter:
     """按模型的并发控制器
     
@@ -58,17 +116,15 @@ class ModelConcurrencyLimiter:
     
     def __init__(self):
         self._semaphores: Dict[str, asyncio.Semaphore] = {}
-        self._lock = asyncio.Lock()
-    
-    async def _get_semaphore(self, model: str) -> asyncio.Semaphore:
-        """获取或创建模型对应的信号量"""
-        async with self._lock:
-            if model not in self._semaphores:
-                model_lower = model.lower()
-                limit = self.MODEL_LIMITS.get(model_lower, self.DEFAULT_LIMIT)
-                self._semaphores[model] = asyncio.Semaphore(limit)
-                logger.debug(f"[并发控制] 模型 {model} 并发上限: {limit}")
-            return self._semaphores[model]
+    
+    def _get_semaphore(self, model: str) -> asyncio.Semaphore:
+        """获取或创建模型对应的信号量（无 await，单次事件循环调度内完成，不需要加锁）"""
+        sem = self._semaphores.get(model)
+        if sem is None:
+            limit = self.MODEL_LIMITS.get(model, self.DEFAULT_LIMIT)
+            sem = self._semaphores.setdefault(model, asyncio.Semaphore(limit))
+            logger.debug(f"[并发控制] 模型 {model} 并发上限: {limit}")
+        return sem
     
     async def acquire(self, model: str, timeout: float = 90.0) -> bool:
         """获取并发许可（阻塞等待直到有空位）
@@ -80,31 +136,49 @@ class ModelConcurrencyLimiter:
         Returns:
             是否成功获取许可
         """
-        sem = await self._get_semaphore(model)
+        model = model.lower()
+        if await self._acquire(self._get_semaphore(model), timeout):
+            return True
+        logger.warning(f"[并发控制] 模型 {model} 等待超时 ({timeout}s)")
+        return False
+    
+    @staticmethod
+    async def _acquire(sem: asyncio.Semaphore, timeout: float) -> bool:
+        """限时获取信号量
+        
+        使用 asyncio.timeout 而不是 wait_for：wait_for 在获取成功的同时被取消时会丢失已拿到的许可，
+        Semaphore.acquire 自身在被取消时能正确归还许可。
+        """
         try:
-            await asyncio.wait_for(sem.acquire(), timeout=timeout)
+            async with asyncio.timeout(timeout):
+                await sem.acquire()
             return True
-        except asyncio.TimeoutError:
-            logger.warning(f"[并发控制] 模型 {model} 等待超时 ({timeout}s)")
+        except TimeoutError:
             return False
     
     async def acquire_with_upgrade(self, model: str, timeout: float = 90.0):
         """尝试获取并发许可，flash 模型繁忙时自动升级到付费模型
         
+        先经过全进程速率限制再获取许可：排队等令牌时不占用模型并发许可，
+        也不会因此让其他请求误判 flash 模型繁忙而升级。返回时即可发起请求。
+        
+        模型名统一转为小写（配置中可能是大写），与 MODEL_LIMITS / UPGRADE_MAP 的键一致，
+        返回的实际模型名也是小写，释放时使用同一个信号量。
+        
         Returns:
             (是否成功, 实际使用的模型名)
         """
-        sem = await self._get_semaphore(model)
-        
+        await _rate_limiter.wait()
+        return await self._acquire_model(model.lower(), timeout)
+    
+    async def _acquire_model(self, model: str, timeout: float):
+        """获取并发许可，flash 模型繁忙时升级，返回 (是否成功, 实际使用的模型名)"""
         # 先用短超时尝试原模型（1秒）
-        try:
-            await asyncio.wait_for(sem.acquire(), timeout=1.0)
+        if await self._acquire(self._get_semaphore(model), 1.0):
             return True, model
-        except asyncio.TimeoutError:
-            pass
         
         # 原模型繁忙，尝试升级
-        upgrade = self.UPGRADE_MAP.get(model.lower())
+        upgrade = self.UPGRADE_MAP.get(model)
         if upgrade:
             logger.info(f"[并发控制] {model} 繁忙，升级到 {upgrade}")
             acquired = await self.acquire(upgrade, timeout=timeout)
@@ -117,80 +191,382 @@ class ModelConcurrencyLimiter:
     
     def release(self, model: str):
         """释放并发许可"""
-        if model in self._semaphores:
-            self._semaphores[model].release()
+        sem = self._semaphores.get(model.lower())
+        if sem is not None:
+            sem.release()
+    
+    @asynccontextmanager
+    async def slot(self, model: str, timeout: float = 90.0) -> AsyncIterator[str]:
+        """并发许可上下文：获取许可（繁忙时自动升级），退出时必定释放（包括任务被取消）
+        
+        Yields:
+            实际使用的模型名
+        """
+        acquired, actual_model = await self.acquire_with_upgrade(model, timeout=timeout)
+        if not acquired:
+            raise AIClientError(
+                message=f"模型 {model} 并发已满，等待超时",
+                error_code="CONCURRENCY_LIMIT",
+                retryable=True
+            )
+        try:
+            yield actual_model
+        finally:
+            self.release(actual_model)
 
 
 # 全局并发控制器实例
 _concurrency_limiter = ModelConcurrencyLimiter()
 
 
-class AIClientError(Exception):
-    """AI 客户端错误"""
-    def __init__(self, message: str, error_code: str = None, retryable: bool = False):
-        self.message = message
-        self.error_code = error_code
-        self.retryable = retryable
-        super().__init__(message)
+class ModelCircuitBreaker:
+    """按模型的熔断器
+    
+    窗口期内连续出现多次可重试错误（限流/服务端错误）时熔断该模型，
+    冷却期内直接降级或报错，不再排队重试和占用并发许可；
+    冷却结束后进入半开状态，每个模型同一时间只放行一个探测请求，
+    其余请求仍直接降级或报错；探测连续成功后恢复，失败则重新熔断。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    FAILURE_THRESHOLD = 5      # 窗口内失败次数达到即熔断
+    FAILURE_WINDOW = 60.0      # 失败统计窗口（秒）
+    COOLDOWN = 30.0            # 熔断冷却时间（秒）
+    HALF_OPEN_SUCCESSES = 2    # 半开状态下恢复所需的连续成功次数
+    PROBE_TIMEOUT = 120.0      # 探测请求超过该时长仍未结束时，允许发起新的探测（秒）
+    
+    def __init__(self):
+        self._states: Dict[str, str] = {}
+        self._failures: Dict[str, Deque[float]] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._probe_successes: Dict[str, int] = {}
+        self._probe_started: Dict[str, float] = {}  # 半开状态下正在进行的探测请求开始时间
+        self.metrics: Dict[str, int] = {"opens": 0, "half_open_probes": 0, "short_circuits": 0}
+    
+    def state(self, model: str) -> str:
+        """当前状态（冷却结束的 OPEN 转为 HALF_OPEN）"""
+        state = self._states.get(model, self.CLOSED)
+        if state == self.OPEN and time.monotonic() - self._opened_at[model] >= self.COOLDOWN:
+            state = self.HALF_OPEN
+            self._states[model] = state
+            self._probe_successes[model] = 0
+            logger.info(f"[熔断] 模型 {model} 冷却结束，进入半开状态")
+        return state
+    
+    def allow(self, model: str) -> bool:
+        """是否放行该模型的请求"""
+        state = self.state(model)
+        if state == self.OPEN:
+            self.metrics["short_circuits"] += 1
+            return False
+        if state == self.HALF_OPEN:
+            now = time.monotonic()
+            started = self._probe_started.get(model)
+            if started is not None and now - started < self.PROBE_TIMEOUT:
+                self.metrics["short_circuits"] += 1
+                return False
+            self._probe_started[model] = now
+            self.metrics["half_open_probes"] += 1
+        return True
+    
+    def end_probe(self, model: str):
+        """本次调用结束（含异常、取消），释放半开状态的探测名额"""
+        self._probe_started.pop(model, None)
+    
+    def record_success(self, model: str):
+        """记录成功调用"""
+        self.end_probe(model)
+        if self._states.get(model) == self.HALF_OPEN:
+            self._probe_successes[model] = self._probe_successes.get(model, 0) + 1
+            if self._probe_successes[model] < self.HALF_OPEN_SUCCESSES:
+                return
+            self._states[model] = self.CLOSED
+            logger.info(f"[熔断] 模型 {model} 已恢复")
+        failures = self._failures.get(model)
+        if failures:
+            failures.clear()
+    
+    def record_failure(self, model: str):
+        """记录可重试错误，达到阈值时熔断"""
+        now = time.monotonic()
+        self.end_probe(model)
+        if self._states.get(model) == self.HALF_OPEN:
+            self._trip(model, now)
+            return
+        
+        failures = self._failures.setdefault(model, deque())
+        failures.append(now)
+        while failures and now - failures[0] > self.FAILURE_WINDOW:
+            failures.popleft()
+        if len(failures) >= self.FAILURE_THRESHOLD:
+            self._trip(model, now)
+    
+    def _trip(self, model: str, now: float):
+        self._states[model] = self.OPEN
+        self._opened_at[model] = now
+        self._failures.pop(model, None)
+        self.metrics["opens"] += 1
+        logger.warning(f"[熔断] 模型 {model} 连续失败，熔断 {self.COOLDOWN:.0f} 秒")
+
+
+# 全局熔断器实例
+_circuit_breaker = ModelCircuitBreaker()
+
+
+# 所有 AI 调用共用的 HTTP 连接池：保持长连接复用，避免每次请求重新建立 TCP/TLS
+_shared_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """获取共享的 HTTP 客户端（连接池上限高于 SDK 默认值，覆盖各模型并发总和）"""
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=50,
+                keepalive_expiry=30.0,
+            ),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+    return _shared_http_client
+
+
+# 共享的 AsyncOpenAI 客户端及其构建参数 (api_key, base_url, http_client)
+_shared_openai_client: Optional[AsyncOpenAI] = None
+_shared_openai_key: Optional[tuple] = None
+
+
+def get_openai_client() -> Optional[AsyncOpenAI]:
+    """获取共享的 AsyncOpenAI 客户端（未配置 API Key 时返回 None）
+    
+    各服务共用同一个客户端和连接池；API Key、Base URL 变化或连接池被关闭重建后自动重新创建。
+    """
+    global _shared_openai_client, _shared_openai_key
+    api_key = settings.get_ai_api_key()
+    if not api_key:
+        return None
+    
+    http_client = get_shared_http_client()
+    key = (api_key, settings.get_ai_base_url(), http_client)
+    if _shared_openai_client is None or _shared_openai_key != key:
+        _shared_openai_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=key[1],
+            timeout=httpx.Timeout(120.0),
+            http_client=http_client,
+        )
+        _shared_openai_key = key
+    return _shared_openai_client
+
+
+async def close_shared_http_client():
+    """关闭共享的 HTTP 客户端（应用退出时调用）"""
+    global _shared_http_client
+    if _shared_http_client is not None and not _shared_http_client.is_closed:
+        await _shared_http_client.aclose()
+    _shared_http_client = None
+
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# 未知异常类型时在错误信息中匹配的错误码（1302 为智谱限流）
+RETRYABLE_ERROR_CODES = frozenset({"429", "500", "502", "503", "504", "1302"})
+
+# 单次 embedding 请求的最大文本数
+EMBEDDING_BATCH_SIZE = 64
+
+
+class EmbeddingCoalescer:
+    """embedding 请求合并器
+    
+    在很短的时间窗口内收集单条 embedding 请求，按 (模型, 任务类型) 合并为一次批量调用，
+    再把结果分发回各调用方，减少请求往返次数和并发许可占用。
+    """
+    
+    WINDOW = 0.01  # 合并窗口（秒）
+    
+    def __init__(self, client: "AIClient"):
+        self._client = client
+        self._pending: Dict[tuple, List[tuple]] = {}
+    
+    async def submit(self, text: str, model: str, task_type: str) -> List[float]:
+        """提交单条文本，等待批量调用返回其向量"""
+        key = (model, task_type)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((text, future))
+        if len(pending) == 1:
+            asyncio.create_task(self._flush_later(key))
+        return await future
+    
+    async def _flush_later(self, key: tuple):
+        await asyncio.sleep(self.WINDOW)
+        # 调用方已取消（如客户端断开）的请求不再发送
+        batch = [item for item in self._pending.pop(key, []) if not item[1].done()]
+        if not batch:
+            return
+        
+        model, task_type = key
+        try:
+            embeddings = await self._client.get_embeddings(
+                [text for text, _ in batch], model=model, task_type=task_type
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+@dataclass(frozen=True, slots=True)
+class ModelConfig:
+    """AIClient 使用的模型名（初始化后不可变，统一为小写）"""
+    vision: str
+    vision_flash: str
+    text: str
+    text_flash: str
+    smart: str
+    embedding: str
 
 
 class AIClient:
     """统一的 AI 客户端
     
-    提供重试机制、模型降级和错误处理
+    提供重试机制、模型降级和错误处理。
+    模型名在公开接口入口统一转为小写，并发控制和熔断器内部不再重复处理。
     """
     
     def __init__(self):
-        api_key = settings.get_ai_api_key()
-        base_url = settings.get_ai_base_url()
-        
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            timeout=httpx.Timeout(120.0)
-        ) if api_key else None
+        self.client = get_openai_client()
         
         # 模型配置
-        self.models = {
-            "vision": settings.vision_model,           # glm-4.6v
-            "vision_flash": settings.simple_vision_model,  # glm-4.6v-flash
-            "text": settings.text_model,               # glm-4.7
-            "text_flash": settings.simple_text_model,  # glm-4.7-flash
-            "smart": settings.smart_model,             # glm-4.7
-            "embedding": settings.embedding_model,     # embedding-3
+        self.models = ModelConfig(
+            vision=settings.vision_model.lower(),           # glm-4.6v
+            vision_flash=settings.simple_vision_model.lower(),  # glm-4.6v-flash
+            text=settings.text_model.lower(),               # glm-4.7
+            text_flash=settings.simple_text_model.lower(),  # glm-4.7-flash
+            smart=settings.smart_model.lower(),             # glm-4.7
+            embedding=settings.embedding_model.lower(),     # embedding-3
+        )
+        
+        # 降级映射（初始化时构建一次）
+        self._fallback_map = {
+            self.models.vision: self.models.vision_flash,
+            self.models.text: self.models.text_flash,
+            self.models.smart: self.models.text_flash,
         }
         
         # 重试配置
         self.max_retries = 3
         self.base_delay = 1.0  # 秒
         self.max_delay = 30.0
+        self.retry_budget = 60.0  # 单次调用的重试总时长上限（秒）
         
         # 可重试的错误码
-        self.retryable_codes = {"429", "500", "502", "503", "504", "1302"}
+        self.retryable_codes = RETRYABLE_ERROR_CODES
+        
+        # 单条 embedding 请求合并器，以及进行中的相同请求去重
+        self._embedding_coalescer = EmbeddingCoalescer(self)
+        self._inflight_embeddings: Dict[str, asyncio.Future] = {}
+        
+        # 不支持 response_format=json_object 的模型（首次 400 后记录，之后直接走文本提取）
+        self._json_mode_unsupported: Set[str] = set()
+    
+    async def warmup(self, probe: bool = False):
+        """预热连接池：启动时提前完成 TCP/TLS 握手，避免首个用户请求承担建连延迟
+        
+        Args:
+            probe: 是否额外发送一次 embedding 探测请求（会消耗少量 Token）
+        """
+        if not self.client:
+            return
+        try:
+            # 任何响应（包括 404）都说明连接已建立
+            await get_shared_http_client().get(str(self.client.base_url), timeout=10.0)
+            if probe:
+                await self.client.embeddings.create(model=self.models.embedding, input="warmup")
+            logger.info("AI 客户端连接预热完成")
+        except Exception as e:
+            logger.warning(f"AI 客户端预热失败 (不影响主服务): {e}")
+    
+    def is_healthy(self, model: str = None) -> bool:
+        """客户端已配置且模型（默认文本模型）未熔断"""
+        model = model.lower() if model else self.models.text
+        return self.client is not None and _circuit_breaker.state(model) != ModelCircuitBreaker.OPEN
     
     def _is_retryable_error(self, error: Exception) -> bool:
-        """判断错误是否可重试"""
+        """判断错误是否可重试（优先按异常类型判断，未知类型才匹配错误信息）"""
+        # 限流、连接失败/超时、服务端错误
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        if isinstance(error, (httpx.TimeoutException, httpx.NetworkError)):
+            return True
+        
+        # 未知异常类型：回退到错误码匹配
         error_str = str(error)
+        return any(code in error_str for code in self.retryable_codes)
+    
+    def _get_retry_delay(self, error: Exception, attempt: int) -> float:
+        """重试等待时间：优先使用 429 响应给出的等待时间，否则指数退避（429 错误等更久）
         
-        # 检查是否是速率限制错误
-        if "429" in error_str or "1302" in error_str:
-            return True
+        指数退避叠加 0.5~1.5 倍随机抖动，避免同时被限流的请求在同一时刻集中重试。
+        """
+        retry_after = self._get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        
+        is_rate_limit = isinstance(error, openai.RateLimitError) or "1302" in str(error)
+        base = 5.0 if is_rate_limit else self.base_delay
+        return min(base * (2 ** (attempt - 1)), self.max_delay) * (0.5 + random.random())
+    
+    def _get_retry_after(self, error: Exception) -> Optional[float]:
+        """从 429 响应头解析服务端建议的等待秒数，没有则返回 None"""
+        if not isinstance(error, openai.RateLimitError):
+            return None
+        headers = error.response.headers
         
-        # 检查是否是服务器错误
-        for code in ["500", "502", "503", "504"]:
-            if code in error_str:
-                return True
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return max(float(retry_after_ms) / 1000, 0.0)
+            except ValueError:
+                pass
         
-        return False
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                # HTTP-date 格式
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        
+        # 部分网关只返回限额重置时间，如 "1s" / "0.5s"
+        reset = headers.get("x-ratelimit-reset-requests")
+        if reset and reset.endswith("s") and not reset.endswith("ms"):
+            try:
+                return max(float(reset[:-1]), 0.0)
+            except ValueError:
+                pass
+        return None
     
     def _get_fallback_model(self, model: str) -> Optional[str]:
         """获取降级模型"""
-        fallbacks = {
-            self.models["vision"]: self.models["vision_flash"],
-            self.models["text"]: self.models["text_flash"],
-            self.models["smart"]: self.models["text_flash"],
-        }
-        return fallbacks.get(model)
+        return self._fallback_map.get(model)
     
     async def _execute_with_retry(
         self,
@@ -212,61 +588,71 @@ class AIClient:
         max_total_attempts = self.max_retries + 2
         has_fallen_back = False
         requested_model = model
+        deadline = time.monotonic() + self.retry_budget
         
         while total_attempts < max_total_attempts:
-            # 获取并发许可，flash 繁忙时自动升级
-            acquired, actual_model = await _concurrency_limiter.acquire_with_upgrade(
-                requested_model, timeout=90.0
-            )
-            if not acquired:
+            # 模型熔断中：不排队、不等待，直接降级或快速失败
+            if not _circuit_breaker.allow(requested_model):
+                fallback = self._get_fallback_model(requested_model) if allow_fallback and not has_fallen_back else None
+                if fallback and fallback != requested_model:
+                    logger.info(f"[熔断] {requested_model} 熔断中，直接降级到 {fallback}")
+                    requested_model = fallback
+                    has_fallen_back = True
+                    continue
                 raise AIClientError(
-                    message=f"模型 {requested_model} 并发已满，等待超时",
-                    error_code="CONCURRENCY_LIMIT",
-                    retryable=True
+                    message=f"模型 {requested_model} 熔断中，暂停调用",
+                    error_code="CIRCUIT_OPEN",
+                    retryable=False
                 )
             
+            # 并发许可只在单次调用期间持有，退避等待时已释放
             try:
-                result = await func(model=actual_model, **kwargs)
-                return result
+                async with _concurrency_limiter.slot(requested_model) as actual_model:
+                    try:
+                        result = await func(model=actual_model, **kwargs)
+                    except Exception as e:
+                        error = e
+                    else:
+                        _circuit_breaker.record_success(actual_model)
+                        return result
+            finally:
+                _circuit_breaker.end_probe(requested_model)
             
-            except Exception as e:
-                last_error = e
-                total_attempts += 1
-                logger.warning(f"AI 调用失败 (尝试 {total_attempts}/{max_total_attempts}, 模型 {actual_model}): {e}")
-                
-                if not self._is_retryable_error(e):
-                    raise AIClientError(
-                        message=str(e),
-                        error_code="UNRETRYABLE",
-                        retryable=False
-                    )
-                
-                # 计算延迟（指数退避，429 错误等更久）
-                is_rate_limit = "429" in str(e) or "1302" in str(e)
-                base = 5.0 if is_rate_limit else self.base_delay
-                delay = min(
-                    base * (2 ** (total_attempts - 1)),
-                    self.max_delay
+            last_error = error
+            total_attempts += 1
+            logger.warning(f"AI 调用失败 (尝试 {total_attempts}/{max_total_attempts}, 模型 {actual_model}): {error}")
+            
+            if not self._is_retryable_error(error):
+                raise AIClientError(
+                    message=str(error),
+                    error_code="UNRETRYABLE",
+                    retryable=False
                 )
-                
-                # 多次失败后尝试降级到 flash 模型
-                if total_attempts >= 2 and allow_fallback and not has_fallen_back:
-                    fallback = self._get_fallback_model(requested_model)
-                    if fallback and fallback != requested_model:
-                        logger.info(f"降级到模型: {fallback}")
-                        requested_model = fallback
-                        has_fallen_back = True
-                        continue
-                
-                if total_attempts >= max_total_attempts:
-                    break
-                    
-                logger.info(f"等待 {delay:.1f} 秒后重试...")
-                await asyncio.sleep(delay)
+            _circuit_breaker.record_failure(actual_model)
             
-            finally:
-                # 释放实际使用的模型的并发许可
-                _concurrency_limiter.release(actual_model)
+            # 多次失败后尝试降级到 flash 模型
+            if total_attempts >= 2 and allow_fallback and not has_fallen_back:
+                fallback = self._get_fallback_model(requested_model)
+                if fallback and fallback != requested_model:
+                    logger.info(f"降级到模型: {fallback}")
+                    requested_model = fallback
+                    has_fallen_back = True
+                    continue
+            
+            if total_attempts >= max_total_attempts:
+                break
+            
+            # 刚触发熔断则不再等待，下一轮直接降级或报错
+            if _circuit_breaker.state(requested_model) == ModelCircuitBreaker.OPEN:
+                continue
+            
+            delay = self._get_retry_delay(error, total_attempts)
+            # 等待后会超出重试总时长，不再重试
+            if time.monotonic() + delay > deadline:
+                logger.warning(f"重试总时长超过 {self.retry_budget:.0f} 秒，放弃重试")
+                break
+            logger.info(f"等待 {delay:.1f} 秒后重试...")
+            await asyncio.sleep(delay)
         
         raise AIClientError(
             message=f"AI 调用失败，已重试 {total_attempts} 次: {last_error}",
@@ -274,6 +660,21 @@ class AIClient:
             retryable=False
         )
     
+    async def _create_completion(self, json_response: bool, **create_kwargs):
+        """调用补全接口；JSON 模式优先使用服务端 json_object，模型不支持时退回普通文本"""
+        model = create_kwargs["model"]
+        if json_response and model not in self._json_mode_unsupported:
+            try:
+                return await self.client.chat.completions.create(
+                    response_format={"type": "json_object"}, **create_kwargs
+                )
+            except openai.BadRequestError as e:
+                if "response_format" not in str(e):
+                    raise
+                self._json_mode_unsupported.add(model)
+                logger.info(f"模型 {model} 不支持 json_object，改用文本提取 JSON")
+        return await self.client.chat.completions.create(**create_kwargs)
+    
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -306,7 +707,7 @@ class AIClient:
         if not self.client:
             raise AIClientError("AI 客户端未配置", "NO_CLIENT")
         
-        model = model or self.models["text_flash"]
+        model = model.lower() if model else self.models.text_flash
         
         async def _call(model: str, **kwargs):
             create_kwargs = dict(
@@ -316,10 +717,7 @@ class AIClient:
                 temperature=temperature,
             )
             # json_response=True 时，强制 API 返回纯 JSON（避免 markdown 包裹和多余文字）
-            if json_response:
-                create_kwargs["response_format"] = {"type": "json_object"}
-            response = await self.client.chat.completions.create(**create_kwargs)
-            return response
+            return await self._create_completion(json_response, **create_kwargs)
         
         response = await self._execute_with_retry(
             _call,
@@ -368,10 +766,101 @@ class AIClient:
             }
         }
     
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        task_type: str = "chat",
+        task_description: str = None,
+        record_id: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        流式聊天补全接口，逐段 yield 文本
+        
+        并发许可在整个流式输出期间持有；首段内容到达前的可重试错误会退避重试，
+        已经输出内容后出错直接抛出（重试会重复计费且内容无法撤回）。
+        Token 用量在流结束后记录一次。
+        """
+        if not self.client:
+            raise AIClientError("AI 客户端未配置", "NO_CLIENT")
+        
+        model = model.lower() if model else self.models.text_flash
+        attempts = 0
+        usage = None
+        
+        while True:
+            if not _circuit_breaker.allow(model):
+                raise AIClientError(
+                    message=f"模型 {model} 熔断中，暂停调用",
+                    error_code="CIRCUIT_OPEN",
+                    retryable=False
+                )
+            
+            started = False
+            actual_model = model
+            try:
+                async with _concurrency_limiter.slot(model) as actual_model:
+                    stream = await self.client.chat.completions.create(
+                        model=actual_model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    async for chunk in stream:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if chunk.choices:
+                            text = chunk.choices[0].delta.content
+                            if text:
+                                started = True
+                                yield text
+                    _circuit_breaker.record_success(actual_model)
+                break
+            
+            except AIClientError:
+                raise
+            except Exception as e:
+                attempts += 1
+                logger.warning(f"AI 流式调用失败 (尝试 {attempts}/{self.max_retries}, 模型 {actual_model}): {e}")
+                if started or not self._is_retryable_error(e):
+                    raise AIClientError(
+                        message=str(e),
+                        error_code="STREAM_INTERRUPTED" if started else "UNRETRYABLE",
+                        retryable=False
+                    )
+                _circuit_breaker.record_failure(actual_model)
+                if attempts >= self.max_retries:
+                    raise AIClientError(
+                        message=f"AI 流式调用失败，已重试 {attempts} 次: {e}",
+                        error_code="MAX_RETRIES_EXCEEDED",
+                        retryable=False
+                    )
+                await asyncio.sleep(self._get_retry_delay(e, attempts))
+            finally:
+                _circuit_breaker.end_probe(model)
+        
+        # 记录 Token 使用
+        if usage:
+            try:
+                record_usage(
+                    model=actual_model,
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    task_type=task_type,
+                    task_description=task_description,
+                    related_record_id=record_id
+                )
+            except Exception as e:
+                logger.warning(f"Token 记录失败: {e}")
+    
     async def vision_completion(
         self,
         prompt: str,
-        image_base64: str,
+        image_base64: str = None,
         model: str = None,
         max_tokens: int = 4000,
         task_type: str = "vision",
@@ -379,21 +868,31 @@ class AIClient:
         record_id: str = None,
         json_response: bool = False,
         allow_fallback: bool = True,
+        image_bytes: bytes = None,
+        mime: str = "image/jpeg",
     ) -> Dict[str, Any]:
         """
         视觉模型接口
         
         Args:
             prompt: 文本提示
-            image_base64: Base64 编码的图片
+            image_base64: Base64 编码的图片（与 image_bytes 二选一）
+            image_bytes: 原始图片字节，只在这里编码一次，调用方无需自行转 Base64
+            mime: 图片 MIME 类型
             model: 模型名称 (默认使用 vision_flash)
             其他参数同 chat_completion
         """
         if not self.client:
             raise AIClientError("AI 客户端未配置", "NO_CLIENT")
+        if image_bytes is None and not image_base64:
+            raise AIClientError("缺少图片数据", "NO_IMAGE")
         
-        model = model or self.models["vision_flash"]
+        model = model.lower() if model else self.models.vision_flash
         
+        # data URL 只构建一次，重试和降级都复用同一个 messages
+        if image_bytes is not None:
+            image_base64 = base64.b64encode(image_bytes).decode("ascii")
+        image_url = "".join(("data:", mime, ";base64,", image_base64))
         messages = [
             {
                 "role": "user",
@@ -401,9 +900,7 @@ class AIClient:
                     {"type": "text", "text": prompt},
                     {
                         "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
+                        "image_url": {"url": image_url}
                     }
                 ]
             }
@@ -415,10 +912,7 @@ class AIClient:
                 messages=messages,
                 max_tokens=max_tokens,
             )
-            if json_response:
-                create_kwargs["response_format"] = {"type": "json_object"}
-            response = await self.client.chat.completions.create(**create_kwargs)
-            return response
+            return await self._create_completion(json_response, **create_kwargs)
         
         response = await self._execute_with_retry(
             _call,
@@ -467,6 +961,63 @@ class AIClient:
             }
         }
     
+    async def get_embeddings(
+        self,
+        texts: List[str],
+        model: str = None,
+        task_type: str = "embedding",
+        record_id: str = None,
+    ) -> List[List[float]]:
+        """
+        批量获取文本嵌入向量（每次请求最多 EMBEDDING_BATCH_SIZE 条）
+        
+        Args:
+            texts: 输入文本列表
+            model: 模型名称 (默认使用 embedding)
+            
+        Returns:
+            与 texts 顺序一致的嵌入向量列表
+        """
+        if not self.client:
+            raise AIClientError("AI 客户端未配置", "NO_CLIENT")
+        
+        model = model.lower() if model else self.models.embedding
+        embeddings: List[List[float]] = []
+        
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[i:i + EMBEDDING_BATCH_SIZE]
+            
+            async def _call(model: str, **kwargs):
+                response = await self.client.embeddings.create(
+                    model=model,
+                    input=batch,
+                )
+                return response
+            
+            response = await self._execute_with_retry(
+                _call,
+                model=model,
+                task_type=task_type,
+                allow_fallback=False,  # embedding 没有降级选项
+            )
+            
+            # 记录 Token 使用
+            if response.usage:
+                try:
+                    record_usage(
+                        model=model,
+                        prompt_tokens=response.usage.prompt_tokens,
+                        completion_tokens=0,
+                        task_type=task_type,
+                        related_record_id=record_id
+                    )
+                except Exception as e:
+                    logger.warning(f"Token 记录失败: {e}")
+            
+            embeddings.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+        
+        return embeddings
+    
     async def get_embedding(
         self,
         text: str,
@@ -477,6 +1028,8 @@ class AIClient:
         """
         获取文本嵌入向量
         
+        未关联记录的请求会与同一时间窗口内的其他请求合并为一次批量调用
+        
         Args:
             text: 输入文本
             model: 模型名称 (默认使用 embedding)
@@ -487,36 +1040,38 @@ class AIClient:
         if not self.client:
             raise AIClientError("AI 客户端未配置", "NO_CLIENT")
         
-        model = model or self.models["embedding"]
-        
-        async def _call(model: str, **kwargs):
-            response = await self.client.embeddings.create(
-                model=model,
-                input=text,
-            )
-            return response
-        
-        response = await self._execute_with_retry(
-            _call,
-            model=model,
-            task_type=task_type,
-            allow_fallback=False,  # embedding 没有降级选项
-        )
+        model = model.lower() if model else self.models.embedding
+        if record_id:
+            # 需要按记录统计用量，单独调用
+            return (await self.get_embeddings([text], model, task_type, record_id))[0]
         
-        # 记录 Token 使用
-        if response.usage:
+        # 相同文本的请求正在进行中时直接等待其结果
+        key = hashlib.blake2b(f"{model}:{task_type}:{text}".encode(), digest_size=16).hexdigest()
+        while (inflight := self._inflight_embeddings.get(key)) is not None:
             try:
-                record_usage(
-                    model=model,
-                    prompt_tokens=response.usage.prompt_tokens,
-                    completion_tokens=0,
-                    task_type=task_type,
-                    related_record_id=record_id
-                )
-            except Exception as e:
-                logger.warning(f"Token 记录失败: {e}")
+                return await asyncio.shield(inflight)
+            except AIClientError as e:
+                # 发起方被取消：由仍在等待的调用方之一重新发起
+                if e.error_code != "INFLIGHT_CANCELLED":
+                    raise
         
-        return response.data[0].embedding
+        future = asyncio.get_running_loop().create_future()
+        # 没有其他等待方时也要取走异常，避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight_embeddings[key] = future
+        try:
+            embedding = await self._embedding_coalescer.submit(text, model, task_type)
+            future.set_result(embedding)
+            return embedding
+        except asyncio.CancelledError:
+            # 不取消共享的 future，其他等待方并未被取消
+            future.set_exception(AIClientError("发起方已取消", "INFLIGHT_CANCELLED", retryable=True))
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight_embeddings[key]
     
     def _extract_json(self, content: str) -> Any:
         """从内容中提取 JSON（使用共享的健壮解析器）"""
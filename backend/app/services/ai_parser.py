@@ -1,24 +1,184 @@
-import json
+import asyncio
+import copy
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from datetime import datetime
-from openai import AsyncOpenAI
+import orjson
+from pydantic import ValidationError
 from app.config import get_settings
 from app.services.token_tracker import record_usage
+from app.services.ai_client import get_openai_client, _concurrency_limiter
+from app.services.json_utils import partial_reply_text
+from app.schemas.feed import ParseResult, ParseBatchResult
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 返回内容不符合 ParseResult 时，修复请求的输出 Token 上限
+PARSE_REPAIR_MAX_TOKENS = 512
+
+# 相同输入的解析结果缓存（按内容哈希，LRU + 过期时间）
+PARSE_CACHE_SIZE = 10_000
+PARSE_CACHE_TTL = 3600  # 秒；结果中的时间段标签与当前时间有关，不宜缓存太久
+
+# 按输入类型设置的输出 Token 上限（结果只有四个字段，无需预留 3000）
+PARSE_MAX_TOKENS_IMAGE = 1024
+PARSE_MAX_TOKENS_TEXT = 512
+PARSE_MAX_TOKENS_HINTED = 384  # 已给出分类提示，只需提取字段和回复
+
+# 解析用的系统提示（不含任何随请求变化的内容，保证前缀稳定以命中提示词缓存）
+PARSE_SYSTEM_PROMPT = """你是 Vibing u 的首席分析师。你冷静、客观，但极具洞察力。
+你的目标是通过数据帮助用户达到 "High Vibe" 状态。
+
+【重要】用户消息开头会注明本次输入是否包含图片。请严格基于实际输入内容分析，不要臆测不存在的内容。
+
+你的任务是：
+1. 从用户的图片和/或文字中提取结构化数据
+2. 判断输入属于哪个分类
+3. 用简短、温暖的语言给出回复（不要重复用户说的话）
+4. 为内容生成相关的标签 (tags)
+
+分类枚举：SLEEP（睡眠）, DIET（饮食）, SCREEN（屏幕时间）, ACTIVITY（活动）, MOOD（情绪）, GROWTH（成长/学习）, SOCIAL（社交）, LEISURE（休闲）
+
+请以 JSON 格式输出，包含以下字段：
+- category: 分类（上述枚举之一）
+- meta_data: 提取的结构化数据，只包含有意义的字段，比如：
+  * MOOD: {"mood": "happy/sad/neutral", "note": "简短描述"}
+  * DIET: {"food_name": "食物名", "calories": 数值}
+  * SLEEP: {"duration_hours": 数值, "quality": "good/fair/poor"}
+- reply_text: 给用户的一句话回复（中文，温暖有洞察力，不要说"分享"、"照片"等词汇除非确实有图片）
+- tags: 相关标签数组，格式为 "#类别/标签名"
+
+示例（纯文字输入"今天心情不错"）：
+{
+    "category": "MOOD",
+    "meta_data": {"mood": "happy"},
+    "reply_text": "好心情是一天的好开始，继续保持！",
+    "tags": ["#心情/开心", "#时间/上午"]
+}"""
+
+# 系统消息（所有请求共用同一个对象）
+_SYSTEM_MESSAGE = {"role": "system", "content": PARSE_SYSTEM_PROMPT}
+
+# 修复不合法输出用的系统消息（只做格式整理，不重新分析输入）
+_REPAIR_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "把用户给出的内容修复为符合以下 JSON Schema 的 JSON 对象，只输出 JSON。"
+        "尽量保留原有信息；category 不在枚举内时选最接近的一项，缺少的必填字段根据已有内容补全。\n"
+        + orjson.dumps(ParseResult.model_json_schema()).decode()
+    ),
+}
+
+# OpenAI 提示词缓存路由键（其他提供商不支持该参数）
+_PROMPT_CACHE_BODY = {"prompt_cache_key": "ai_parser_v1"}
+
+# 本地解析的关键词规则（按优先级排列）：分类、预编译的关键词匹配、回复、默认标签、meta_data 中存放原文的字段
+_MOCK_RULES = tuple(
+    (category, re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE), reply_text, tags, note_field)
+    for category, keywords, reply_text, tags, note_field in (
+        ("SLEEP", ("睡", "起床", "醒", "sleep"), "睡眠记录已保存。", ("#身体/睡眠",), "note"),
+        ("DIET", ("吃", "喝", "咖啡", "奶茶", "饭"), "饮食记录已保存。", ("#饮食/进食",), "food_name"),
+        ("ACTIVITY", ("运动", "跑", "健身", "走"), "运动记录已保存，继续保持！", ("#身体/运动",), "activity"),
+        ("MOOD", ("心情", "开心", "难过", "烦"), "情绪已记录。", ("#心情/记录",), "note"),
+    )
+)
+
+# 带分类提示的短文本直接本地生成结果，不调用模型；只覆盖关键词规则中有模板的分类，其余仍交给模型
+FAST_PATH_MAX_LEN = 20
+_FAST_PATH_TEMPLATES = {
+    category: (reply_text, tags, note_field)
+    for category, _, reply_text, tags, note_field in _MOCK_RULES
+}
+
+
+# 当前分钟的格式化时间缓存 (分钟序号, 文本)
+_minute_cache: Tuple[int, str] = (-1, "")
+
+
+def _current_minute() -> str:
+    """当前时间（精确到分钟），同一分钟内复用格式化结果"""
+    global _minute_cache
+    minute = int(time.time() // 60)
+    if minute != _minute_cache[0]:
+        _minute_cache = (minute, datetime.fromtimestamp(minute * 60).strftime("%Y-%m-%d %H:%M"))
+    return _minute_cache[1]
+
+
+class ParseCoalescer:
+    """纯文字解析请求合并器
+    
+    在很短的时间窗口内收集纯文字输入，合并为一次调用让模型逐条输出结果，
+    再分发回各调用方；合并结果不可用时逐条单独解析。带图片的输入不经过合并。
+    """
+    
+    WINDOW = 0.05    # 合并窗口（秒）
+    MAX_BATCH = 16   # 单次调用最多合并的条数
+    
+    def __init__(self, parser: "AIParser"):
+        self._parser = parser
+        self._pending: List[tuple] = []
+    
+    async def submit(self, text: str, category_hint: Optional[str], record_id: Optional[str]) -> Dict[str, Any]:
+        """提交一条纯文字输入，等待其解析结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, category_hint, record_id, future))
+        if len(self._pending) == 1:
+            asyncio.create_task(self._flush_later())
+        return await future
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.WINDOW)
+        # 调用方已取消的请求不再发送
+        batch = [item for item in self._pending if not item[3].done()]
+        self._pending = []
+        await asyncio.gather(*(
+            self._run(batch[start:start + self.MAX_BATCH])
+            for start in range(0, len(batch), self.MAX_BATCH)
+        ))
+    
+    async def _run(self, batch: List[tuple]):
+        if len(batch) > 1:
+            try:
+                results = await self._parser._openai_parse_batch(
+                    [(text, category_hint) for text, category_hint, _, _ in batch]
+                )
+            except Exception as e:
+                logger.warning(f"合并解析失败，改为逐条解析: {e}")
+            else:
+                for (_, _, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+        
+        await asyncio.gather(*(self._run_single(*item) for item in batch))
+    
+    async def _run_single(self, text, category_hint, record_id, future):
+        try:
+            result = await self._parser._openai_parse(text, None, category_hint, record_id)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
 
 class AIParser:
     """AI 解析服务 - 根据输入类型选择模型"""
     
     def __init__(self):
-        api_key = settings.get_ai_api_key()
-        base_url = settings.get_ai_base_url()
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        self.client = get_openai_client()
         self.vision_model = settings.vision_model   # 有图像时用视觉模型
         self.text_model = settings.text_model       # 纯文本用便宜模型
+        self._coalescer = ParseCoalescer(self)
+        self._cache: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self.fast_path_count = 0  # 快速路径命中次数（便于离线核对准确率）
     
     async def parse(
         self,
@@ -26,6 +186,8 @@ class AIParser:
         image_base64: Optional[str] = None,
         category_hint: Optional[str] = None,
         record_id: Optional[str] = None,
+        image_url: Optional[str] = None,
+        image_detail: str = "auto",
     ) -> Dict[str, Any]:
         """
         解析用户输入，提取结构化数据
@@ -35,121 +197,309 @@ class AIParser:
             image_base64: Base64 编码的图片
             category_hint: 分类提示
             record_id: 关联的记录 ID（用于 token 追踪）
+            image_url: 可公开访问的图片地址，提供时优先使用（请求体不再携带图片数据）
+            image_detail: 图片精度 (auto/low/high)，缩略图用 low 可减少图片 Token
             
         Returns:
             包含 category, meta_data, reply_text 的字典
         """
+        if image_base64 and not image_url:
+            image_url = f"data:image/jpeg;base64,{image_base64}"
+        
         if not self.client:
             # 如果没有配置 API Key，返回模拟数据
-            return self._mock_parse(text, image_base64, category_hint)
+            return self._mock_parse(text, image_url, category_hint)
+        
+        if category_hint and text and not image_url and len(text) < FAST_PATH_MAX_LEN:
+            result = self._fast_parse(text, category_hint)
+            if result is not None:
+                return result
         
         try:
-            return await self._openai_parse(text, image_base64, category_hint, record_id)
+            result = await self._cached_parse(text, image_url, category_hint, record_id, image_detail)
+            # 缓存中的结果可能被多个调用方使用，返回副本
+            return copy.deepcopy(result)
         except Exception as e:
             logger.error(f"AI 解析错误: {e}")
-            return self._mock_parse(text, image_base64, category_hint)
+            return self._mock_parse(text, image_url, category_hint)
+    
+    async def parse_stream(
+        self,
+        text: Optional[str] = None,
+        image_base64: Optional[str] = None,
+        category_hint: Optional[str] = None,
+        record_id: Optional[str] = None,
+        image_url: Optional[str] = None,
+        image_detail: str = "auto",
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式解析：先逐步产出 {"partial": 已生成的 reply_text}，最后产出 {"result": 完整结果}
+        
+        参数同 parse；不经过缓存和合并，解析失败时最终结果为本地解析。
+        """
+        if image_base64 and not image_url:
+            image_url = f"data:image/jpeg;base64,{image_base64}"
+        
+        if not self.client:
+            yield {"result": self._mock_parse(text, image_url, category_hint)}
+            return
+        
+        messages, model, max_tokens = self._build_request(text, image_url, category_hint, image_detail)
+        content = ""
+        last_partial = None
+        usage = None
+        try:
+            async with _concurrency_limiter.slot(model) as actual_model:
+                stream = await self.client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.2,
+                    response_format={"type": "json_object"},
+                    extra_body=_PROMPT_CACHE_BODY if settings.ai_provider == "openai" else None,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    content += chunk.choices[0].delta.content
+                    partial = partial_reply_text(content)
+                    if partial and partial != last_partial:
+                        last_partial = partial
+                        yield {"partial": partial}
+            
+            if usage:
+                try:
+                    record_usage(
+                        model=actual_model,
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        task_type="parse_input",
+                        task_description=f"Parse(stream): {(text or 'image')[:50]}",
+                        related_record_id=record_id
+                    )
+                except Exception as e:
+                    logger.warning(f"Token 记录失败: {e}")
+            
+            result = ParseResult.model_validate_json(content).model_dump()
+        except Exception as e:
+            logger.error(f"AI 流式解析错误: {e}")
+            result = self._mock_parse(text, image_url, category_hint)
+        
+        yield {"result": result}
+    
+    async def _cached_parse(
+        self,
+        text: Optional[str],
+        image_url: Optional[str],
+        category_hint: Optional[str],
+        record_id: Optional[str],
+        image_detail: str,
+    ) -> Dict[str, Any]:
+        """相同输入命中缓存直接返回；正在解析中的相同输入等待同一个结果"""
+        model = self.vision_model if image_url else self.text_model
+        key = hashlib.blake2b(
+            "\x00".join((model, category_hint or "", image_detail, text or "", image_url or "")).encode(),
+            digest_size=16,
+        ).digest()
+        
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                return result
+            del self._cache[key]
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        # 没有其他等待方时也要取走异常，避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            if text and not image_url:
+                result = await self._coalescer.submit(text, category_hint, record_id)
+            else:
+                result = await self._openai_parse(text, image_url, category_hint, record_id, image_detail)
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+        
+        self._cache[key] = (time.monotonic() + PARSE_CACHE_TTL, result)
+        if len(self._cache) > PARSE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
     
     async def _openai_parse(
         self,
         text: Optional[str],
-        image_base64: Optional[str],
+        image_url: Optional[str],
         category_hint: Optional[str],
         record_id: Optional[str] = None,
+        image_detail: str = "auto",
     ) -> Dict[str, Any]:
         """使用 OpenAI GPT-4o Vision 进行解析"""
+        messages, model, max_tokens = self._build_request(text, image_url, category_hint, image_detail)
         
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-        
-        # 根据是否有图像调整 prompt
-        has_image = image_base64 is not None
+        task_description = f"Parse: {text[:50] if text else 'image'}..." if text and len(text) > 50 else text or "image"
+        content = await self._complete(messages, model, max_tokens, task_description, record_id)
         
-        system_prompt = f"""你是 Vibing u 的首席分析师。你冷静、客观，但极具洞察力。
-你的目标是通过数据帮助用户达到 "High Vibe" 状态。
-
-【重要】本次输入{"包含图片" if has_image else "仅有文字，没有图片"}。请严格基于实际输入内容分析，不要臆测不存在的内容。
-
-你的任务是：
-1. 从用户的{"图片和文字" if has_image else "文字描述"}中提取结构化数据
-2. 判断输入属于哪个分类
-3. 用简短、温暖的语言给出回复（不要重复用户说的话）
-4. 为内容生成相关的标签 (tags)
-
-分类枚举：SLEEP（睡眠）, DIET（饮食）, SCREEN（屏幕时间）, ACTIVITY（活动）, MOOD（情绪）, GROWTH（成长/学习）, SOCIAL（社交）, LEISURE（休闲）
-
-请以 JSON 格式输出，包含以下字段：
-- category: 分类（上述枚举之一）
-- meta_data: 提取的结构化数据，只包含有意义的字段，比如：
-  * MOOD: {{"mood": "happy/sad/neutral", "note": "简短描述"}}
-  * DIET: {{"food_name": "食物名", "calories": 数值}}
-  * SLEEP: {{"duration_hours": 数值, "quality": "good/fair/poor"}}
-- reply_text: 给用户的一句话回复（中文，温暖有洞察力，不要说"分享"、"照片"等词汇除非确实有图片）
-- tags: 相关标签数组，格式为 "#类别/标签名"
-
-示例（纯文字输入"今天心情不错"）：
-{{
-    "category": "MOOD",
-    "meta_data": {{"mood": "happy"}},
-    "reply_text": "好心情是一天的好开始，继续保持！",
-    "tags": ["#心情/开心", "#时间/上午"]
-}}"""
-
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
+        # 直接按结构校验；不完整或字段不合法时只让文本模型整理格式，不重新分析整条输入
+        try:
+            return ParseResult.model_validate_json(content).model_dump()
+        except ValidationError as e:
+            logger.warning(f"AI 解析结果不符合结构，尝试修复: {e.error_count()} 处错误")
         
-        # 构建用户消息
-        user_content = []
+        repaired = await self._complete(
+            [_REPAIR_SYSTEM_MESSAGE, {"role": "user", "content": content}],
+            self.text_model,
+            PARSE_REPAIR_MAX_TOKENS,
+            f"Repair: {task_description}",
+            record_id,
+        )
+        return ParseResult.model_validate_json(repaired).model_dump()
+    
+    def _build_request(
+        self,
+        text: Optional[str],
+        image_url: Optional[str],
+        category_hint: Optional[str],
+        image_detail: str,
+    ) -> Tuple[List[Dict[str, Any]], str, int]:
+        """构建单条解析的消息，返回 (messages, 模型, max_tokens)"""
+        current_time = _current_minute()
+        has_image = image_url is not None
         
-        prompt_text = f"当前时间: {current_time}\n"
+        # 构建用户消息：随请求变化的内容放在这里，系统提示保持逐字节不变以命中提示词缓存
+        prompt_parts = [
+            f"【重要】本次输入{'包含图片' if has_image else '仅有文字，没有图片'}。\n",
+            f"当前时间: {current_time}\n",
+        ]
         if category_hint:
-            prompt_text += f"用户提示这是关于: {category_hint}\n"
+            prompt_parts.append(f"用户提示这是关于: {category_hint}\n")
         if text:
-            prompt_text += f"用户输入: {text}\n"
+            prompt_parts.append(f"用户输入: {text}\n")
         
-        user_content.append({"type": "text", "text": prompt_text or "请分析这张图片"})
+        user_content = [{"type": "text", "text": "".join(prompt_parts)}]
         
-        if image_base64:
+        if image_url:
             user_content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_base64}",
-                    "detail": "auto"
+                    "url": image_url,
+                    "detail": image_detail
                 }
             })
         
-        messages.append({"role": "user", "content": user_content})
+        messages = [_SYSTEM_MESSAGE, {"role": "user", "content": user_content}]
         
         # 根据是否有图像选择模型
-        model = self.vision_model if image_base64 else self.text_model
+        model = self.vision_model if image_url else self.text_model
+        if image_url:
+            max_tokens = PARSE_MAX_TOKENS_IMAGE
+        elif category_hint:
+            max_tokens = PARSE_MAX_TOKENS_HINTED
+        else:
+            max_tokens = PARSE_MAX_TOKENS_TEXT
+        return messages, model, max_tokens
+    
+    async def _openai_parse_batch(self, inputs: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+        """一次调用解析多条相互独立的纯文字输入，结果按输入顺序返回"""
+        current_time = _current_minute()
+        lines = [
+            f"【重要】本次为 {len(inputs)} 条相互独立的纯文字输入，没有图片。",
+            f"当前时间: {current_time}",
+            '请逐条分析，输出 {"results": [...]}，数组按序号顺序排列，每个元素的字段与单条输出相同。',
+            "",
+        ]
+        for index, (text, category_hint) in enumerate(inputs, 1):
+            hint = f"（用户提示这是关于: {category_hint}）" if category_hint else ""
+            lines.append(f"{index}. {hint}用户输入: {text}")
         
-        response = await self.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=3000,
-            response_format={"type": "json_object"},
+        messages = [
+            _SYSTEM_MESSAGE,
+            {"role": "user", "content": "\n".join(lines)},
+        ]
+        content = await self._complete(
+            messages,
+            self.text_model,
+            PARSE_MAX_TOKENS_TEXT * len(inputs),
+            f"Batch parse: {len(inputs)} 条",
         )
         
+        results = ParseBatchResult.model_validate_json(content).results
+        if len(results) != len(inputs):
+            raise ValueError(f"合并解析结果数量不符: {len(results)}/{len(inputs)}")
+        return [result.model_dump() for result in results]
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        max_tokens: int,
+        task_description: str,
+        record_id: Optional[str] = None,
+    ) -> str:
+        """发送一次 JSON 模式的补全请求并记录 Token，返回原始内容"""
+        # 与其他 AI 调用共用按模型的并发控制，突发请求排队而不是集中触发限流
+        async with _concurrency_limiter.slot(model) as actual_model:
+            response = await self.client.chat.completions.create(
+                model=actual_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.2,
+                response_format={"type": "json_object"},
+                extra_body=_PROMPT_CACHE_BODY if settings.ai_provider == "openai" else None,
+            )
+        
         # 记录 Token 使用
         if response.usage:
             try:
                 record_usage(
-                    model=model,
+                    model=actual_model,
                     prompt_tokens=response.usage.prompt_tokens,
                     completion_tokens=response.usage.completion_tokens,
                     task_type="parse_input",
-                    task_description=f"Parse: {text[:50] if text else 'image'}..." if text and len(text) > 50 else text or "image",
+                    task_description=task_description,
                     related_record_id=record_id
                 )
             except Exception as e:
                 logger.warning(f"Token 记录失败: {e}")
         
-        result_text = response.choices[0].message.content
-        return json.loads(result_text)
+        return response.choices[0].message.content or ""
+    
+    def _fast_parse(self, text: str, category_hint: str) -> Optional[Dict[str, Any]]:
+        """已知分类的短文本套用本地模板；分类没有模板时返回 None 交给模型"""
+        category = category_hint.upper()
+        template = _FAST_PATH_TEMPLATES.get(category)
+        if template is None:
+            return None
+        reply_text, tags, note_field = template
+        self.fast_path_count += 1
+        logger.info(f"[快速解析] 跳过 AI 调用: category={category}, 累计 {self.fast_path_count} 次")
+        return {
+            "category": category,
+            "meta_data": {note_field: text},
+            "reply_text": reply_text,
+            "tags": list(tags),
+        }
     
     def _mock_parse(
         self,
         text: Optional[str],
-        image_base64: Optional[str],
+        image_url: Optional[str],
         category_hint: Optional[str],
     ) -> Dict[str, Any]:
         """模拟解析（用于测试或 API Key 未配置时）"""
@@ -162,25 +512,14 @@ class AIParser:
         if category_hint:
             category = category_hint.upper()
         elif text:
-            text_lower = text.lower()
-            if any(word in text_lower for word in ["睡", "起床", "醒", "sleep"]):
-                category = "SLEEP"
-                meta_data = {"note": text}
-                reply_text = "睡眠记录已保存。"
-            elif any(word in text_lower for word in ["吃", "喝", "咖啡", "奶茶", "饭"]):
-                category = "DIET"
-                meta_data = {"note": text}
-                reply_text = "饮食记录已保存。"
-            elif any(word in text_lower for word in ["运动", "跑", "健身", "走"]):
-                category = "ACTIVITY"
-                meta_data = {"note": text}
-                reply_text = "运动记录已保存，继续保持！"
-            elif any(word in text_lower for word in ["心情", "开心", "难过", "烦"]):
-                category = "MOOD"
-                meta_data = {"note": text}
-                reply_text = "情绪已记录。"
-        
-        if image_base64:
+            for rule_category, pattern, rule_reply, _, _ in _MOCK_RULES:
+                if pattern.search(text):
+                    category = rule_category
+                    meta_data = {"note": text}
+                    reply_text = rule_reply
+                    break
+        
+        if image_url:
             meta_data["has_image"] = True
             if not category_hint:
                 reply_text = "图片已记录，AI 解析功能需要配置 OpenAI API Key。"
@@ -3,33 +3,186 @@
 所有回答通过 LLM 生成，数据库查询结果 + RAG 检索结果作为上下文。
 支持多轮对话历史。
 """
-import json
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional, AsyncGenerator
+import math
+import operator
+import re
+import time
+from typing import Dict, Any, Callable, List, Optional, AsyncGenerator, Tuple
 from datetime import datetime, timedelta
 from collections import defaultdict
-from openai import AsyncOpenAI
+import orjson
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, bindparam, case, func, select
 
 from app.database import SessionLocal
-from app.models import LifeStream
+from app.models import LifeStream, DailySummary
 from app.config import get_settings
+from app.services.ai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 系统提示保持逐字节不变以命中提示词缓存，当前时间等可变内容放在用户消息中
+CHAT_SYSTEM_PROMPT = """你是 Vibing u 的 AI 生活助手。
+
+规则: 基于数据回答，Markdown格式，含emoji，简洁有洞察，中文回答，不编造数据。"""
+
+# 发给 LLM 的对话历史：最多条数、每条最多字数（调用方只需读取这么多）
+HISTORY_TURNS = 3
+HISTORY_MAX_CHARS = 300
+
+# 统计上下文缓存有效期（秒）；数据变化时通过指纹立即失效
+_CONTEXT_CACHE_TTL = 300
+
+# 消息关键词 → 补充的统计上下文（按输出顺序排列）
+_CONTEXT_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("today", ("今天", "今日", "today")),
+    ("week", ("本周", "这周", "这一周", "最近一周", "week")),
+    ("month", ("本月", "这个月", "month")),
+    ("sleep", ("睡眠", "睡觉", "休息", "作息", "sleep")),
+    ("mood", ("心情", "情绪", "心态", "感觉", "mood")),
+    ("activity", ("运动", "锻炼", "健身", "活动", "exercise")),
+    ("trend", ("趋势", "变化", "trend")),
+    ("best_day", ("最好", "最佳", "最高", "best")),
+    ("worst_day", ("最差", "最低", "worst")),
+)
+_KEYWORD_CONTEXT = {kw: key for key, kws in _CONTEXT_KEYWORDS for kw in kws}
+# 所有关键词编译为一个正则，一次扫描消息；前瞻匹配保证重叠的关键词也都能命中
+_CONTEXT_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(map(re.escape, sorted(_KEYWORD_CONTEXT, key=len, reverse=True))) + "))"
+)
+
+# 语义回答缓存：问题向量余弦相似度阈值、有效期（秒）、最多保留条数
+_RESPONSE_CACHE_THRESHOLD = 0.92
+_RESPONSE_CACHE_TTL = 300
+_RESPONSE_CACHE_SIZE = 256
+# 问的是其他日期（昨天、前天、上周…）时不走语义缓存：措辞相近但所指日期不同，向量难以区分
+_RELATIVE_DAY_RE = re.compile(
+    r"昨[天日晚]|前[天日]|明[天日]|后天|上周|上个?月|去年|[\d一二两三四五六七八九十几]+\s*天前"
+)
+
+# 流式输出的 SSE 帧：orjson 直接编码为 UTF-8 bytes，固定帧只编码一次
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+
+def _sse(payload: Dict[str, Any]) -> bytes:
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+
+_THINKING_FRAME = _sse({"content": "", "done": False, "thinking": True})
+_DONE_FRAME = _sse({"content": "", "done": True})
+
+# 趋势条形图：0~10 格，按分数十位取用
+_BARS = tuple("█" * i + "░" * (10 - i) for i in range(11))
+
+# 每条消息都会执行的统计查询，模块级构建一次，调用时只绑定参数
+_ACTIVE_SINCE = (LifeStream.is_deleted == False, LifeStream.created_at >= bindparam("start"))
+# 按天统计直接读取写入时维护的 daily_summary 汇总行（每天一行，无需扫描 life_stream）
+_DAILY_ROLLUP_QUERY = (
+    select(DailySummary.date, DailySummary.record_count, DailySummary.score_sum, DailySummary.scored_count)
+    .where(DailySummary.date >= bindparam("start_day"), DailySummary.record_count > 0)
+    .order_by(DailySummary.date)
+)
+_CATEGORY_STATS_QUERY = (
+    select(LifeStream.category, func.count(), func.avg(LifeStream.avg_score))
+    .where(*_ACTIVE_SINCE)
+    .group_by(LifeStream.category)
+    .order_by(func.count().desc())
+)
+# 本周 / 本月 / 趋势 / 最佳最差日共用的按天统计窗口（天数），一次构建内只查询一次
+_DAILY_WINDOW_DAYS = 30
+_DAILY_WINDOW_KEY = "chat_daily_window"
+_FINGERPRINT_QUERY = select(
+    func.count(LifeStream.id),
+    select(func.max(DailySummary.updated_at)).scalar_subquery(),
+)
+
+
+class SemanticResponseCache:
+    """语义回答缓存
+
+    换种说法问同一个问题（"今天怎么样" / "今天过得如何"）时直接复用回答。
+    只在数据上下文、RAG 检索结果和日期都一致时才比较向量，数据变化后旧回答自然不会命中。
+    """
+
+    def __init__(
+        self,
+        threshold: float = _RESPONSE_CACHE_THRESHOLD,
+        ttl: float = _RESPONSE_CACHE_TTL,
+        max_entries: int = _RESPONSE_CACHE_SIZE,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # {数据上下文哈希: [(单位向量, 过期时间, 回答)]}
+        self._entries: Dict[str, List[Tuple[List[float], float, str]]] = {}
+        self._size = 0
+
+    @staticmethod
+    def context_key(db_context: str, rag_context: str) -> str:
+        h = hashlib.sha256(datetime.now().date().isoformat().encode())
+        h.update(db_context.encode("utf-8"))
+        h.update(b"\0")
+        h.update(rag_context.encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[List[float]]:
+        norm = math.sqrt(sum(v * v for v in embedding))
+        return [v / norm for v in embedding] if norm else None
+
+    def get(self, embedding: List[float], context_key: str) -> Optional[str]:
+        """返回相似度达到阈值的最相近回答"""
+        candidates = self._entries.get(context_key)
+        vec = self._normalize(embedding)
+        if not candidates or vec is None:
+            return None
+        now = time.monotonic()
+        best, best_score = None, self.threshold
+        for cached_vec, expires, answer in candidates:
+            if expires <= now:
+                continue
+            score = sum(map(operator.mul, vec, cached_vec))
+            if score >= best_score:
+                best, best_score = answer, score
+        return best
+
+    def set(self, embedding: List[float], context_key: str, answer: str) -> None:
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+        now = time.monotonic()
+        if self._size >= self.max_entries:
+            self._evict(now)
+        self._entries.setdefault(context_key, []).append((vec, now + self.ttl, answer))
+        self._size += 1
+
+    def _evict(self, now: float) -> None:
+        """清理过期条目；有效期内写满时整体清空"""
+        self._entries = {
+            key: live for key, entries in self._entries.items()
+            if (live := [e for e in entries if e[1] > now])
+        }
+        self._size = sum(map(len, self._entries.values()))
+        if self._size >= self.max_entries:
+            self._entries.clear()
+            self._size = 0
+
 
 class ChatAssistant:
     """对话式 AI 助手（LLM 驱动）"""
 
     def __init__(self):
-        self.db: Session = SessionLocal()
         self._rag_service = None
-        api_key = settings.get_ai_api_key()
-        base_url = settings.get_ai_base_url()
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        self.client = get_openai_client()
         self.model = settings.smart_model  # glm-4.7
+        # 统计上下文缓存: {key: (数据指纹, 过期时间, 文本)}
+        self._context_cache: Dict[str, Tuple[tuple, float, str]] = {}
+        self._response_cache = SemanticResponseCache()
 
     @property
     def rag_service(self):
@@ -42,9 +195,8 @@ class ChatAssistant:
                 logger.warning(f"RAG 服务加载失败: {e}")
         return self._rag_service
 
-    def __del__(self):
-        if hasattr(self, 'db'):
-            self.db.close()
+    def _get_db(self) -> Session:
+        return SessionLocal()
 
     # =====================================================
     # 公共入口
@@ -66,30 +218,28 @@ class ChatAssistant:
         if not self.client:
             return self._fallback_no_ai(message)
 
+        db_context = None
         try:
-            # 1) 数据库结构化上下文
-            db_context = self._gather_db_context(message)
+            # 1) 数据库结构化上下文 + 2) RAG 语义检索上下文（互不依赖，在线程中并行执行）
+            db_context, rag_context = await self._gather_contexts(message)
 
-            # 2) RAG 语义检索上下文
-            rag_context = self._gather_rag_context(message)
+            # 无对话历史时，语义相近且数据未变的问题直接复用回答
+            has_history = bool(history and len(history) > 0)
+            cache_key = SemanticResponseCache.context_key(db_context, rag_context)
+            embedding = await self._cache_embedding(message, has_history)
+            if embedding:
+                cached = self._response_cache.get(embedding, cache_key)
+                if cached:
+                    logger.info("AI 助手命中语义缓存")
+                    return {"type": "markdown", "content": cached}
 
             # 3) 构建 LLM 消息（system prompt 精简，数据放入 user message）
-            has_history = bool(history and len(history) > 0)
-            system_prompt = self._build_system_prompt(db_context, rag_context)
             user_prompt = self._build_user_prompt(message, db_context, rag_context, has_history=has_history)
-            messages = [{"role": "system", "content": system_prompt}]
+            messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
 
             # 加入对话历史（最多保留 3 轮，节省 token）
             if history:
-                # 截断每条历史消息长度
-                for msg in history[-3:]:
-                    content = msg.get("content", "")
-                    if len(content) > 300:
-                        content = content[:300] + "..."
-                    messages.append({
-                        "role": msg.get("role", "user"),
-                        "content": content,
-                    })
+                messages.extend(self._history_messages(history))
 
             messages.append({"role": "user", "content": user_prompt})
 
@@ -101,7 +251,7 @@ class ChatAssistant:
             acquired, actual_model = await _concurrency_limiter.acquire_with_upgrade(self.model, timeout=90.0)
             if not acquired:
                 logger.warning(f"模型 {self.model} 并发已满")
-                return self._fallback_db_only(message)
+                return self._fallback_db_only(message, db_context)
             
             try:
                 response = await self.client.chat.completions.create(
@@ -121,15 +271,17 @@ class ChatAssistant:
 
             if not answer or not answer.strip():
                 logger.warning(f"LLM 返回空内容 (finish_reason={finish_reason})，尝试降级")
-                return self._fallback_db_only(message)
+                return self._fallback_db_only(message, db_context)
 
             logger.info(f"AI 助手回复成功, 长度={len(answer)}")
+            if embedding:
+                self._response_cache.set(embedding, cache_key, answer)
             return {"type": "markdown", "content": answer}
 
         except Exception as e:
             logger.error(f"AI 助手生成回答失败: {e}", exc_info=True)
-            # 降级到纯数据库查询回答
-            return self._fallback_db_only(message)
+            # 降级到纯数据库查询回答（已查询过的上下文直接复用）
+            return self._fallback_db_only(message, db_context)
 
     # =====================================================
     # 流式输出
@@ -142,36 +294,40 @@ class ChatAssistant:
     ):
         """
         流式处理用户消息，逐 token yield。
-        每次 yield 一个 SSE 格式的 data chunk。
+        每次 yield 一个 SSE 格式的 data chunk（UTF-8 编码的 bytes）。
         """
         if not self.client:
-            yield f"data: {json.dumps({'content': '⚠️ AI 服务未配置', 'done': True}, ensure_ascii=False)}\n\n"
+            yield _sse({'content': '⚠️ AI 服务未配置', 'done': True})
             return
 
         try:
-            import json as _json
+            # 先推送一个空的"思考中"帧，让客户端在准备上下文期间就收到首字节
+            yield _THINKING_FRAME
 
-            db_context = self._gather_db_context(message)
-            rag_context = self._gather_rag_context(message)
+            db_context, rag_context = await self._gather_contexts(message)
 
             has_history = bool(history and len(history) > 0)
-            system_prompt = self._build_system_prompt(db_context, rag_context)
+            cache_key = SemanticResponseCache.context_key(db_context, rag_context)
+            embedding = await self._cache_embedding(message, has_history)
+            if embedding:
+                cached = self._response_cache.get(embedding, cache_key)
+                if cached:
+                    yield _sse({'content': cached, 'done': False})
+                    yield _DONE_FRAME
+                    return
+
             user_prompt = self._build_user_prompt(message, db_context, rag_context, has_history=has_history)
-            messages = [{"role": "system", "content": system_prompt}]
+            messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
 
             if history:
-                for msg in history[-3:]:
-                    content = msg.get("content", "")
-                    if len(content) > 300:
-                        content = content[:300] + "..."
-                    messages.append({"role": msg.get("role", "user"), "content": content})
+                messages.extend(self._history_messages(history))
 
             messages.append({"role": "user", "content": user_prompt})
 
             from app.services.ai_client import _concurrency_limiter
             acquired, actual_model = await _concurrency_limiter.acquire_with_upgrade(self.model, timeout=90.0)
             if not acquired:
-                yield f"data: {_json.dumps({'content': 'AI 模型繁忙，请稍后重试', 'done': True}, ensure_ascii=False)}\n\n"
+                yield _sse({'content': 'AI 模型繁忙，请稍后重试', 'done': True})
                 return
 
             try:
@@ -183,70 +339,103 @@ class ChatAssistant:
                     stream=True,
                 )
 
+                tokens = []
                 async for chunk in stream:
                     if chunk.choices and chunk.choices[0].delta.content:
                         token = chunk.choices[0].delta.content
-                        yield f"data: {_json.dumps({'content': token, 'done': False}, ensure_ascii=False)}\n\n"
+                        tokens.append(token)
+                        yield _sse({'content': token, 'done': False})
+
+                answer = "".join(tokens)
+                if embedding and answer.strip():
+                    self._response_cache.set(embedding, cache_key, answer)
 
                 # 发送结束标记
-                yield f"data: {_json.dumps({'content': '', 'done': True}, ensure_ascii=False)}\n\n"
+                yield _DONE_FRAME
 
             finally:
                 _concurrency_limiter.release(actual_model)
 
         except Exception as e:
-            import json as _json
             logger.error(f"流式回复失败: {e}")
-            yield f"data: {_json.dumps({'content': f'回复出错: {str(e)}', 'done': True}, ensure_ascii=False)}\n\n"
+            yield _sse({'content': f'回复出错: {str(e)}', 'done': True})
 
     # =====================================================
     # 上下文构建
     # =====================================================
 
+    async def _gather_contexts(self, message: str) -> Tuple[str, str]:
+        """并行获取数据库统计上下文和 RAG 检索上下文（均为同步 IO，放到线程中不阻塞事件循环）"""
+        db_context, rag_context = await asyncio.gather(
+            asyncio.to_thread(self._gather_db_context, message),
+            asyncio.to_thread(self._gather_rag_context, message),
+        )
+        return db_context, rag_context
+
+    async def _cache_embedding(self, message: str, has_history: bool) -> Optional[List[float]]:
+        """语义缓存用的问题向量；有对话历史或问的是其他日期时不缓存，返回 None"""
+        if has_history or _RELATIVE_DAY_RE.search(message):
+            return None
+        return await asyncio.to_thread(self._embed_message, message)
+
+    def _embed_message(self, message: str) -> Optional[List[float]]:
+        """问题向量（复用 RAG 服务的嵌入模型），RAG 不可用时返回 None"""
+        if not self.rag_service:
+            return None
+        return self.rag_service.get_query_embedding(message)
+
     def _gather_db_context(self, message: str) -> str:
         """根据消息关键词从数据库获取结构化统计数据"""
-        parts: List[str] = []
-        msg = message.lower()
-
-        # --- 总是提供基础概览 ---
-        parts.append(self._get_overview_context())
-
-        # --- 按关键词补充详细上下文 ---
-        if any(kw in msg for kw in ["今天", "今日", "today"]):
-            parts.append(self._get_today_context())
-
-        if any(kw in msg for kw in ["本周", "这周", "这一周", "最近一周", "week"]):
-            parts.append(self._get_week_context())
+        # 每次查询使用独立会话，用完立即归还连接
+        with self._get_db() as db:
+            return self._build_db_context(db, message.lower())
 
-        if any(kw in msg for kw in ["本月", "这个月", "month"]):
-            parts.append(self._get_month_context())
-
-        if any(kw in msg for kw in ["睡眠", "睡觉", "休息", "作息", "sleep"]):
-            parts.append(self._get_sleep_context())
-
-        if any(kw in msg for kw in ["心情", "情绪", "心态", "感觉", "mood"]):
-            parts.append(self._get_mood_context())
+    def _build_db_context(self, db: Session, msg: str) -> str:
+        # 构建期间在会话上暂存按天统计窗口，多个上下文共用一次查询
+        db.info[_DAILY_WINDOW_KEY] = None
+        try:
+            return self._build_db_context_parts(db, msg)
+        finally:
+            db.info.pop(_DAILY_WINDOW_KEY, None)
 
-        if any(kw in msg for kw in ["运动", "锻炼", "健身", "活动", "exercise"]):
-            parts.append(self._get_activity_context())
+    def _build_db_context_parts(self, db: Session, msg: str) -> str:
+        parts: List[str] = []
+        fingerprint = self._data_fingerprint(db)
 
-        if any(kw in msg for kw in ["趋势", "变化", "trend"]):
-            parts.append(self._get_trend_context())
+        def cached(key: str, build: Callable[[Session], str]) -> str:
+            """同一数据指纹下复用已生成的统计文本"""
+            hit = self._context_cache.get(key)
+            if hit and hit[0] == fingerprint and hit[1] > time.monotonic():
+                return hit[2]
+            text = build(db)
+            self._context_cache[key] = (fingerprint, time.monotonic() + _CONTEXT_CACHE_TTL, text)
+            return text
 
-        if any(kw in msg for kw in ["最好", "最佳", "最高", "best"]):
-            parts.append(self._get_best_day_context())
+        # --- 总是提供基础概览 ---
+        parts.append(cached("overview", self._get_overview_context))
 
-        if any(kw in msg for kw in ["最差", "最低", "worst"]):
-            parts.append(self._get_worst_day_context())
+        # --- 按关键词补充详细上下文 ---
+        wanted = {_KEYWORD_CONTEXT[m.group(1)] for m in _CONTEXT_KEYWORD_RE.finditer(msg)}
+        for key, _ in _CONTEXT_KEYWORDS:
+            if key in wanted:
+                parts.append(cached(key, getattr(self, f"_get_{key}_context")))
 
         return "\n\n".join(p for p in parts if p)
 
+    def _data_fingerprint(self, db: Session) -> tuple:
+        """数据指纹：记录写入会刷新 daily_summary.updated_at，日期变化也会使缓存失效"""
+        count, last_update = db.execute(_FINGERPRINT_QUERY).one()
+        return (datetime.now().date(), count, last_update)
+
     def _gather_rag_context(self, message: str) -> str:
         """通过 RAG 语义检索相关记录"""
         if not self.rag_service:
             return ""
         try:
-            results = self.rag_service.search(message, n_results=5)
+            embedding = self._embed_message(message)
+            if not embedding:
+                return ""
+            results = self.rag_service.search_by_vector(embedding, n_results=5)
             if not results:
                 return ""
             lines = []
@@ -259,12 +448,16 @@ class ChatAssistant:
             logger.warning(f"RAG 检索失败: {e}")
             return ""
 
-    def _build_system_prompt(self, db_context: str, rag_context: str) -> str:
-        now = datetime.now().strftime("%Y-%m-%d %H:%M %A")
-        prompt = f"""你是 Vibing u 的 AI 生活助手。当前: {now}
-
-规则: 基于数据回答，Markdown格式，含emoji，简洁有洞察，中文回答，不编造数据。"""
-        return prompt
+    @staticmethod
+    def _history_messages(history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """最近 HISTORY_TURNS 条历史消息，每条截断到 HISTORY_MAX_CHARS 字"""
+        messages = []
+        for msg in history[-HISTORY_TURNS:]:
+            content = msg.get("content", "")
+            if len(content) > HISTORY_MAX_CHARS:
+                content = content[:HISTORY_MAX_CHARS] + "..."
+            messages.append({"role": msg.get("role", "user"), "content": content})
+        return messages
 
     def _build_user_prompt(self, message: str, db_context: str, rag_context: str, has_history: bool = False) -> str:
         """将数据上下文放入 user message 而不是 system prompt，避免 token 超限"""
@@ -275,7 +468,8 @@ class ChatAssistant:
         db_ctx = db_context[:max_ctx] if len(db_context) > max_ctx else db_context
         rag_ctx = rag_context[:max_rag] if len(rag_context) > max_rag else rag_context
         
-        parts = [f"我的问题: {message}", "", "== 数据 ==", db_ctx]
+        now = datetime.now().strftime("%Y-%m-%d %H:%M %A")
+        parts = [f"当前: {now}", f"我的问题: {message}", "", "== 数据 ==", db_ctx]
         if rag_ctx:
             parts.extend(["", "== 相关记录 ==", rag_ctx])
         parts.append("\n请回答。")
@@ -285,215 +479,204 @@ class ChatAssistant:
     # 数据库查询 helpers
     # =====================================================
 
-    def _get_overview_context(self) -> str:
-        """基础概览"""
-        total = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False
-        ).count()
+    def _get_overview_context(self, db: Session) -> str:
+        """基础概览（总数、近 7 天数和各类别数由同一条 GROUP BY 查询得出，只读覆盖索引）"""
         week_start = datetime.now() - timedelta(days=7)
-        week_count = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= week_start,
-        ).count()
-
-        cats = self.db.query(
-            LifeStream.category, func.count(LifeStream.id)
-        ).filter(
-            LifeStream.is_deleted == False
-        ).group_by(LifeStream.category).all()
-
-        cat_str = ", ".join(f"{c}: {n}条" for c, n in cats if c)
+        cats = db.execute(
+            select(
+                LifeStream.category,
+                func.count(),
+                func.sum(case((LifeStream.created_at >= week_start, 1), else_=0)),
+            )
+            .where(LifeStream.is_deleted == False)
+            .group_by(LifeStream.category)
+        ).all()
+        total = sum(n for _, n, _ in cats)
+        week_count = sum(w or 0 for _, _, w in cats)
+
+        cat_str = ", ".join(f"{c}: {n}条" for c, n, _ in cats if c)
         return f"[概览] 总记录 {total} 条, 最近7天 {week_count} 条。各类别: {cat_str}"
 
-    def _get_today_context(self) -> str:
+    def _category_stats(self, db: Session, start: datetime) -> Tuple[Dict[str, Tuple[int, Optional[float]]], int]:
+        """按类别聚合记录数和平均状态分（单条 GROUP BY 查询，每个类别一行）
+
+        Returns:
+            ({类别: (记录数, 平均分或 None)}, 总记录数)，类别按记录数降序
+        """
+        rows = db.execute(_CATEGORY_STATS_QUERY, {"start": start}).all()
+        total = sum(n for _, n, _ in rows)
+        return {c: (n, avg) for c, n, avg in rows if c}, total
+
+    def _get_today_context(self, db: Session) -> str:
         today = datetime.now().date()
         start = datetime.combine(today, datetime.min.time())
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
+        cats, total = self._category_stats(db, start)
+        if not total:
             return "[今日] 今天还没有记录"
 
-        cats = defaultdict(int)
-        insights = []
-        for r in records:
-            if r.category:
-                cats[r.category] += 1
-            if r.ai_insight:
-                insights.append(f"  - [{r.category}] {r.ai_insight[:80]}")
+        insights = db.execute(
+            select(LifeStream.category, func.substr(LifeStream.ai_insight, 1, 80))
+            .where(
+                LifeStream.is_deleted == False,
+                LifeStream.created_at >= start,
+                LifeStream.ai_insight.isnot(None),
+                LifeStream.ai_insight != "",
+            )
+            .order_by(LifeStream.created_at)
+            .limit(5)
+        ).all()
 
-        cat_str = ", ".join(f"{c}: {n}" for c, n in cats.items())
-        result = f"[今日] 共 {len(records)} 条。类别: {cat_str}"
+        cat_str = ", ".join(f"{c}: {n}" for c, (n, _) in cats.items())
+        lines = [f"[今日] 共 {total} 条。类别: {cat_str}"]
         if insights:
-            result += "\nAI 洞察:\n" + "\n".join(insights[:5])
-        return result
-
-    def _get_week_context(self) -> str:
-        start = datetime.now() - timedelta(days=7)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
+            lines.append("AI 洞察:")
+            lines.extend(f"  - [{c}] {text}" for c, text in insights)
+        return "\n".join(lines)
+
+    def _daily_window(self, db: Session) -> List[Tuple[str, int, Optional[float], int]]:
+        """最近 30 个自然日的按天统计，读取 daily_summary 汇总行
+
+        在 _build_db_context 期间结果暂存于 db.info，各上下文只取其中一段，不再各自查询。
+
+        Returns:
+            按日期升序的 (YYYY-MM-DD, 记录数, 平均分或 None, 有评分的记录数)
+        """
+        memo = db.info.get(_DAILY_WINDOW_KEY)
+        if memo is not None:
+            return memo
+        start_day = datetime.now().date() - timedelta(days=_DAILY_WINDOW_DAYS)
+        rows = db.execute(_DAILY_ROLLUP_QUERY, {"start_day": start_day}).all()
+        window = [
+            (day.isoformat(), n, total / scored if scored else None, scored or 0)
+            for day, n, total, scored in rows
+        ]
+        if _DAILY_WINDOW_KEY in db.info:
+            db.info[_DAILY_WINDOW_KEY] = window
+        return window
+
+    def _recent_days(self, db: Session, days: int) -> List[Tuple[str, int, Optional[float], int]]:
+        """按天统计窗口中最近 N 个自然日的部分（含今天共 N+1 天）"""
+        cutoff = (datetime.now().date() - timedelta(days=days)).isoformat()
+        return [row for row in self._daily_window(db) if row[0] >= cutoff]
+
+    def _get_week_context(self, db: Session) -> str:
+        daily = self._recent_days(db, 7)
+        if not daily:
             return "[本周] 无记录"
 
-        daily = defaultdict(int)
-        daily_scores = defaultdict(list)
-        for r in records:
-            if r.created_at:
-                day = r.created_at.strftime("%m/%d")
-                daily[day] += 1
-                if r.dimension_scores:
-                    avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                    daily_scores[day].append(avg)
-
-        lines = [f"[本周] 共 {len(records)} 条"]
-        for day in sorted(daily.keys()):
-            avg = sum(daily_scores[day]) / len(daily_scores[day]) if daily_scores[day] else None
+        lines = [f"[本周] 共 {sum(row[1] for row in daily)} 条"]
+        for day, n, avg, _ in daily:
             score_str = f" 平均 {avg:.0f}分" if avg else ""
-            lines.append(f"  {day}: {daily[day]}条{score_str}")
+            lines.append(f"  {day[5:].replace('-', '/')}: {n}条{score_str}")
         return "\n".join(lines)
 
-    def _get_month_context(self) -> str:
-        start = datetime.now() - timedelta(days=30)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
+    def _get_month_context(self, db: Session) -> str:
+        start = datetime.combine(datetime.now().date() - timedelta(days=_DAILY_WINDOW_DAYS), datetime.min.time())
+        cats, total = self._category_stats(db, start)
+        if not total:
             return "[本月] 无记录"
 
-        cats = defaultdict(int)
-        total_score, score_n = 0, 0
-        for r in records:
-            if r.category:
-                cats[r.category] += 1
-            if r.dimension_scores:
-                avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                total_score += avg
-                score_n += 1
-
-        avg_score = total_score / score_n if score_n else None
-        cat_str = ", ".join(f"{c}: {n}" for c, n in sorted(cats.items(), key=lambda x: x[1], reverse=True))
+        # 由按天平均分按评分记录数加权合并，不再单独查询
+        daily = self._recent_days(db, 30)
+        scored = sum(row[3] for row in daily)
+        avg_score = sum(avg * k for _, _, avg, k in daily if k) / scored if scored else None
+        cat_str = ", ".join(f"{c}: {n}" for c, (n, _) in cats.items())
         score_str = f", 平均状态分 {avg_score:.1f}" if avg_score else ""
-        return f"[本月] 共 {len(records)} 条{score_str}。类别: {cat_str}"
-
-    def _get_sleep_context(self) -> str:
-        start = datetime.now() - timedelta(days=14)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.category == "SLEEP",
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
-            return "[睡眠] 最近14天无睡眠记录"
-
-        lines = [f"[睡眠] 最近14天共 {len(records)} 条"]
-        for r in records:
-            date = r.created_at.strftime("%m/%d") if r.created_at else "?"
-            meta = r.meta_data or {}
+        return f"[本月] 共 {total} 条{score_str}。类别: {cat_str}"
+
+    def _iter_category_rows(self, db: Session, category: str, days: int, *columns):
+        """流式读取最近 N 天某类别记录的指定列（不加载整行，按 500 行分批取）"""
+        start = datetime.now() - timedelta(days=days)
+        stmt = (
+            select(LifeStream.created_at, *columns)
+            .where(
+                LifeStream.is_deleted == False,
+                LifeStream.category == category,
+                LifeStream.created_at >= start,
+            )
+            .order_by(LifeStream.created_at)
+            .execution_options(yield_per=500)
+        )
+        return db.execute(stmt)
+
+    def _get_sleep_context(self, db: Session) -> str:
+        rows = self._iter_category_rows(
+            db, "SLEEP", 14, LifeStream.meta_data, func.substr(LifeStream.ai_insight, 1, 60)
+        )
+
+        lines = []
+        for created_at, meta, insight in rows:
+            date = created_at.strftime("%m/%d") if created_at else "?"
+            meta = meta or {}
             duration = meta.get("duration_hours") or meta.get("total_hours")
             sleep_t = meta.get("sleep_time", "")
             wake_t = meta.get("wake_time", "")
-            insight = (r.ai_insight or "")[:60]
-            info = f"  {date}: "
+            info = []
             if duration:
-                info += f"{duration}h "
+                info.append(f"{duration}h")
             if sleep_t:
-                info += f"入睡{sleep_t} "
+                info.append(f"入睡{sleep_t}")
             if wake_t:
-                info += f"醒来{wake_t} "
+                info.append(f"醒来{wake_t}")
             if insight:
-                info += f"- {insight}"
-            lines.append(info)
-        return "\n".join(lines)
+                info.append(f"- {insight}")
+            lines.append(f"  {date}: " + " ".join(info))
+        if not lines:
+            return "[睡眠] 最近14天无睡眠记录"
+        return "\n".join([f"[睡眠] 最近14天共 {len(lines)} 条", *lines])
 
-    def _get_mood_context(self) -> str:
-        start = datetime.now() - timedelta(days=14)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.category == "MOOD",
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
-            return "[心情] 最近14天无心情记录"
+    def _get_mood_context(self, db: Session) -> str:
+        rows = self._iter_category_rows(
+            db, "MOOD", 14, LifeStream.tags, func.substr(LifeStream.ai_insight, 1, 60)
+        )
 
-        lines = [f"[心情] 最近14天共 {len(records)} 条"]
-        for r in records:
-            date = r.created_at.strftime("%m/%d") if r.created_at else "?"
-            tags = ", ".join(r.tags[:3]) if r.tags else ""
-            insight = (r.ai_insight or "")[:60]
+        lines = []
+        for created_at, tags, insight in rows:
+            date = created_at.strftime("%m/%d") if created_at else "?"
+            tags = ", ".join(tags[:3]) if tags else ""
             lines.append(f"  {date}: {tags} - {insight}" if insight else f"  {date}: {tags}")
-        return "\n".join(lines)
+        if not lines:
+            return "[心情] 最近14天无心情记录"
+        return "\n".join([f"[心情] 最近14天共 {len(lines)} 条", *lines])
 
-    def _get_activity_context(self) -> str:
-        start = datetime.now() - timedelta(days=14)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.category == "ACTIVITY",
-            LifeStream.created_at >= start,
-        ).all()
-        if not records:
-            return "[运动] 最近14天无运动记录"
+    def _get_activity_context(self, db: Session) -> str:
+        rows = self._iter_category_rows(db, "ACTIVITY", 14, func.substr(LifeStream.ai_insight, 1, 60))
 
-        lines = [f"[运动] 最近14天共 {len(records)} 条"]
-        for r in records:
-            date = r.created_at.strftime("%m/%d") if r.created_at else "?"
-            insight = (r.ai_insight or "")[:60]
-            lines.append(f"  {date}: {insight}")
-        return "\n".join(lines)
+        lines = []
+        for created_at, insight in rows:
+            date = created_at.strftime("%m/%d") if created_at else "?"
+            lines.append(f"  {date}: {insight or ''}")
+        if not lines:
+            return "[运动] 最近14天无运动记录"
+        return "\n".join([f"[运动] 最近14天共 {len(lines)} 条", *lines])
 
-    def _get_trend_context(self) -> str:
-        start = datetime.now() - timedelta(days=14)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= start,
-        ).order_by(LifeStream.created_at).all()
-        if len(records) < 3:
+    def _get_trend_context(self, db: Session) -> str:
+        daily = self._recent_days(db, 14)
+        if sum(row[1] for row in daily) < 3:
             return "[趋势] 数据不足"
 
-        daily_scores = defaultdict(list)
-        for r in records:
-            if r.created_at and r.dimension_scores:
-                day = r.created_at.strftime("%m/%d")
-                avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                daily_scores[day].append(avg)
-
-        if not daily_scores:
+        scored = [(day, avg) for day, _, avg, _ in daily if avg is not None]
+        if not scored:
             return "[趋势] 无评分数据"
 
         lines = ["[趋势] 每日平均状态分:"]
-        for day in sorted(daily_scores.keys()):
-            avg = sum(daily_scores[day]) / len(daily_scores[day])
-            bar = "█" * int(avg / 10) + "░" * (10 - int(avg / 10))
-            lines.append(f"  {day}: {bar} {avg:.0f}")
+        for day, avg in scored:
+            bar = _BARS[min(max(int(avg / 10), 0), 10)]
+            lines.append(f"  {day[5:].replace('-', '/')}: {bar} {avg:.0f}")
         return "\n".join(lines)
 
-    def _get_best_day_context(self) -> str:
-        return self._get_extreme_day_context(best=True)
+    def _get_best_day_context(self, db: Session) -> str:
+        return self._get_extreme_day_context(db, best=True)
 
-    def _get_worst_day_context(self) -> str:
-        return self._get_extreme_day_context(best=False)
+    def _get_worst_day_context(self, db: Session) -> str:
+        return self._get_extreme_day_context(db, best=False)
 
-    def _get_extreme_day_context(self, best: bool) -> str:
-        start = datetime.now() - timedelta(days=30)
-        records = self.db.query(LifeStream).filter(
-            LifeStream.is_deleted == False,
-            LifeStream.created_at >= start,
-        ).all()
-
-        daily_scores = defaultdict(list)
-        for r in records:
-            if r.created_at and r.dimension_scores:
-                day = r.created_at.strftime("%Y-%m-%d")
-                avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                daily_scores[day].append(avg)
+    def _get_extreme_day_context(self, db: Session, best: bool) -> str:
+        averaged = {day: avg for day, _, avg, _ in self._recent_days(db, 30) if avg is not None}
 
-        if not daily_scores:
+        if not averaged:
             return f"[{'最佳' if best else '最差'}日] 数据不足"
 
-        averaged = {d: sum(s) / len(s) for d, s in daily_scores.items()}
         target = max(averaged, key=averaged.get) if best else min(averaged, key=averaged.get)
         label = "最佳" if best else "最差"
         return f"[{label}日] 最近30天{label}日: {target} 平均分 {averaged[target]:.1f}"
@@ -510,9 +693,10 @@ class ChatAssistant:
             "content": f"⚠️ AI 服务暂时不可用，以下是原始数据供参考：\n\n```\n{ctx}\n```",
         }
 
-    def _fallback_db_only(self, message: str) -> Dict[str, Any]:
+    def _fallback_db_only(self, message: str, ctx: Optional[str] = None) -> Dict[str, Any]:
         """LLM 调用失败时降级到纯数据展示"""
-        ctx = self._gather_db_context(message)
+        if ctx is None:
+            ctx = self._gather_db_context(message)
         return {
             "type": "markdown",
             "content": f"AI 分析暂时不可用，为你查询到以下数据：\n\n```\n{ctx}\n```\n\n请稍后重试。",
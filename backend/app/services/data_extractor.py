@@ -3,14 +3,21 @@
 根据图片类型提取结构化数据 + 深度分析 + 智能建议
 """
 
+import asyncio
+import base64
+import io
 import json
 import re
 import logging
-from typing import Optional, Dict, Any, List
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Callable
 from datetime import datetime, timezone, timedelta
-from openai import AsyncOpenAI
+from PIL import Image
 from app.config import get_settings
 from app.services.token_tracker import record_usage
+from app.services.ai_client import get_openai_client
+from app.services.json_utils import partial_reply_text
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,46 @@ settings = get_settings()
 # 默认时区（北京时间 UTC+8）
 DEFAULT_TIMEZONE = timezone(timedelta(hours=8))
 
+# 各类图片发给视觉模型前的规格：(最长边像素, detail)
+# 文字密集的截图保留较高分辨率；食物照片中等；风景、自拍等照片用 low（单块低清图，Token 最少）
+IMAGE_PROFILES: Dict[str, Tuple[int, str]] = {
+    "ocr": (2048, "high"),
+    "food": (1024, "auto"),
+    "photo": (512, "low"),
+}
+PHOTO_IMAGE_TYPES = {"activity_photo", "scenery", "selfie"}
+_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+# extract_many 同时进行的提取数上限（全进程共享），避免一次批量把模型并发和 RPM 全部占满
+MAX_PARALLEL_EXTRACTIONS = 4
+_extraction_semaphore = asyncio.Semaphore(MAX_PARALLEL_EXTRACTIONS)
+
+# 当前提取请求的用户昵称；用上下文变量而不是实例属性，并发提取互不覆盖
+_nickname_var: ContextVar[Optional[str]] = ContextVar("_nickname_var", default=None)
+
+# extract_stream 运行期间接收 reply_text 增量的回调；未设置时 _call_ai 走非流式请求
+_reply_listener: ContextVar[Optional[Callable[[str], None]]] = ContextVar("_reply_listener", default=None)
+
+
+def _prepare_image(image_url: str, max_edge: int) -> str:
+    """Base64 图片最长边超过 max_edge 时缩小并重新编码为 JPEG；公开 URL 或无法解码时原样返回"""
+    if not image_url.startswith(_DATA_URL_PREFIX):
+        return image_url
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(image_url[len(_DATA_URL_PREFIX):])))
+        if max(image.size) <= max_edge:
+            return image_url
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        return _DATA_URL_PREFIX + base64.b64encode(buffer.getvalue()).decode("ascii")
+    except Exception as e:
+        logger.warning(f"图片预处理失败，使用原图: {e}")
+        return image_url
+
+
 # 导入全局并发控制器
 def _get_concurrency_limiter():
     """延迟导入并发控制器，避免循环导入"""
@@ -55,13 +102,268 @@ DIMENSION_SCORING_PROMPT = """
 """
 
 
+# 系统提示词模板：正文在导入时拼好，调用时只填入时间等少量字段
+# （JSON 示例中的花括号写作 {{ }}，评分说明原样转义后拼接）
+_DIMENSION_SCORING_TEMPLATE = DIMENSION_SCORING_PROMPT.replace("{", "{{").replace("}", "}}")
+
+_TEXT_PROMPT = """你是 Vibing u 的生活记录助手，擅长从只言片语中洞察用户状态。
+当前时间：{current_time}（{time_period}）
+
+【重要 - 时间分析】
+今天是 {today_date}。请分析用户描述的事件实际发生在什么时候：
+- 如果用户说"昨天"、"昨晚"，record_time 应为 {yesterday_date}
+- 如果用户说"今天早上"、"刚才"、"现在"，record_time 应为当前时间
+- 如果用户说"上周"、"3天前"等，请计算正确的日期
+- 如果没有明确时间线索，默认为当前时间
+
+【重要】本次输入仅有文字，没有图片。请深度分析用户输入。
+
+你的任务：
+1. 判断分类
+2. 提取结构化数据
+3. **深度分析**：挖掘文字背后的情绪、状态、可能的原因
+4. **给出建议**：基于分析，给出1-2条具体可行的建议
+
+分类选项（选最主要的一个作为 category，如果涉及多个领域可填 sub_categories）：
+- SLEEP: 睡眠相关
+- DIET: 饮食相关
+- ACTIVITY: 运动相关
+- MOOD: 情绪心情
+- SOCIAL: 社交相关
+- WORK: 工作学习
+- GROWTH: 成长相关
+- LEISURE: 休闲娱乐
+- SCREEN: 屏幕时间
+
+请以 JSON 格式输出（reply_text 必须放在前面优先生成）：
+{{
+    "category": "最主要的分类",
+    "sub_categories": ["次要分类1", "次要分类2"],
+    "reply_text": "一句温暖、有内涵的回复（15-30字），反映用户的状态或给予鼓励。【必须】有洞察力。【禁止】返回'已记录'这种空洞回复。",
+    "record_time": "事件实际发生时间，ISO格式如 {today_date}T{clock}:00 或相对时间如'昨天'",
+    "mood": "happy/neutral/sad/tired/anxious/excited/calm/etc",
+    "note": "简短描述",
+    "analysis": "深度分析（50-100字）：分析用户当前状态、可能的情绪原因、与时间/场景的关联等",
+    "suggestions": ["建议1（具体可行）", "建议2（如有必要）"],
+    "trend": "up/down/stable（情绪/状态趋势判断）",
+    "tags": ["标签1", "标签2", "标签3"],
+    "dimension_scores": {{"body": 0, "mood": 75, "social": 0, "work": 0, "growth": 0, "meaning": 30, "digital": 0, "leisure": 0}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE
+
+_SLEEP_PROMPT = """你是一个睡眠健康专家和 OCR 数据提取专家。当前时间：{current_time}
+这是一张睡眠记录截图（iPhone 健康 App / Sleep Cycle / 小米运动 / AutoSleep 等）。
+
+【最重要 - 时间分析】
+用户正在提交睡眠数据，需要判断这是哪一天的睡眠：
+- 今天是 {today_date}
+- 如果截图显示的日期是昨天或更早，record_date 应设为那一天
+- 如果截图显示今天早上醒来的数据，实际入睡时间是昨晚，record_date 应设为昨天 {yesterday_date}
+- 如果无法判断日期，默认是昨晚到今早的睡眠，record_date 设为 {yesterday_date}
+
+请务必识别以下核心数据：
+1. **入睡时间 (sleep_time)**：截图中显示的入睡/就寝时间（如 23:30、11:30 PM 等）
+2. **苏醒时间 (wake_time)**：截图中显示的起床/苏醒时间（如 07:15、7:15 AM 等）
+3. **睡眠时长**：总睡眠时间（如 7小时45分、7h45m 等）
+4. **睡眠阶段**：深睡、浅睡、REM、清醒等各阶段时长
+
+请以 JSON 格式输出：
+{{
+    "record_date": "{yesterday_date}",
+    "record_time": "{yesterday_date}T23:30:00",
+    "sleep_time": "23:30",
+    "wake_time": "07:15", 
+    "duration_hours": 7.75,
+    "quality": "good/fair/poor",
+    "score": 85,
+    "deep_sleep_hours": 2.5,
+    "rem_hours": 1.5,
+    "light_sleep_hours": 3.75,
+    "awake_hours": 0.5,
+    "analysis": "深度分析（50-100字）：评估睡眠质量，深睡占比是否达标（建议20-40%），入睡时间是否健康（建议22:00-23:30）等",
+    "suggestions": ["具体建议1", "具体建议2"],
+    "reply_text": "一句温暖、有洞察的回复（15-30字），点评睡眠状况或给予建议。【禁止】空洞的'已记录'。",
+    "trend": "up/down/stable",
+    "tags": ["睡眠", "健康"],
+    "dimension_scores": {{"body": 80, "mood": 65, "social": 0, "work": 0, "growth": 0, "meaning": 20, "digital": 0, "leisure": 0}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE + """
+【重要提示】：
+1. record_date 是这条睡眠记录归属的日期（入睡那天），record_time 是入睡的完整时间戳
+2. 入睡时间和苏醒时间是用户最关心的数据，请优先识别
+3. 时间格式统一为 24 小时制（如 23:30，不要用 11:30 PM）
+4. 如果截图中有时间轴，请从时间轴的起止点推断入睡和苏醒时间
+5. 如果截图显示的是历史数据（如2天前），请正确设置 record_date
+6. 只有确实无法识别时才设为 null"""
+
+_SCREEN_PROMPT = """你是一个数字健康专家和 OCR 数据提取专家。当前时间：{current_time}
+这是一张手机屏幕时间截图。
+
+请仔细识别并：
+1. **提取数据**：
+   - 总屏幕时间
+   - 各 App 使用时长（尽可能识别前5-10个 App 的名称和时长）
+   - 拿起手机次数
+   - 首次拿起时间
+   
+2. **深度分析**：
+   - 屏幕时间是否过长？（建议每日<4小时）
+   - 哪些 App 占用最多？是社交/娱乐/效率类？
+   - 使用模式是否健康？
+   
+3. **给出建议**：基于 App 使用情况给出具体建议
+
+请以 JSON 格式输出：
+{{
+    "total_screen_time": "5小时32分",
+    "total_minutes": 332,
+    "top_apps": [
+        {{"name": "微信", "time": "2小时15分", "minutes": 135, "type": "social"}},
+        {{"name": "抖音", "time": "1小时20分", "minutes": 80, "type": "entertainment"}},
+        {{"name": "Safari", "time": "45分钟", "minutes": 45, "type": "productivity"}},
+        {{"name": "小红书", "time": "30分钟", "minutes": 30, "type": "social"}},
+        {{"name": "哔哩哔哩", "time": "25分钟", "minutes": 25, "type": "entertainment"}}
+    ],
+    "app_breakdown": {{
+        "social": 165,
+        "entertainment": 105,
+        "productivity": 45,
+        "other": 17
+    }},
+    "pickups": 45,
+    "first_pickup": "07:23",
+    "analysis": "深度分析（80-120字）：分析屏幕使用是否过度，社交/娱乐 App 占比，是否影响效率和健康，与拿起次数的关联等",
+    "suggestions": ["具体建议1（如限制某App）", "具体建议2（如设置屏幕时间）"],
+    "record_time": "截图数据所属日期时间，ISO格式",
+    "trend": "up/down/stable",
+    "reply_text": "一句有洞察的回复（15-30字），指出屏幕使用的关键问题或肯定健康习惯。【禁止】空洞的'已记录'。",
+    "health_score": 60,
+    "tags": ["屏幕时间", "数字健康"],
+    "dimension_scores": {{"body": 0, "mood": 40, "social": 0, "work": 30, "growth": 0, "meaning": 0, "digital": 60, "leisure": 30}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE + """
+注意：
+1. **务必识别所有可见的 App 名称和时长**，这是最重要的数据
+2. 如果某项不可见，设为 null
+3. 分析要具体，建议要可行
+4. record_time 应为截图所示日期，如果是今天的数据用当前时间，如果是昨天的用昨天的日期"""
+
+_ACTIVITY_PROMPT = """你是一个运动健康专家。当前时间：{current_time}
+这是一张运动 App 截图。
+
+请识别并：
+1. **提取数据**：运动类型、时长、距离、热量、配速、心率等
+2. **深度分析**：评估运动效果，是否达到有氧/燃脂心率，强度是否合适
+3. **给出建议**：基于数据给出改进建议
+
+请以 JSON 格式输出：
+{{
+    "activity_type": "running/cycling/swimming/gym/etc",
+    "duration_minutes": 45,
+    "distance_km": 5.2,
+    "calories_burned": 420,
+    "pace": "5'30''/km",
+    "avg_heart_rate": 145,
+    "max_heart_rate": 168,
+    "record_time": "运动实际发生时间，ISO格式",
+    "analysis": "深度分析（50-100字）：评估运动强度、心率区间、是否达到训练效果等",
+    "suggestions": ["具体建议1", "具体建议2"],
+    "trend": "up/down/stable",
+    "reply_text": "一句有力的鼓励（15-30字），肯定运动成果或激励继续保持。【禁止】空洞的'已记录'。",
+    "tags": ["运动", "健身"],
+    "dimension_scores": {{"body": 85, "mood": 70, "social": 0, "work": 0, "growth": 20, "meaning": 30, "digital": 0, "leisure": 40}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE + """
+注意：record_time 应为运动实际发生的时间，如果截图显示是昨天的运动记录，应设为昨天的日期。"""
+
+_FOOD_PROMPT = """你是一个营养学专家。当前时间：{current_time}（{time_period}，可能是{meal_hint}）
+
+请分析这张美食照片，并：
+1. **提取数据**：识别食物、估算份量和热量
+2. **营养分析**：评估营养均衡性、是否健康
+3. **给出建议**：基于这餐给出饮食建议
+
+请以 JSON 格式输出：
+{{
+    "food_items": [
+        {{"name": "牛排", "portion": "200g", "calories": 500}},
+        {{"name": "沙拉", "portion": "100g", "calories": 50}}
+    ],
+    "total_calories": 550,
+    "meal_type": "breakfast/lunch/dinner/snack",
+    "is_healthy": true,
+    "nutrition_balance": {{
+        "protein": "high/medium/low",
+        "carbs": "high/medium/low",
+        "fat": "high/medium/low",
+        "fiber": "high/medium/low"
+    }},
+    "record_time": "这餐实际发生时间，ISO格式或相对时间如'今天中午'",
+    "analysis": "营养分析（50-100字）：评估这餐的营养均衡性、热量是否合适、搭配是否健康等",
+    "suggestions": ["具体建议1", "具体建议2"],
+    "reply_text": "一句有趣的评价（15-30字），点评这餐的营养或美味程度。【禁止】空洞的'已记录'。",
+    "tags": ["饮食", "美食"],
+    "dimension_scores": {{"body": 70, "mood": 60, "social": 0, "work": 0, "growth": 0, "meaning": 20, "digital": 0, "leisure": 30}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE + """
+注意：record_time 应为这餐实际发生的时间。如果用户说"昨天的午餐"，应设为昨天中午。"""
+
+_GENERAL_PROMPT = """你是 Vibing u 的生活记录助手，擅长从各种照片和截图中洞察用户状态。
+当前时间：{current_time}（{time_period}）
+
+请分析这张{image_type_zh}，并：
+1. 判断这张图最适合的分类（截图可以是聊天记录、工作内容、学习笔记、社交动态等任何内容）
+2. 提取和描述关键内容
+3. 推测用户当时的情绪和状态
+4. 给出一句温暖的回复
+
+分类选项（选最主要的一个作为 category，如果涉及多个领域可填 sub_categories）：
+- SLEEP: 睡眠相关
+- DIET: 饮食相关
+- ACTIVITY: 运动相关
+- MOOD: 情绪心情
+- SOCIAL: 社交相关（聚会、合照等）
+- WORK: 工作学习
+- GROWTH: 成长相关
+- LEISURE: 休闲娱乐
+- SCREEN: 屏幕时间
+
+请以 JSON 格式输出：
+{{
+    "category": "最主要的分类",
+    "sub_categories": ["次要分类1", "次要分类2"],
+    "description": "照片内容描述",
+    "record_time": "照片实际拍摄/发生时间，如用户说'昨天'则为昨天的日期",
+    "mood": "happy/neutral/tired/excited/calm/etc",
+    "analysis": "深度分析（30-50字）：从照片推测用户状态、情绪、可能在做什么",
+    "suggestions": ["如有需要的建议"],
+    "reply_text": "一句温暖、有洞察的回复（15-30字），反映照片传递的情绪或给予鼓励。【禁止】空洞的'已记录'。",
+    "tags": ["标签1", "标签2"],
+    "dimension_scores": {{"body": 0, "mood": 70, "social": 0, "work": 0, "growth": 0, "meaning": 30, "digital": 0, "leisure": 50}}
+}}
+""" + _DIMENSION_SCORING_TEMPLATE
+
+_PROMPT_TEMPLATES: Dict[str, str] = {
+    "text": _TEXT_PROMPT,
+    "sleep": _SLEEP_PROMPT,
+    "screen": _SCREEN_PROMPT,
+    "activity": _ACTIVITY_PROMPT,
+    "food": _FOOD_PROMPT,
+    "general": _GENERAL_PROMPT,
+}
+
+
+@lru_cache(maxsize=256)
+def _render_prompt(name: str, **fields: str) -> str:
+    """填充提示词模板；字段只含分钟级时间等，同一分钟内的请求直接复用"""
+    return _PROMPT_TEMPLATES[name].format_map(fields)
+
+
 class DataExtractor:
     """根据图片类型提取结构化数据 + AI 深度分析 + LLM 驱动的八维度评分"""
     
     def __init__(self):
-        api_key = settings.get_ai_api_key()
-        base_url = settings.get_ai_base_url()
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        self.client = get_openai_client()
         self.vision_model = settings.vision_model   # glm-4.6v (付费，速率限制更宽松)
         self.text_model = settings.text_model       # glm-4.7 (付费，速率限制更宽松)
     
@@ -174,6 +476,7 @@ class DataExtractor:
         client_time: Optional[str] = None,
         nickname: Optional[str] = None,
         category_suggestion: Optional[str] = None,
+        image_url: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         根据图片类型提取数据 + 深度分析
@@ -181,6 +484,7 @@ class DataExtractor:
         Args:
             nickname: 用户昵称，AI 回复时用此称呼代替"用户"
             category_suggestion: 图片分类器给出的分类建议，用于智能路由
+            image_url: 可公开访问的图片地址，提供时优先使用（请求体不再携带 Base64 图片数据）
         
         Returns:
             {
@@ -189,14 +493,35 @@ class DataExtractor:
                 "reply_text": str
             }
         """
-        self._nickname = nickname
+        if image_base64 and not image_url:
+            image_url = _DATA_URL_PREFIX + image_base64
+        
+        # 昵称只在本次提取期间有效，结束后恢复，不影响调用方上下文
+        token = _nickname_var.set(nickname)
+        try:
+            return await self._route_extract(
+                image_type, image_url, text, content_hint, client_time, category_suggestion
+            )
+        finally:
+            _nickname_var.reset(token)
+    
+    async def _route_extract(
+        self,
+        image_type: str,
+        image_url: Optional[str],
+        text: Optional[str],
+        content_hint: Optional[str],
+        client_time: Optional[str],
+        category_suggestion: Optional[str],
+    ) -> Dict[str, Any]:
+        """按输入类型路由到对应的提取方法；AI 不可用或出错时返回本地提取结果"""
         
         if not self.client:
             return self._mock_extract(image_type, text, content_hint, client_time)
         
         try:
             # 纯文本输入
-            if not image_base64:
+            if not image_url:
                 return await self._extract_text_only(text, client_time)
             
             # 有图片：根据 image_type + category_suggestion 智能路由
@@ -204,25 +529,118 @@ class DataExtractor:
             # 其他截图（如聊天记录、工作截图等）走通用提取
             if image_type == "screenshot":
                 if category_suggestion and category_suggestion.upper() == "SCREEN":
-                    return await self._extract_screen_time(image_base64, text, client_time)
+                    return await self._extract_screen_time(image_url, text, client_time)
                 else:
-                    return await self._extract_general(image_base64, text, image_type, client_time)
+                    return await self._extract_general(image_url, text, image_type, client_time)
             elif image_type == "activity_screenshot":
-                return await self._extract_activity_data(image_base64, text, client_time)
+                return await self._extract_activity_data(image_url, text, client_time)
             elif image_type == "food":
-                return await self._extract_food_data(image_base64, text, client_time)
+                return await self._extract_food_data(image_url, text, client_time)
             elif image_type in ["sleep_screenshot"]:
-                return await self._extract_sleep_data(image_base64, text, client_time)
+                return await self._extract_sleep_data(image_url, text, client_time)
             elif image_type in ["activity_photo", "scenery", "selfie"]:
-                return await self._extract_general(image_base64, text, image_type, client_time)
+                return await self._extract_general(image_url, text, image_type, client_time)
             else:
-                return await self._extract_general(image_base64, text, image_type, client_time)
+                return await self._extract_general(image_url, text, image_type, client_time)
         except Exception as e:
             logger.error(f"数据提取错误: {e}")
             import traceback
             traceback.print_exc()
             return self._mock_extract(image_type, text, content_hint, client_time)
     
+    async def extract_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        并发提取多条输入，结果顺序与 items 一致
+        
+        每个元素是 extract 的关键字参数；单条失败时该条返回本地提取结果，不影响其他条目。
+        同时进行的提取不超过 MAX_PARALLEL_EXTRACTIONS 条，单次模型调用再受 _call_ai 中的全局并发控制器限制。
+        """
+        async def extract_one(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with _extraction_semaphore:
+                return await self.extract(**item)
+        
+        results = await asyncio.gather(
+            *(extract_one(item) for item in items),
+            return_exceptions=True,
+        )
+        extracted = []
+        for item, result in zip(items, results):
+            if isinstance(result, BaseException):
+                logger.error(f"批量数据提取错误: {result}")
+                result = self._mock_extract(
+                    item.get("image_type", "other"),
+                    item.get("text"),
+                    item.get("content_hint"),
+                    item.get("client_time"),
+                )
+            extracted.append(result)
+        return extracted
+    
+    async def extract_stream(self, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式提取：先逐步产出 {"partial": 已生成的 reply_text}，最后产出 {"result": 完整结果}
+        
+        参数同 extract；extract 抛出的异常在产出最终结果时抛出，由调用方决定是否重试。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        token = _reply_listener.set(queue.put_nowait)
+        try:
+            # 任务创建时复制当前上下文，_call_ai 中可取到回调
+            task = asyncio.create_task(self.extract(**kwargs))
+        finally:
+            _reply_listener.reset(token)
+        
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                yield {"partial": getter.result()}
+            while not queue.empty():
+                yield {"partial": queue.get_nowait()}
+            yield {"result": task.result()}
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _stream_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        on_reply: Callable[[str], None],
+    ) -> Tuple[str, Optional[str], Any]:
+        """流式请求模型，reply_text 每有新内容就回调一次；返回 (完整内容, finish_reason, usage)"""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=4096,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        content = ""
+        finish_reason = None
+        usage = None
+        last_partial = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            if not choice.delta.content:
+                continue
+            content += choice.delta.content
+            partial = partial_reply_text(content)
+            if partial and partial != last_partial:
+                last_partial = partial
+                on_reply(partial)
+        return content, finish_reason, usage
+    
     async def _extract_text_only(self, text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
         """纯文本输入的智能解析 + 分析"""
         
@@ -232,54 +650,18 @@ class DataExtractor:
         today_date = client_dt.strftime("%Y-%m-%d")
         yesterday_date = (client_dt - timedelta(days=1)).strftime("%Y-%m-%d")
         
-        system_prompt = f"""你是 Vibing u 的生活记录助手，擅长从只言片语中洞察用户状态。
-当前时间：{current_time}（{time_period}）
-
-【重要 - 时间分析】
-今天是 {today_date}。请分析用户描述的事件实际发生在什么时候：
-- 如果用户说"昨天"、"昨晚"，record_time 应为 {yesterday_date}
-- 如果用户说"今天早上"、"刚才"、"现在"，record_time 应为当前时间
-- 如果用户说"上周"、"3天前"等，请计算正确的日期
-- 如果没有明确时间线索，默认为当前时间
-
-【重要】本次输入仅有文字，没有图片。请深度分析用户输入。
-
-你的任务：
-1. 判断分类
-2. 提取结构化数据
-3. **深度分析**：挖掘文字背后的情绪、状态、可能的原因
-4. **给出建议**：基于分析，给出1-2条具体可行的建议
-
-分类选项（选最主要的一个作为 category，如果涉及多个领域可填 sub_categories）：
-- SLEEP: 睡眠相关
-- DIET: 饮食相关
-- ACTIVITY: 运动相关
-- MOOD: 情绪心情
-- SOCIAL: 社交相关
-- WORK: 工作学习
-- GROWTH: 成长相关
-- LEISURE: 休闲娱乐
-- SCREEN: 屏幕时间
-
-请以 JSON 格式输出（reply_text 必须放在前面优先生成）：
-{{
-    "category": "最主要的分类",
-    "sub_categories": ["次要分类1", "次要分类2"],
-    "reply_text": "一句温暖、有内涵的回复（15-30字），反映用户的状态或给予鼓励。【必须】有洞察力。【禁止】返回'已记录'这种空洞回复。",
-    "record_time": "事件实际发生时间，ISO格式如 {today_date}T{client_dt.strftime('%H:%M')}:00 或相对时间如'昨天'",
-    "mood": "happy/neutral/sad/tired/anxious/excited/calm/etc",
-    "note": "简短描述",
-    "analysis": "深度分析（50-100字）：分析用户当前状态、可能的情绪原因、与时间/场景的关联等",
-    "suggestions": ["建议1（具体可行）", "建议2（如有必要）"],
-    "trend": "up/down/stable（情绪/状态趋势判断）",
-    "tags": ["标签1", "标签2", "标签3"],
-    "dimension_scores": {{"body": 0, "mood": 75, "social": 0, "work": 0, "growth": 0, "meaning": 30, "digital": 0, "leisure": 0}}
-}}
-""" + DIMENSION_SCORING_PROMPT
+        system_prompt = _render_prompt(
+            "text",
+            current_time=current_time,
+            time_period=time_period,
+            today_date=today_date,
+            yesterday_date=yesterday_date,
+            clock=client_dt.strftime("%H:%M"),
+        )
 
         return await self._call_ai(system_prompt, None, text, "MOOD", client_time)
     
-    async def _extract_sleep_data(self, image_base64: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
+    async def _extract_sleep_data(self, image_url: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
         """提取睡眠数据 + 睡眠分析"""
         
         current_time = self._get_current_time(client_time)
@@ -287,148 +669,31 @@ class DataExtractor:
         today_date = client_dt.strftime("%Y-%m-%d")
         yesterday_date = (client_dt - timedelta(days=1)).strftime("%Y-%m-%d")
         
-        system_prompt = f"""你是一个睡眠健康专家和 OCR 数据提取专家。当前时间：{current_time}
-这是一张睡眠记录截图（iPhone 健康 App / Sleep Cycle / 小米运动 / AutoSleep 等）。
-
-【最重要 - 时间分析】
-用户正在提交睡眠数据，需要判断这是哪一天的睡眠：
-- 今天是 {today_date}
-- 如果截图显示的日期是昨天或更早，record_date 应设为那一天
-- 如果截图显示今天早上醒来的数据，实际入睡时间是昨晚，record_date 应设为昨天 {yesterday_date}
-- 如果无法判断日期，默认是昨晚到今早的睡眠，record_date 设为 {yesterday_date}
-
-请务必识别以下核心数据：
-1. **入睡时间 (sleep_time)**：截图中显示的入睡/就寝时间（如 23:30、11:30 PM 等）
-2. **苏醒时间 (wake_time)**：截图中显示的起床/苏醒时间（如 07:15、7:15 AM 等）
-3. **睡眠时长**：总睡眠时间（如 7小时45分、7h45m 等）
-4. **睡眠阶段**：深睡、浅睡、REM、清醒等各阶段时长
+        system_prompt = _render_prompt(
+            "sleep", current_time=current_time, today_date=today_date, yesterday_date=yesterday_date
+        )
 
-请以 JSON 格式输出：
-{{
-    "record_date": "{yesterday_date}",
-    "record_time": "{yesterday_date}T23:30:00",
-    "sleep_time": "23:30",
-    "wake_time": "07:15", 
-    "duration_hours": 7.75,
-    "quality": "good/fair/poor",
-    "score": 85,
-    "deep_sleep_hours": 2.5,
-    "rem_hours": 1.5,
-    "light_sleep_hours": 3.75,
-    "awake_hours": 0.5,
-    "analysis": "深度分析（50-100字）：评估睡眠质量，深睡占比是否达标（建议20-40%），入睡时间是否健康（建议22:00-23:30）等",
-    "suggestions": ["具体建议1", "具体建议2"],
-    "reply_text": "一句温暖、有洞察的回复（15-30字），点评睡眠状况或给予建议。【禁止】空洞的'已记录'。",
-    "trend": "up/down/stable",
-    "tags": ["睡眠", "健康"],
-    "dimension_scores": {{"body": 80, "mood": 65, "social": 0, "work": 0, "growth": 0, "meaning": 20, "digital": 0, "leisure": 0}}
-}}
-""" + DIMENSION_SCORING_PROMPT + """
-【重要提示】：
-1. record_date 是这条睡眠记录归属的日期（入睡那天），record_time 是入睡的完整时间戳
-2. 入睡时间和苏醒时间是用户最关心的数据，请优先识别
-3. 时间格式统一为 24 小时制（如 23:30，不要用 11:30 PM）
-4. 如果截图中有时间轴，请从时间轴的起止点推断入睡和苏醒时间
-5. 如果截图显示的是历史数据（如2天前），请正确设置 record_date
-6. 只有确实无法识别时才设为 null"""
-
-        return await self._call_ai(system_prompt, image_base64, text, "SLEEP", client_time)
+        return await self._call_ai(system_prompt, image_url, text, "SLEEP", client_time)
     
-    async def _extract_screen_time(self, image_base64: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
+    async def _extract_screen_time(self, image_url: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
         """提取屏幕时间数据 + App 排行 + 深度分析"""
         
         current_time = self._get_current_time(client_time)
         
-        system_prompt = f"""你是一个数字健康专家和 OCR 数据提取专家。当前时间：{current_time}
-这是一张手机屏幕时间截图。
-
-请仔细识别并：
-1. **提取数据**：
-   - 总屏幕时间
-   - 各 App 使用时长（尽可能识别前5-10个 App 的名称和时长）
-   - 拿起手机次数
-   - 首次拿起时间
-   
-2. **深度分析**：
-   - 屏幕时间是否过长？（建议每日<4小时）
-   - 哪些 App 占用最多？是社交/娱乐/效率类？
-   - 使用模式是否健康？
-   
-3. **给出建议**：基于 App 使用情况给出具体建议
+        system_prompt = _render_prompt("screen", current_time=current_time)
 
-请以 JSON 格式输出：
-{{
-    "total_screen_time": "5小时32分",
-    "total_minutes": 332,
-    "top_apps": [
-        {{"name": "微信", "time": "2小时15分", "minutes": 135, "type": "social"}},
-        {{"name": "抖音", "time": "1小时20分", "minutes": 80, "type": "entertainment"}},
-        {{"name": "Safari", "time": "45分钟", "minutes": 45, "type": "productivity"}},
-        {{"name": "小红书", "time": "30分钟", "minutes": 30, "type": "social"}},
-        {{"name": "哔哩哔哩", "time": "25分钟", "minutes": 25, "type": "entertainment"}}
-    ],
-    "app_breakdown": {{
-        "social": 165,
-        "entertainment": 105,
-        "productivity": 45,
-        "other": 17
-    }},
-    "pickups": 45,
-    "first_pickup": "07:23",
-    "analysis": "深度分析（80-120字）：分析屏幕使用是否过度，社交/娱乐 App 占比，是否影响效率和健康，与拿起次数的关联等",
-    "suggestions": ["具体建议1（如限制某App）", "具体建议2（如设置屏幕时间）"],
-    "record_time": "截图数据所属日期时间，ISO格式",
-    "trend": "up/down/stable",
-    "reply_text": "一句有洞察的回复（15-30字），指出屏幕使用的关键问题或肯定健康习惯。【禁止】空洞的'已记录'。",
-    "health_score": 60,
-    "tags": ["屏幕时间", "数字健康"],
-    "dimension_scores": {{"body": 0, "mood": 40, "social": 0, "work": 30, "growth": 0, "meaning": 0, "digital": 60, "leisure": 30}}
-}}
-""" + DIMENSION_SCORING_PROMPT + """
-注意：
-1. **务必识别所有可见的 App 名称和时长**，这是最重要的数据
-2. 如果某项不可见，设为 null
-3. 分析要具体，建议要可行
-4. record_time 应为截图所示日期，如果是今天的数据用当前时间，如果是昨天的用昨天的日期"""
-
-        return await self._call_ai(system_prompt, image_base64, text, "SCREEN", client_time)
+        return await self._call_ai(system_prompt, image_url, text, "SCREEN", client_time)
     
-    async def _extract_activity_data(self, image_base64: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
+    async def _extract_activity_data(self, image_url: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
         """提取运动数据 + 分析"""
         
         current_time = self._get_current_time(client_time)
         
-        system_prompt = f"""你是一个运动健康专家。当前时间：{current_time}
-这是一张运动 App 截图。
+        system_prompt = _render_prompt("activity", current_time=current_time)
 
-请识别并：
-1. **提取数据**：运动类型、时长、距离、热量、配速、心率等
-2. **深度分析**：评估运动效果，是否达到有氧/燃脂心率，强度是否合适
-3. **给出建议**：基于数据给出改进建议
-
-请以 JSON 格式输出：
-{{
-    "activity_type": "running/cycling/swimming/gym/etc",
-    "duration_minutes": 45,
-    "distance_km": 5.2,
-    "calories_burned": 420,
-    "pace": "5'30''/km",
-    "avg_heart_rate": 145,
-    "max_heart_rate": 168,
-    "record_time": "运动实际发生时间，ISO格式",
-    "analysis": "深度分析（50-100字）：评估运动强度、心率区间、是否达到训练效果等",
-    "suggestions": ["具体建议1", "具体建议2"],
-    "trend": "up/down/stable",
-    "reply_text": "一句有力的鼓励（15-30字），肯定运动成果或激励继续保持。【禁止】空洞的'已记录'。",
-    "tags": ["运动", "健身"],
-    "dimension_scores": {{"body": 85, "mood": 70, "social": 0, "work": 0, "growth": 20, "meaning": 30, "digital": 0, "leisure": 40}}
-}}
-""" + DIMENSION_SCORING_PROMPT + """
-注意：record_time 应为运动实际发生的时间，如果截图显示是昨天的运动记录，应设为昨天的日期。"""
-
-        return await self._call_ai(system_prompt, image_base64, text, "ACTIVITY", client_time)
+        return await self._call_ai(system_prompt, image_url, text, "ACTIVITY", client_time)
     
-    async def _extract_food_data(self, image_base64: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
+    async def _extract_food_data(self, image_url: Optional[str], text: Optional[str], client_time: Optional[str]) -> Dict[str, Any]:
         """提取食物数据 + 营养分析"""
         
         current_time = self._get_current_time(client_time)
@@ -443,43 +708,15 @@ class DataExtractor:
             "深夜": "夜宵",
         }.get(time_period, "正餐")
         
-        system_prompt = f"""你是一个营养学专家。当前时间：{current_time}（{time_period}，可能是{meal_hint}）
-
-请分析这张美食照片，并：
-1. **提取数据**：识别食物、估算份量和热量
-2. **营养分析**：评估营养均衡性、是否健康
-3. **给出建议**：基于这餐给出饮食建议
+        system_prompt = _render_prompt(
+            "food", current_time=current_time, time_period=time_period, meal_hint=meal_hint
+        )
 
-请以 JSON 格式输出：
-{{
-    "food_items": [
-        {{"name": "牛排", "portion": "200g", "calories": 500}},
-        {{"name": "沙拉", "portion": "100g", "calories": 50}}
-    ],
-    "total_calories": 550,
-    "meal_type": "breakfast/lunch/dinner/snack",
-    "is_healthy": true,
-    "nutrition_balance": {{
-        "protein": "high/medium/low",
-        "carbs": "high/medium/low",
-        "fat": "high/medium/low",
-        "fiber": "high/medium/low"
-    }},
-    "record_time": "这餐实际发生时间，ISO格式或相对时间如'今天中午'",
-    "analysis": "营养分析（50-100字）：评估这餐的营养均衡性、热量是否合适、搭配是否健康等",
-    "suggestions": ["具体建议1", "具体建议2"],
-    "reply_text": "一句有趣的评价（15-30字），点评这餐的营养或美味程度。【禁止】空洞的'已记录'。",
-    "tags": ["饮食", "美食"],
-    "dimension_scores": {{"body": 70, "mood": 60, "social": 0, "work": 0, "growth": 0, "meaning": 20, "digital": 0, "leisure": 30}}
-}}
-""" + DIMENSION_SCORING_PROMPT + """
-注意：record_time 应为这餐实际发生的时间。如果用户说"昨天的午餐"，应设为昨天中午。"""
-
-        return await self._call_ai(system_prompt, image_base64, text, "DIET", client_time)
+        return await self._call_ai(system_prompt, image_url, text, "DIET", client_time, image_profile="food")
     
     async def _extract_general(
         self, 
-        image_base64: Optional[str], 
+        image_url: Optional[str], 
         text: Optional[str],
         image_type: str,
         client_time: Optional[str]
@@ -505,56 +742,35 @@ class DataExtractor:
             "other": "生活",
         }.get(image_type, "生活")
         
-        system_prompt = f"""你是 Vibing u 的生活记录助手，擅长从各种照片和截图中洞察用户状态。
-当前时间：{current_time}（{time_period}）
-
-请分析这张{image_type_zh}，并：
-1. 判断这张图最适合的分类（截图可以是聊天记录、工作内容、学习笔记、社交动态等任何内容）
-2. 提取和描述关键内容
-3. 推测用户当时的情绪和状态
-4. 给出一句温暖的回复
-
-分类选项（选最主要的一个作为 category，如果涉及多个领域可填 sub_categories）：
-- SLEEP: 睡眠相关
-- DIET: 饮食相关
-- ACTIVITY: 运动相关
-- MOOD: 情绪心情
-- SOCIAL: 社交相关（聚会、合照等）
-- WORK: 工作学习
-- GROWTH: 成长相关
-- LEISURE: 休闲娱乐
-- SCREEN: 屏幕时间
-
-请以 JSON 格式输出：
-{{
-    "category": "最主要的分类",
-    "sub_categories": ["次要分类1", "次要分类2"],
-    "description": "照片内容描述",
-    "record_time": "照片实际拍摄/发生时间，如用户说'昨天'则为昨天的日期",
-    "mood": "happy/neutral/tired/excited/calm/etc",
-    "analysis": "深度分析（30-50字）：从照片推测用户状态、情绪、可能在做什么",
-    "suggestions": ["如有需要的建议"],
-    "reply_text": "一句温暖、有洞察的回复（15-30字），反映照片传递的情绪或给予鼓励。【禁止】空洞的'已记录'。",
-    "tags": ["标签1", "标签2"],
-    "dimension_scores": {{"body": 0, "mood": 70, "social": 0, "work": 0, "growth": 0, "meaning": 30, "digital": 0, "leisure": 50}}
-}}
-""" + DIMENSION_SCORING_PROMPT
+        system_prompt = _render_prompt(
+            "general", current_time=current_time, time_period=time_period, image_type_zh=image_type_zh
+        )
 
-        result = await self._call_ai(system_prompt, image_base64, text, category_map.get(image_type, "MOOD"), client_time)
+        # 照片类只需把握整体内容，其他（聊天记录、工作截图等）可能需要识别文字
+        profile = "photo" if image_type in PHOTO_IMAGE_TYPES else "ocr"
+        result = await self._call_ai(
+            system_prompt, image_url, text, category_map.get(image_type, "MOOD"), client_time, image_profile=profile
+        )
         return result
     
     async def _call_ai(
         self, 
         system_prompt: str, 
-        image_base64: Optional[str], 
+        image_url: Optional[str], 
         text: Optional[str],
         category: str,
-        client_time: Optional[str] = None
+        client_time: Optional[str] = None,
+        image_profile: str = "ocr",
     ) -> Dict[str, Any]:
-        """调用 AI 接口（带速率限制和重试）"""
+        """调用 AI 接口（带速率限制和重试）
+
+        Args:
+            image_url: 图片地址（公开 URL 或 data URL），None 表示纯文本
+            image_profile: IMAGE_PROFILES 中的图片规格，决定缩放尺寸和 detail
+        """
         
         # 注入用户昵称到 system_prompt
-        nickname = getattr(self, '_nickname', None)
+        nickname = _nickname_var.get()
         if nickname:
             system_prompt = (
                 f"【重要】用户的昵称是「{nickname}」，在 reply_text 等回复中请用「{nickname}」称呼，"
@@ -566,19 +782,19 @@ class DataExtractor:
         if text:
             user_content.append({"type": "text", "text": f"用户说明: {text}"})
         
-        if image_base64:
+        if image_url:
+            max_edge, detail = IMAGE_PROFILES[image_profile]
+            # 解码、缩放、重新编码都是阻塞操作，放到线程中执行
+            image_url = await asyncio.to_thread(_prepare_image, image_url, max_edge)
             user_content.append({
                 "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_base64}",
-                    "detail": "high"
-                }
+                "image_url": {"url": image_url, "detail": detail},
             })
         elif not text:
             user_content.append({"type": "text", "text": "请分析。"})
         
         # 根据是否有图像选择模型
-        model = self.vision_model if image_base64 else self.text_model
+        model = self.vision_model if image_url else self.text_model
         
         # 获取并发控制器
         limiter = _get_concurrency_limiter()
@@ -589,25 +805,34 @@ class DataExtractor:
             raise Exception(f"模型 {model} 并发已满，等待超时")
         
         try:
-            response = await self.client.chat.completions.create(
-                model=actual_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content}
-                ],
-                max_tokens=4096,
-                # 强制 JSON 输出：消除 markdown 代码块包裹、额外解释文字等问题
-                response_format={"type": "json_object"},
-            )
-            
-            # 检查 finish_reason 和 token 用量
-            if not response.choices:
-                raise Exception(f"AI 返回空结果 (model={actual_model})")
-            choice = response.choices[0]
-            if not hasattr(choice, 'finish_reason'):
-                raise Exception(f"AI 返回格式错误，缺少 finish_reason")
-            finish_reason = choice.finish_reason
-            usage = response.usage
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ]
+            on_reply = _reply_listener.get()
+            if on_reply is not None:
+                # 流式请求：边生成边推送 reply_text，结构化字段在结束后统一解析
+                raw_content, finish_reason, usage = await self._stream_completion(
+                    actual_model, messages, on_reply
+                )
+            else:
+                response = await self.client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    max_tokens=4096,
+                    # 强制 JSON 输出：消除 markdown 代码块包裹、额外解释文字等问题
+                    response_format={"type": "json_object"},
+                )
+                
+                # 检查 finish_reason 和 token 用量
+                if not response.choices:
+                    raise Exception(f"AI 返回空结果 (model={actual_model})")
+                choice = response.choices[0]
+                if not hasattr(choice, 'finish_reason'):
+                    raise Exception(f"AI 返回格式错误，缺少 finish_reason")
+                finish_reason = choice.finish_reason
+                usage = response.usage
+                raw_content = choice.message.content
             
             if usage:
                 logger.info(
@@ -633,7 +858,6 @@ class DataExtractor:
                     f"category={category}, completion_tokens={usage.completion_tokens if usage else '?'}"
                 )
             
-            raw_content = choice.message.content
             if not raw_content or not raw_content.strip():
                 logger.warning(f"AI 返回空内容 (model={actual_model}, category={category}, finish_reason={finish_reason})")
                 raise ValueError("AI 返回内容为空")
@@ -773,7 +997,7 @@ class DataExtractor:
         else:
             # 纯文本或其他 — 给出比"已记录"更有意义的回复
             note = text or content_hint or "记录"
-            nickname = getattr(self, '_nickname', None)
+            nickname = _nickname_var.get()
             greeting = f"{nickname}，{time_period}好" if nickname else f"{time_period}好"
             reply = f"{greeting}！你的记录已保存，AI 分析将在 API 配置后可用。"
             return {
@@ -6,9 +6,9 @@
 import json
 import logging
 from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
 from app.config import get_settings
 from app.services.token_tracker import record_usage
+from app.services.ai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +37,7 @@ class ImageClassifier:
     }
     
     def __init__(self):
-        api_key = settings.get_ai_api_key()
-        base_url = settings.get_ai_base_url()
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        self.client = get_openai_client()
         self.vision_model = settings.simple_vision_model  # 图片分类是简单任务，用免费模型
     
     async def classify(self, image_base64: str, text_hint: Optional[str] = None) -> Dict[str, Any]:
@@ -4,6 +4,7 @@
 """
 
 import os
+import asyncio
 import base64
 import uuid
 import logging
@@ -65,6 +66,19 @@ class ImageStorage:
         Returns:
             (image_path, thumbnail_path)
         """
+        # Base64 解码、缩放、JPEG 编码和写文件都是阻塞操作，放到线程中执行，避免卡住事件循环
+        return await asyncio.to_thread(
+            self._save_image_sync, image_base64, image_type, compress, create_thumbnail
+        )
+    
+    def _save_image_sync(
+        self,
+        image_base64: str,
+        image_type: str,
+        compress: bool,
+        create_thumbnail: bool,
+    ) -> Tuple[str, Optional[str]]:
+        """save_image 的同步实现"""
         try:
             # 解码图片
             image_data = base64.b64decode(image_base64)
@@ -6,6 +6,7 @@
 2. markdown 代码块包裹 (```json ... ```)
 3. JSON 前后有额外文字
 4. 被 max_tokens 截断的不完整 JSON（尝试修复）
+5. 流式输出过程中读取尚未生成完的 reply_text
 """
 
 import json
@@ -13,12 +14,22 @@ import re
 import logging
 from typing import Any, Optional
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 # 匹配 markdown 代码块
 _CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*\n?(.*?)\n?\s*```', re.DOTALL)
 
 
+def _loads(text: str) -> Any:
+    """解析 JSON：优先 orjson，失败再交给标准库（兼容 NaN、超大整数等 orjson 不接受的写法）"""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+
 def extract_json(raw_content: str, model_name: str = "") -> Any:
     """
     从 AI 返回内容中健壮地提取 JSON（支持 object 和 array）。
@@ -40,7 +51,7 @@ def extract_json(raw_content: str, model_name: str = "") -> Any:
     
     # 0) 先尝试直接解析整个内容（处理纯 JSON 返回）
     try:
-        return json.loads(content)
+        return _loads(content)
     except json.JSONDecodeError:
         pass
     
@@ -50,7 +61,7 @@ def extract_json(raw_content: str, model_name: str = "") -> Any:
         content = code_match.group(1).strip()
         # 去掉代码块后再尝试直接解析
         try:
-            return json.loads(content)
+            return _loads(content)
         except json.JSONDecodeError:
             pass
     
@@ -61,7 +72,7 @@ def extract_json(raw_content: str, model_name: str = "") -> Any:
     if obj_start != -1 and obj_end != -1 and obj_end > obj_start:
         json_str = content[obj_start:obj_end + 1]
         try:
-            return json.loads(json_str)
+            return _loads(json_str)
         except json.JSONDecodeError:
             pass  # 继续尝试修复
     
@@ -72,7 +83,7 @@ def extract_json(raw_content: str, model_name: str = "") -> Any:
     if arr_start != -1 and arr_end != -1 and arr_end > arr_start:
         json_str = content[arr_start:arr_end + 1]
         try:
-            return json.loads(json_str)
+            return _loads(json_str)
         except json.JSONDecodeError:
             pass
     
@@ -106,6 +117,25 @@ def safe_extract_json(raw_content: str, model_name: str = "", fallback: Any = No
         return fallback
 
 
+# 流式输出中 reply_text 字段已生成的部分（字符串可能尚未闭合）
+_PARTIAL_REPLY_RE = re.compile(r'"reply_text"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def partial_reply_text(content: str) -> Optional[str]:
+    """从尚未完整的 JSON 中取出 reply_text 当前已生成的内容"""
+    match = _PARTIAL_REPLY_RE.search(content)
+    if not match:
+        return None
+    raw = match.group(1)
+    # 末尾的转义序列可能还没生成完整，去掉后再解码
+    for end in range(len(raw), max(len(raw) - 6, -1), -1):
+        try:
+            return orjson.loads(f'"{raw[:end]}"')
+        except orjson.JSONDecodeError:
+            continue
+    return None
+
+
 def _try_repair_json(truncated: str) -> Optional[Any]:
     """尝试修复被截断的 JSON 字符串（支持 object 和 array）"""
     text = truncated.rstrip()
@@ -126,7 +156,7 @@ def _try_repair_json(truncated: str) -> Optional[Any]:
             if open_braces >= 0 and open_brackets >= 0:
                 candidate += ']' * open_brackets + '}' * open_braces
                 try:
-                    return json.loads(candidate)
+                    return _loads(candidate)
                 except json.JSONDecodeError:
                     continue
     
@@ -13,13 +13,14 @@
 - 智能风险评估
 """
 import logging
+import re
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta, date
 from collections import defaultdict
 import statistics
 import json
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func, select
 
 from app.database import SessionLocal
 from app.models import LifeStream, DailySummary
@@ -35,6 +36,12 @@ def _matches_cat(record, cat: str) -> bool:
 
 logger = logging.getLogger(__name__)
 
+# 心情关键词（编译为正则，每条记录各扫描一次）
+NEGATIVE_MOOD_KEYWORDS = ("焦虑", "紧张", "担心", "压力", "烦躁", "沮丧", "难过", "累", "疲惫", "失眠", "不安")
+POSITIVE_MOOD_KEYWORDS = ("开心", "快乐", "满足", "放松", "平静", "充实", "愉快", "期待")
+_NEGATIVE_MOOD_RE = re.compile("|".join(NEGATIVE_MOOD_KEYWORDS))
+_POSITIVE_MOOD_RE = re.compile("|".join(POSITIVE_MOOD_KEYWORDS))
+
 
 class Predictor:
     """预测与异常检测器"""
@@ -357,22 +364,15 @@ class Predictor:
             start_time = datetime.combine(target_date, datetime.min.time())
             end_time = datetime.combine(target_date + timedelta(days=1), datetime.min.time())
             
-            records = self.db.query(LifeStream).filter(
-                and_(
+            day_avg = self.db.execute(
+                select(func.avg(LifeStream.avg_score)).where(
                     LifeStream.created_at >= start_time,
-                    LifeStream.created_at < end_time
+                    LifeStream.created_at < end_time,
                 )
-            ).all()
+            ).scalar()
             
-            if records:
-                day_scores = []
-                for r in records:
-                    if r.dimension_scores:
-                        avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                        day_scores.append(avg)
-                
-                if day_scores:
-                    scores.append(statistics.mean(day_scores))
+            if day_avg is not None:
+                scores.append(day_avg)
         
         return scores
     
@@ -380,39 +380,25 @@ class Predictor:
         """获取最近的趋势"""
         start_date = datetime.now() - timedelta(days=days)
         
-        records = self.db.query(LifeStream).filter(
-            LifeStream.created_at >= start_date
-        ).order_by(LifeStream.created_at).all()
+        # 按天计算平均分（数据库中 GROUP BY，按日期升序）
+        day = func.date(LifeStream.created_at)
+        rows = self.db.execute(
+            select(func.count(), func.avg(LifeStream.avg_score))
+            .where(LifeStream.created_at >= start_date)
+            .group_by(day)
+            .order_by(day)
+        ).all()
         
-        if len(records) < 3:
+        if sum(n for n, _ in rows) < 3:
             return {"direction": "stable", "strength": 0}
         
-        # 按天计算平均分
-        daily_scores: Dict[str, List[float]] = defaultdict(list)
-        
-        for r in records:
-            if r.created_at and r.dimension_scores:
-                date_key = r.created_at.strftime("%Y-%m-%d")
-                avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                daily_scores[date_key].append(avg)
-        
-        if len(daily_scores) < 2:
+        daily_avgs = [avg for _, avg in rows if avg is not None]
+        if len(daily_avgs) < 2:
             return {"direction": "stable", "strength": 0}
         
-        # 计算趋势
-        sorted_days = sorted(daily_scores.keys())
-        first_half = sorted_days[:len(sorted_days)//2]
-        second_half = sorted_days[len(sorted_days)//2:]
-        
-        first_avg = statistics.mean([
-            statistics.mean(daily_scores[d]) for d in first_half if daily_scores[d]
-        ]) if first_half else 50
-        
-        second_avg = statistics.mean([
-            statistics.mean(daily_scores[d]) for d in second_half if daily_scores[d]
-        ]) if second_half else 50
-        
-        diff = second_avg - first_avg
+        # 计算趋势：后半段日均分 - 前半段日均分
+        half = len(daily_avgs) // 2
+        diff = statistics.fmean(daily_avgs[half:]) - statistics.fmean(daily_avgs[:half])
         
         if diff > 3:
             return {"direction": "up", "strength": min(abs(diff), 15)}
@@ -494,10 +480,9 @@ class Predictor:
         daily_scores: Dict[str, List[float]] = defaultdict(list)
         
         for r in records:
-            if r.created_at and r.dimension_scores:
+            if r.created_at and r.avg_score is not None:
                 date_key = r.created_at.strftime("%Y-%m-%d")
-                avg = sum(r.dimension_scores.values()) / len(r.dimension_scores)
-                daily_scores[date_key].append(avg)
+                daily_scores[date_key].append(r.avg_score)
         
         if len(daily_scores) < 3:
             return anomalies
@@ -755,14 +740,12 @@ class Predictor:
         """检查运动模式"""
         start_date = datetime.now() - timedelta(days=7)
         
-        activity_records = self.db.query(LifeStream).filter(
+        activity_count = self.db.query(func.count(LifeStream.id)).filter(
             and_(
                 LifeStream.created_at >= start_date,
                 LifeStream.category == "ACTIVITY"
             )
-        ).all()
-        
-        activity_count = len(activity_records)
+        ).scalar()
         
         if activity_count == 0:
             return {
@@ -789,7 +772,8 @@ class Predictor:
         """检查屏幕时间模式"""
         start_date = datetime.now() - timedelta(days=7)
         
-        screen_records = self.db.query(LifeStream).filter(
+        # 只需要时间和屏幕时长，不加载其他 JSON 列
+        screen_records = self.db.query(LifeStream.created_at, LifeStream.meta_data).filter(
             and_(
                 LifeStream.created_at >= start_date,
                 LifeStream.category == "SCREEN"
@@ -867,24 +851,17 @@ class Predictor:
             }
         
         # 分析心情标签
-        negative_keywords = ["焦虑", "紧张", "担心", "压力", "烦躁", "沮丧", "难过", "累", "疲惫", "失眠", "不安"]
-        positive_keywords = ["开心", "快乐", "满足", "放松", "平静", "充实", "愉快", "期待"]
-        
         negative_count = 0
         positive_count = 0
         
         for r in mood_records:
             content = (r.raw_content or "") + " " + " ".join(r.tags or [])
             
-            for kw in negative_keywords:
-                if kw in content:
-                    negative_count += 1
-                    break
+            if _NEGATIVE_MOOD_RE.search(content):
+                negative_count += 1
             
-            for kw in positive_keywords:
-                if kw in content:
-                    positive_count += 1
-                    break
+            if _POSITIVE_MOOD_RE.search(content):
+                positive_count += 1
         
         if negative_count >= 4 and negative_count > positive_count:
             return {
@@ -968,7 +945,7 @@ class Predictor:
                     {"role": "system", "content": "你是一个生活状态预测专家。基于用户的历史数据模式进行预测。"},
                     {"role": "user", "content": prompt}
                 ],
-                model=ai_client.models["text"],
+                model=ai_client.models.text,
                 max_tokens=3000,
                 task_type="ai_prediction",
                 task_description="AI 次日预测",
@@ -1049,7 +1026,7 @@ class Predictor:
                     {"role": "system", "content": "你是一个健康风险分析专家。提供客观、有建设性的分析，避免过度担忧。"},
                     {"role": "user", "content": prompt}
                 ],
-                model=ai_client.models["text"],
+                model=ai_client.models.text,
                 max_tokens=3000,
                 task_type="risk_detection",
                 task_description="AI 风险检测",
@@ -14,9 +14,12 @@
 import os
 import json
 import logging
+import threading
+import time
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from operator import itemgetter
 import chromadb
 from chromadb.config import Settings
 from openai import OpenAI
@@ -32,6 +35,13 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# 查询向量 LRU 缓存条数（对话中重复/相近的提问不再重复请求嵌入模型）
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
+# 检索结果缓存：同一查询向量 + 参数直接返回上次结果；索引变更时整体清空
+SEARCH_RESULT_CACHE_SIZE = 256
+SEARCH_RESULT_CACHE_TTL = 300
+
 
 class RAGService:
     """RAG 服务 - 个人知识库"""
@@ -60,6 +70,12 @@ class RAGService:
         self.embedding_model = settings.embedding_model
         self.smart_model = settings.smart_model  # 用于问答的高级模型
         
+        # 查询向量缓存（搜索在线程池中执行，读写加锁）
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        self._search_results: "OrderedDict[tuple, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._search_results_lock = threading.Lock()
+        
         # 数据库
         self.db: Session = SessionLocal()
     
@@ -103,6 +119,7 @@ class RAGService:
                 documents=[doc_text],
                 metadatas=[metadata]
             )
+            self._clear_search_results()
             
             return True
         except Exception as e:
@@ -113,6 +130,7 @@ class RAGService:
         """从向量数据库中删除指定记录"""
         try:
             self.collection.delete(ids=[str(record_id)])
+            self._clear_search_results()
             logger.info(f"已从 RAG 索引中删除记录: {record_id}")
             return True
         except Exception as e:
@@ -232,6 +250,27 @@ class RAGService:
             logger.error(f"获取嵌入向量失败: {e}")
             return None
     
+    def get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """获取查询文本的嵌入向量（LRU 缓存，失败结果不缓存）"""
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(query)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(query)
+                return embedding
+        
+        embedding = self._get_embedding(query)
+        if embedding:
+            with self._query_embeddings_lock:
+                self._query_embeddings[query] = embedding
+                if len(self._query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_embeddings.popitem(last=False)
+        return embedding
+    
+    def _clear_search_results(self):
+        """索引内容变化后清空检索结果缓存"""
+        with self._search_results_lock:
+            self._search_results.clear()
+    
     # ========== 语义搜索 ==========
     
     def search(
@@ -242,12 +281,30 @@ class RAGService:
         date_range: Optional[tuple] = None
     ) -> List[Dict[str, Any]]:
         """语义搜索"""
+        query_embedding = self.get_query_embedding(query)
+        if not query_embedding:
+            return []
+        return self.search_by_vector(query_embedding, n_results=n_results, category=category)
+    
+    def search_by_vector(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        category: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """按已有查询向量做语义搜索（调用方已算好向量时省去一次嵌入请求）
+
+        结果按 (向量, n_results, category) 缓存，索引未变化时重复查询不再访问向量库。
+        """
+        key = (tuple(query_embedding), n_results, category)
+        now = time.monotonic()
+        with self._search_results_lock:
+            hit = self._search_results.get(key)
+            if hit is not None and hit[0] > now:
+                self._search_results.move_to_end(key)
+                return list(hit[1])
+        
         try:
-            # 获取查询向量
-            query_embedding = self._get_embedding(query)
-            if not query_embedding:
-                return []
-            
             # 构建过滤条件（category 同时匹配主分类和副分类）
             where_filter = None
             if category:
@@ -278,7 +335,12 @@ class RAGService:
                         "relevance": 1 - (results["distances"][0][i] if results["distances"] else 0)
                     })
             
-            return formatted
+            with self._search_results_lock:
+                self._search_results[key] = (now + SEARCH_RESULT_CACHE_TTL, formatted)
+                self._search_results.move_to_end(key)
+                if len(self._search_results) > SEARCH_RESULT_CACHE_SIZE:
+                    self._search_results.popitem(last=False)
+            return list(formatted)
         except Exception as e:
             logger.error(f"搜索失败: {e}")
             return []
@@ -334,7 +396,7 @@ class RAGService:
                 "similarity_score": round(score, 2),
                 "sample_content": day_docs[d][:2]
             }
-            for d, score in sorted(day_scores.items(), key=lambda x: x[1], reverse=True)[:n_results]
+            for d, score in sorted(day_scores.items(), key=itemgetter(1), reverse=True)[:n_results]
         ]
         
         return similar_days
@@ -448,6 +510,7 @@ class RAGService:
                 name="life_records",
                 metadata={"description": "Personal life records for RAG"}
             )
+            self._clear_search_results()
             return {"status": "cleared", "count": 0}
         except Exception as e:
             return {"error": str(e)}
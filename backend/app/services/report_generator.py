@@ -56,18 +56,15 @@ class ReportGenerator:
         start_time = datetime.combine(start_date, datetime.min.time())
         end_time = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
         
-        records = self.db.query(LifeStream).filter(
+        # 统计各类别记录数（数据库中 GROUP BY，不加载记录）
+        category = func.coalesce(LifeStream.category, "OTHER")
+        category_counts = dict(self.db.query(category, func.count(LifeStream.id)).filter(
             and_(
                 LifeStream.created_at >= start_time,
                 LifeStream.created_at < end_time
             )
-        ).all()
-        
-        # 统计各类别记录数
-        category_counts = {}
-        for r in records:
-            cat = r.category or "OTHER"
-            category_counts[cat] = category_counts.get(cat, 0) + 1
+        ).group_by(category).all())
+        total_records = sum(category_counts.values())
         
         # 计算每天的 Vibe 分数
         daily_vibes = []
@@ -97,14 +94,14 @@ class ReportGenerator:
         
         # 生成洞察
         insights = self._generate_period_insights(
-            records, avg_vibe, category_counts, period_type
+            total_records, avg_vibe, category_counts, period_type
         )
         
         return {
             "period_type": period_type,
             "start_date": start_date.isoformat(),
             "end_date": end_date.isoformat(),
-            "total_records": len(records),
+            "total_records": total_records,
             "category_breakdown": category_counts,
             "average_vibe_score": avg_vibe,
             "best_day": best_day,
@@ -115,7 +112,7 @@ class ReportGenerator:
     
     def _generate_period_insights(
         self,
-        records: List[LifeStream],
+        total: int,
         avg_vibe: Optional[int],
         category_counts: Dict[str, int],
         period_type: str
@@ -137,7 +134,6 @@ class ReportGenerator:
                 insights.append(f"{period_name}状态不太理想，平均 Vibe 指数仅 {avg_vibe} 分")
         
         # 记录活跃度
-        total = len(records)
         if total > 20:
             insights.append(f"共记录 {total} 条数据，非常活跃！")
         elif total > 10:
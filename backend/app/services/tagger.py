@@ -10,6 +10,7 @@ import logging
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from collections import defaultdict
+from operator import itemgetter
 import json
 
 from sqlalchemy.orm import Session
@@ -198,7 +199,7 @@ class TaggerAgent:
                         related_scores[related_tag] += count
         
         # 按分数排序
-        sorted_tags = sorted(related_scores.items(), key=lambda x: x[1], reverse=True)
+        sorted_tags = sorted(related_scores.items(), key=itemgetter(1), reverse=True)
         return [tag for tag, _ in sorted_tags[:limit]]
     
     async def get_trending_tags(self, days: int = 7, limit: int = 20) -> List[str]:
@@ -219,7 +220,7 @@ class TaggerAgent:
                         tag_counts[tag] += 1
             
             # 按使用次数排序
-            sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
+            sorted_tags = sorted(tag_counts.items(), key=itemgetter(1), reverse=True)
             return [tag for tag, _ in sorted_tags[:limit]]
             
         finally:
@@ -253,13 +254,13 @@ class TaggerAgent:
                             category_counts[category] += 1
             
             # 找出最活跃的日期
-            most_active_day = max(daily_counts.items(), key=lambda x: x[1]) if daily_counts else (None, 0)
+            most_active_day = max(daily_counts.items(), key=itemgetter(1)) if daily_counts else (None, 0)
             
             return {
                 "period_days": days,
                 "total_tags_used": sum(tag_counts.values()),
                 "unique_tags": len(tag_counts),
-                "top_tags": sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:10],
+                "top_tags": sorted(tag_counts.items(), key=itemgetter(1), reverse=True)[:10],
                 "category_distribution": dict(category_counts),
                 "most_active_day": {"date": most_active_day[0], "count": most_active_day[1]},
                 "avg_tags_per_day": round(sum(tag_counts.values()) / max(len(daily_counts), 1), 1),
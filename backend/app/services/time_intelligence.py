@@ -14,11 +14,13 @@
 - 智能提醒生成
 """
 import logging
+import re
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta, time
 from collections import defaultdict
+from operator import itemgetter
 import json
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from sqlalchemy import and_, func
 
 from app.database import SessionLocal
@@ -49,6 +51,29 @@ TIME_PERIOD_NAMES = {
     "late_night": "深夜",
 }
 
+# 心情关键词（按优先级排列，一段文本命中多个心情时取靠前的）
+MOOD_KEYWORDS = {
+    "开心": ["开心", "快乐", "高兴", "愉快", "兴奋"],
+    "平静": ["平静", "放松", "安宁", "淡定"],
+    "焦虑": ["焦虑", "紧张", "担心", "不安"],
+    "疲惫": ["累", "疲惫", "疲劳", "困"],
+    "沮丧": ["沮丧", "难过", "伤心", "失落"],
+    "满足": ["满足", "充实", "成就"],
+}
+_MOOD_RANK = {kw: rank for rank, kws in enumerate(MOOD_KEYWORDS.values()) for kw in kws}
+_MOOD_NAMES = list(MOOD_KEYWORDS)
+# 所有关键词编译为一个正则，每段文本只扫描一次；
+# 用零宽前瞻在每个位置匹配，相互重叠的关键词（如“不安宁”中的“不安”和“安宁”）都能命中
+_MOOD_RE = re.compile("(?=(" + "|".join(map(re.escape, sorted(_MOOD_RANK, key=len, reverse=True))) + "))")
+
+
+def _classify_mood(text: str) -> Optional[str]:
+    """返回文本命中的优先级最高的心情，未命中返回 None"""
+    hits = _MOOD_RE.findall(text)
+    if not hits:
+        return None
+    return _MOOD_NAMES[min(_MOOD_RANK[kw] for kw in hits)]
+
 # 生物钟类型
 CHRONOTYPE = {
     "lion": {"name": "狮子型", "peak": (6, 10), "description": "早起者，上午效率最高", "emoji": "🦁"},
@@ -82,7 +107,7 @@ class TimeIntelligence:
         
         records = self.db.query(LifeStream).filter(
             LifeStream.created_at >= start_date
-        ).all()
+        ).options(defer(LifeStream.dimension_scores)).all()
         
         if not records:
             return self._empty_circadian_result()
@@ -105,8 +130,8 @@ class TimeIntelligence:
                             category_by_hour[hour][sc] += 1
                 
                 # 计算该记录的综合得分
-                if record.dimension_scores:
-                    avg_score = sum(record.dimension_scores.values()) / len(record.dimension_scores)
+                if record.avg_score is not None:
+                    avg_score = record.avg_score
                     hourly_activity[hour].append(avg_score)
         
         # 计算每小时平均活跃度和得分
@@ -158,7 +183,7 @@ class TimeIntelligence:
         
         records = self.db.query(LifeStream).filter(
             LifeStream.created_at >= start_date
-        ).all()
+        ).options(defer(LifeStream.dimension_scores)).all()
         
         # 按星期几统计
         weekday_stats: Dict[int, Dict] = {i: {"count": 0, "scores": []} for i in range(7)}
@@ -168,8 +193,8 @@ class TimeIntelligence:
                 weekday = record.created_at.weekday()
                 weekday_stats[weekday]["count"] += 1
                 
-                if record.dimension_scores:
-                    avg_score = sum(record.dimension_scores.values()) / len(record.dimension_scores)
+                if record.avg_score is not None:
+                    avg_score = record.avg_score
                     weekday_stats[weekday]["scores"].append(avg_score)
         
         # 计算每天的平均分
@@ -219,7 +244,7 @@ class TimeIntelligence:
         
         records = self.db.query(LifeStream).filter(
             LifeStream.created_at >= start_date
-        ).all()
+        ).options(defer(LifeStream.dimension_scores)).all()
         
         # 按月份日期分组
         day_of_month_stats: Dict[str, List[float]] = {
@@ -237,8 +262,8 @@ class TimeIntelligence:
                 
                 monthly_stats[month_key]["count"] += 1
                 
-                if record.dimension_scores:
-                    avg_score = sum(record.dimension_scores.values()) / len(record.dimension_scores)
+                if record.avg_score is not None:
+                    avg_score = record.avg_score
                     monthly_stats[month_key]["scores"].append(avg_score)
                     
                     if day <= 10:
@@ -353,7 +378,7 @@ class TimeIntelligence:
                 LifeStream.created_at >= start_date,
                 LifeStream.created_at < end_date
             )
-        ).all()
+        ).options(defer(LifeStream.dimension_scores)).all()
         
         # 按日期聚合
         daily_data: Dict[str, Dict] = defaultdict(lambda: {"count": 0, "scores": []})
@@ -363,8 +388,8 @@ class TimeIntelligence:
                 date_key = record.created_at.strftime("%Y-%m-%d")
                 daily_data[date_key]["count"] += 1
                 
-                if record.dimension_scores:
-                    avg_score = sum(record.dimension_scores.values()) / len(record.dimension_scores)
+                if record.avg_score is not None:
+                    avg_score = record.avg_score
                     daily_data[date_key]["scores"].append(avg_score)
         
         # 生成完整年份数据
@@ -495,7 +520,10 @@ class TimeIntelligence:
         """分析各类活动的最佳时间"""
         start_date = datetime.now() - timedelta(days=60)
         
-        records = self.db.query(LifeStream).filter(
+        # 只需要时间和分类，不加载 dimension_scores / meta_data 等 JSON 列
+        records = self.db.query(
+            LifeStream.created_at, LifeStream.category, LifeStream.sub_categories
+        ).filter(
             LifeStream.created_at >= start_date
         ).all()
         
@@ -613,7 +641,7 @@ class TimeIntelligence:
         """
         start_date = datetime.now() - timedelta(days=days)
         
-        records = self.db.query(LifeStream).filter(
+        records = self.db.query(LifeStream.tags, LifeStream.raw_content).filter(
             and_(
                 LifeStream.created_at >= start_date,
                 LifeStream.category == "MOOD"
@@ -621,31 +649,20 @@ class TimeIntelligence:
         ).all()
         
         # 从标签中提取心情关键词
-        mood_keywords = {
-            "开心": ["开心", "快乐", "高兴", "愉快", "兴奋"],
-            "平静": ["平静", "放松", "安宁", "淡定"],
-            "焦虑": ["焦虑", "紧张", "担心", "不安"],
-            "疲惫": ["累", "疲惫", "疲劳", "困"],
-            "沮丧": ["沮丧", "难过", "伤心", "失落"],
-            "满足": ["满足", "充实", "成就"],
-        }
-        
         mood_counts: Dict[str, int] = defaultdict(int)
         
         for record in records:
             if record.tags:
                 for tag in record.tags:
-                    for mood, keywords in mood_keywords.items():
-                        if any(kw in tag for kw in keywords):
-                            mood_counts[mood] += 1
-                            break
+                    mood = _classify_mood(tag)
+                    if mood:
+                        mood_counts[mood] += 1
             
             # 也从 raw_content 中提取
             if record.raw_content:
-                for mood, keywords in mood_keywords.items():
-                    if any(kw in record.raw_content for kw in keywords):
-                        mood_counts[mood] += 1
-                        break
+                mood = _classify_mood(record.raw_content)
+                if mood:
+                    mood_counts[mood] += 1
         
         total = sum(mood_counts.values()) or 1
         
@@ -658,7 +675,7 @@ class TimeIntelligence:
                     "count": count,
                     "percentage": round(count / total * 100, 1)
                 }
-                for mood, count in sorted(mood_counts.items(), key=lambda x: x[1], reverse=True)
+                for mood, count in sorted(mood_counts.items(), key=itemgetter(1), reverse=True)
             ]
         }
     
@@ -738,7 +755,7 @@ class TimeIntelligence:
                     {"role": "system", "content": "你是一个专业的时间管理和生物钟分析专家。基于用户的实际数据提供个性化建议。"},
                     {"role": "user", "content": prompt}
                 ],
-                model=ai_client.models["text"],
+                model=ai_client.models.text,
                 max_tokens=5000,
                 task_type="time_analysis",
                 task_description="AI 时间智能分析",
@@ -780,7 +797,7 @@ class TimeIntelligence:
         
         records = self.db.query(LifeStream).filter(
             LifeStream.created_at >= start_date
-        ).all()
+        ).options(defer(LifeStream.dimension_scores)).all()
         
         if len(records) < 20:
             return {
@@ -804,8 +821,8 @@ class TimeIntelligence:
                 date_key = record.created_at.strftime("%Y-%m-%d")
                 hour = record.created_at.hour
                 
-                if record.dimension_scores:
-                    avg = sum(record.dimension_scores.values()) / len(record.dimension_scores)
+                if record.avg_score is not None:
+                    avg = record.avg_score
                     daily_data[date_key]["scores"].append(avg)
                 
                 if record.category:
@@ -1,4 +1,7 @@
 """Token 用量追踪服务"""
+import asyncio
+import logging
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from sqlalchemy.orm import Session
@@ -7,6 +10,51 @@ from sqlalchemy import func, and_
 from app.database import SessionLocal
 from app.models.token_usage import TokenUsage, calculate_cost, TaskType
 
+logger = logging.getLogger(__name__)
+
+
+def build_usage(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    task_type: str,
+    task_description: Optional[str] = None,
+    related_record_id: Optional[str] = None
+) -> TokenUsage:
+    """构建 TokenUsage 记录（计算费用和模型类型，不写库）"""
+    total_tokens = prompt_tokens + completion_tokens
+    cost = calculate_cost(model, prompt_tokens, completion_tokens)
+    
+    # 确定模型类型 (支持 OpenAI 和 智谱AI)
+    # 规则：先判断 embedding → 再判断 flash(免费) → 再判断 v(视觉) → 付费文本
+    model_lower = model.lower()
+    model_type = "other"
+    if "embedding" in model_lower:
+        model_type = "embedding"      # 嵌入模型 (embedding-3, text-embedding-3-small)
+    elif "flash" in model_lower:
+        if "v" in model_lower.split("flash")[0]:
+            model_type = "vision_free" # 免费视觉 (glm-4.6v-flash)
+        else:
+            model_type = "text_free"   # 免费文本 (glm-4.7-flash)
+    elif "4.6v" in model_lower or "4v" in model_lower:
+        model_type = "vision"          # 付费视觉 (glm-4.6v)
+    elif "gpt-4o-mini" in model_lower or "gpt-3.5" in model_lower:
+        model_type = "text"            # 轻量文本 (gpt-4o-mini, gpt-3.5-turbo)
+    elif "gpt-4o" in model_lower or ("glm-4" in model_lower and "flash" not in model_lower):
+        model_type = "smart"           # 高级文本 (gpt-4o, glm-4.7)
+    
+    return TokenUsage(
+        model=model,
+        model_type=model_type,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=total_tokens,
+        estimated_cost=cost,
+        task_type=task_type,
+        task_description=task_description,
+        related_record_id=related_record_id
+    )
+
 
 class TokenTracker:
     """Token 用量追踪器"""
@@ -28,34 +76,10 @@ class TokenTracker:
         related_record_id: Optional[str] = None
     ) -> TokenUsage:
         """记录一次 token 使用"""
-        total_tokens = prompt_tokens + completion_tokens
-        cost = calculate_cost(model, prompt_tokens, completion_tokens)
-        
-        # 确定模型类型 (支持 OpenAI 和 智谱AI)
-        # 规则：先判断 embedding → 再判断 flash(免费) → 再判断 v(视觉) → 付费文本
-        model_lower = model.lower()
-        model_type = "other"
-        if "embedding" in model_lower:
-            model_type = "embedding"      # 嵌入模型 (embedding-3, text-embedding-3-small)
-        elif "flash" in model_lower:
-            if "v" in model_lower.split("flash")[0]:
-                model_type = "vision_free" # 免费视觉 (glm-4.6v-flash)
-            else:
-                model_type = "text_free"   # 免费文本 (glm-4.7-flash)
-        elif "4.6v" in model_lower or "4v" in model_lower:
-            model_type = "vision"          # 付费视觉 (glm-4.6v)
-        elif "gpt-4o-mini" in model_lower or "gpt-3.5" in model_lower:
-            model_type = "text"            # 轻量文本 (gpt-4o-mini, gpt-3.5-turbo)
-        elif "gpt-4o" in model_lower or ("glm-4" in model_lower and "flash" not in model_lower):
-            model_type = "smart"           # 高级文本 (gpt-4o, glm-4.7)
-        
-        usage = TokenUsage(
+        usage = build_usage(
             model=model,
-            model_type=model_type,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
-            total_tokens=total_tokens,
-            estimated_cost=cost,
             task_type=task_type,
             task_description=task_description,
             related_record_id=related_record_id
@@ -178,6 +202,7 @@ class TokenTracker:
             "embedding": "向量嵌入",
             "chat": "AI 对话",
             "daily_digest": "每日摘要",
+            "combined_insights": "仪表盘分析",
             "score_dimensions": "维度评分",
             "other": "其他",
         }
@@ -232,6 +257,116 @@ def get_tracker() -> TokenTracker:
     return _tracker
 
 
+@dataclass(slots=True)
+class UsageRecord:
+    """待写入的一次 token 使用（只保留数值，不持有完整的 API 响应对象）"""
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    task_type: str
+    task_description: Optional[str] = None
+    related_record_id: Optional[str] = None
+
+
+def record_usage_batch(records: List[UsageRecord]):
+    """批量写入 token 使用（独立会话，一次提交）"""
+    if not records:
+        return
+    db = SessionLocal()
+    try:
+        db.add_all([
+            build_usage(
+                model=r.model,
+                prompt_tokens=r.prompt_tokens,
+                completion_tokens=r.completion_tokens,
+                task_type=r.task_type,
+                task_description=r.task_description,
+                related_record_id=r.related_record_id
+            )
+            for r in records
+        ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Token 批量记录失败 ({len(records)} 条): {e}")
+    finally:
+        db.close()
+
+
+class UsageRecorder:
+    """后台批量记录器
+    
+    事件循环内的调用只入队即返回，后台任务每攒满 BATCH_SIZE 条或每 FLUSH_INTERVAL 秒
+    在线程池中批量写入一次，数据库写入不再占用 AI 请求的响应时间。
+    """
+    
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 1.0  # 秒
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def submit(self, record: UsageRecord) -> bool:
+        """入队；不在事件循环中时返回 False，由调用方同步写入"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._consume(self._queue))
+        self._queue.put_nowait(record)
+        return True
+    
+    async def _consume(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            try:
+                deadline = loop.time() + self.FLUSH_INTERVAL
+                while len(batch) < self.BATCH_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 停止时已取出的记录同步写入，避免丢失
+                record_usage_batch(batch)
+                raise
+            await asyncio.to_thread(record_usage_batch, batch)
+    
+    async def flush(self):
+        """停止后台任务并写入队列中剩余的记录（应用退出时调用）"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        record_usage_batch(remaining)
+        self._loop = self._queue = self._task = None
+
+
+_usage_recorder = UsageRecorder()
+
+
+async def flush_usage():
+    """写入所有待记录的 token 使用"""
+    await _usage_recorder.flush()
+
+
 def record_usage(
     model: str,
     prompt_tokens: int,
@@ -239,8 +374,22 @@ def record_usage(
     task_type: str,
     task_description: Optional[str] = None,
     related_record_id: Optional[str] = None
-) -> TokenUsage:
-    """便捷函数：记录 token 使用"""
+) -> Optional[TokenUsage]:
+    """便捷函数：记录 token 使用
+    
+    在事件循环中调用时交给后台批量写入并返回 None；否则同步写入并返回记录。
+    """
+    queued = _usage_recorder.submit(UsageRecord(
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        task_type=task_type,
+        task_description=task_description,
+        related_record_id=related_record_id
+    ))
+    if queued:
+        return None
+    
     tracker = get_tracker()
     return tracker.record(
         model=model,
@@ -13,6 +13,7 @@ Vibing Index 计算服务
 import logging
 from datetime import date, datetime, timedelta
 from typing import Optional, Dict, Any, List
+from operator import itemgetter
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 
@@ -223,7 +224,7 @@ class VibeCalculator:
         insights = []
         
         # 找出最高和最低维度
-        sorted_dims = sorted(dim_averages.items(), key=lambda x: x[1], reverse=True)
+        sorted_dims = sorted(dim_averages.items(), key=itemgetter(1), reverse=True)
         best_dim = sorted_dims[0]
         worst_dim = sorted_dims[-1]
         
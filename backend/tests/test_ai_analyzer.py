@@ -0,0 +1,286 @@
+"""AI 分析器单元测试"""
+import pytest
+from unittest.mock import patch, Mock, AsyncMock
+from datetime import datetime, timedelta
+
+
+class TestAIAnalyzerSummary:
+    """测试记录加载与汇总"""
+
+    @pytest.fixture
+    def analyzer(self):
+        """创建 AIAnalyzer 实例（不依赖 AI 客户端）"""
+        with patch('app.services.ai_analyzer.get_ai_client', side_effect=Exception("no ai")):
+            from app.services.ai_analyzer import AIAnalyzer
+            yield AIAnalyzer()
+
+    def test_load_records_defers_meta_data(self, analyzer, test_db, sample_life_records):
+        """只有需要明细的分类才返回 meta_data，ai_insight 在数据库端截断"""
+        from app.models import LifeStream
+
+        test_db.add(LifeStream(
+            input_type="TEXT",
+            category="WORK",
+            meta_data={"note": "写周报"},
+            ai_insight="效率" * 200,
+            created_at=datetime.now() - timedelta(hours=1),
+        ))
+        test_db.commit()
+
+        start = datetime.now() - timedelta(days=8)
+        records = analyzer._load_records(
+            test_db,
+            LifeStream.created_at >= start,
+            order_by=LifeStream.created_at.desc(),
+        )
+
+        assert len(records) == len(sample_life_records) + 1
+        for r in records:
+            if r.category == "WORK":
+                assert r.meta_data is None
+                assert len(r.ai_insight) == 200
+            else:
+                assert isinstance(r.meta_data, dict)
+
+    def test_summarize_records(self, analyzer, test_db, sample_life_records):
+        """汇总结果包含分类、标签和睡眠明细"""
+        from app.models import LifeStream
+
+        start = datetime.now() - timedelta(days=8)
+        records = analyzer._load_records(
+            test_db,
+            LifeStream.created_at >= start,
+            order_by=LifeStream.created_at.desc(),
+        )
+        summary = analyzer._summarize_records(records)
+
+        assert summary["total_records"] == 21
+        assert summary["categories"] == {"SLEEP": 7, "DIET": 7, "MOOD": 7}
+        assert summary["tags"]["#身体/睡眠"] == 7
+        assert len(summary["sleep_data"]) == 7
+        assert len(summary["diet_data"]) == 7
+        assert sum(summary["daily_counts"].values()) == 21
+        today_key = datetime.now().strftime("%Y-%m-%d")
+        assert summary["daily_counts"][today_key] == 3
+
+
+class TestDailyRollup:
+    """测试写入时维护的每日汇总"""
+
+    def test_rollup_updated_on_write(self, test_db, sample_life_records):
+        """插入和软删除记录后当日汇总同步更新"""
+        from app.models import DailySummary
+
+        today = datetime.now().date()
+        summary = test_db.get(DailySummary, today)
+        assert summary.record_count == 3
+        assert summary.scored_count == 3
+
+        sleep_today = next(
+            r for r in sample_life_records
+            if r.category == "SLEEP" and r.created_at.date() == today
+        )
+        sleep_today.is_deleted = True
+        test_db.commit()
+        test_db.refresh(summary)
+
+        assert summary.record_count == 2
+        assert summary.scored_count == 2
+
+    def test_rollup_moves_with_created_at(self, test_db, sample_life_records):
+        """记录改到其他日期后，原日期和新日期的汇总都重算"""
+        from app.models import DailySummary
+
+        today = datetime.now().date()
+        yesterday = today - timedelta(days=1)
+        record = next(r for r in sample_life_records if r.created_at.date() == today)
+        # 提交后属性已过期，修改时需从数据库加载旧值
+        test_db.expire(record)
+        record.created_at = datetime.combine(yesterday, datetime.min.time())
+        test_db.commit()
+
+        assert test_db.get(DailySummary, today).record_count == 2
+        assert test_db.get(DailySummary, yesterday).record_count == 4
+
+    def test_rebuild_backfills_scores(self, test_db, sample_life_records):
+        """按天重算汇总时回填评分之和与评分记录数"""
+        from app.models import DailySummary
+        from app.models.daily_summary import rebuild_record_rollups
+
+        test_db.query(DailySummary).update({"score_sum": None, "scored_count": None})
+        test_db.commit()
+
+        assert rebuild_record_rollups(test_db.connection()) == 7
+        test_db.commit()
+        test_db.expire_all()
+
+        today = datetime.now().date()
+        summary = test_db.get(DailySummary, today)
+        scores = [r.avg_score for r in sample_life_records if r.created_at.date() == today]
+        assert summary.scored_count == len(scores)
+        assert summary.score_sum == pytest.approx(sum(scores))
+
+    async def test_combined_digest_without_ai(self, test_db, sample_life_records):
+        """AI 不可用时合并分析的今日洞察按当天记录生成"""
+        with patch('app.services.ai_analyzer.get_ai_client', side_effect=Exception("no ai")):
+            from app.services.ai_analyzer import AIAnalyzer
+            analyzer = AIAnalyzer()
+
+        with patch.object(analyzer, "_get_db", return_value=test_db):
+            result = await analyzer.combined_insights()
+
+        assert result["digest"]["has_data"] is True
+        assert result["digest"]["status_summary"] == "今天已记录 3 条数据"
+
+
+class TestCombinedInsights:
+    """测试仪表盘合并分析"""
+
+    @pytest.fixture
+    def analyzer(self, test_db):
+        """使用测试数据库和模拟 AI 客户端的 AIAnalyzer"""
+        with patch('app.services.ai_analyzer.get_ai_client', side_effect=Exception("no ai")):
+            from app.services.ai_analyzer import AIAnalyzer
+            analyzer = AIAnalyzer()
+        analyzer.has_ai = True
+        analyzer.ai_client = Mock()
+        analyzer.ai_client.models.text = "glm-4.7"
+        analyzer.ai_client.chat_completion = AsyncMock(return_value={
+            "content": {
+                "digest": {"status_summary": "状态不错", "findings": []},
+                "trends": {"overall_trend": "stable"},
+                "suggestions": {"focus_area": "睡眠", "suggestions": []},
+            },
+        })
+        with patch.object(analyzer, "_get_db", return_value=test_db):
+            yield analyzer
+
+    async def test_single_llm_call_and_cache(self, analyzer, sample_life_records):
+        """三段结果来自一次调用，数据未变化时命中缓存"""
+        result = await analyzer.combined_insights()
+        again = await analyzer.combined_insights()
+
+        assert analyzer.ai_client.chat_completion.await_count == 1
+        assert again is result
+        assert result["digest"]["has_data"] is True
+        assert result["trends"]["period_days"] == 30
+        assert result["suggestions"]["focus_area"] == "睡眠"
+
+    async def test_suggestions_use_recent_window(self, analyzer, test_db, sample_life_records):
+        """建议只基于最近 14 天的记录，趋势仍统计 30 天"""
+        from app.models import LifeStream
+
+        test_db.add(LifeStream(input_type="TEXT", category="WORK", created_at=datetime.now() - timedelta(days=20)))
+        test_db.commit()
+        await analyzer.combined_insights()
+
+        prompt = analyzer.ai_client.chat_completion.await_args.kwargs["messages"][0]["content"]
+        period, recent = prompt.split("【过去 30 天汇总】")[1].split("【过去 14 天汇总】")
+        assert '"WORK": 1' in period
+        assert "WORK" not in recent
+
+    async def test_cache_invalidated_on_write(self, analyzer, test_db, sample_life_records):
+        """新增记录后重新生成"""
+        from app.models import LifeStream
+
+        await analyzer.combined_insights()
+        test_db.add(LifeStream(input_type="TEXT", category="WORK", created_at=datetime.now()))
+        test_db.commit()
+        await analyzer.combined_insights()
+
+        assert analyzer.ai_client.chat_completion.await_count == 2
+
+
+class TestWeeklyDailySummaries:
+    """测试周度分析复用每日汇总"""
+
+    @pytest.fixture
+    def analyzer(self, test_db):
+        """使用测试数据库的 AIAnalyzer（无 AI）"""
+        with patch('app.services.ai_analyzer.get_ai_client', side_effect=Exception("no ai")):
+            from app.services.ai_analyzer import AIAnalyzer
+            analyzer = AIAnalyzer()
+        with patch.object(analyzer, "_get_db", return_value=test_db):
+            yield analyzer
+
+    def test_past_days_materialized_and_merged(self, analyzer, test_db, sample_life_records):
+        """已结束日期写入 summary_json，合并结果与直接汇总一致"""
+        from app.models import DailySummary
+
+        start_day = (datetime.now() - timedelta(days=7)).date()
+        merged = analyzer._merge_summaries(analyzer._load_daily_summaries(test_db, start_day))
+
+        assert merged["total_records"] == 21
+        assert merged["categories"] == {"SLEEP": 7, "DIET": 7, "MOOD": 7}
+        assert merged["tags"]["#身体/睡眠"] == 7
+
+        today = datetime.now().date()
+        past = test_db.query(DailySummary).filter(DailySummary.date < today).all()
+        assert past and all(row.summary_json is not None for row in past)
+        assert test_db.get(DailySummary, today).summary_json is None
+
+    def test_only_missing_days_loaded(self, analyzer, test_db, sample_life_records):
+        """已缓存和确认为空的日期不再扫描记录，空日期不插入汇总行"""
+        from app.models import DailySummary
+
+        start_day = (datetime.now() - timedelta(days=9)).date()
+        analyzer._load_daily_summaries(test_db, start_day)
+        assert test_db.get(DailySummary, start_day) is None
+
+        with patch.object(analyzer, "_load_records", wraps=analyzer._load_records) as load:
+            analyzer._load_daily_summaries(test_db, start_day)
+
+        # 只剩今天和没有汇总行的空日期需要扫描
+        sql = str(load.call_args.args[1].compile(compile_kwargs={"literal_binds": True}))
+        today = datetime.now().date()
+        assert sql.count("created_at >=") == 2
+        assert str(today) in sql and str(start_day) in sql
+
+    def test_summary_insert_conflict_falls_back_to_update(self, analyzer, test_db, sample_life_records):
+        """汇总行被并发插入时改为更新 summary_json"""
+        from app.models import DailySummary
+
+        yesterday = (datetime.now() - timedelta(days=1)).date()
+        test_db.query(DailySummary).filter(DailySummary.date == yesterday).delete()
+        test_db.commit()
+
+        real_execute = test_db.execute
+        raced = []
+
+        def racing_execute(statement, *args, **kwargs):
+            result = real_execute(statement, *args, **kwargs)
+            # 模拟在 UPDATE 之后、INSERT 之前，记录写入插入了该日期的汇总行
+            if getattr(statement, "is_update", False) and not raced:
+                raced.append(True)
+                real_execute(DailySummary.__table__.insert().values(date=yesterday, record_count=3))
+            return result
+
+        with patch.object(test_db, "execute", side_effect=racing_execute):
+            analyzer._store_summary_json(test_db, yesterday, {"total_records": 3})
+        test_db.commit()
+        test_db.expire_all()
+
+        row = test_db.get(DailySummary, yesterday)
+        assert row.record_count == 3
+        assert row.summary_json == {"total_records": 3}
+
+    def test_summary_cache_keeps_fingerprint(self, analyzer, test_db, sample_life_records):
+        """写入 summary_json 不改变数据指纹"""
+        before = analyzer._data_fingerprint(test_db)
+        analyzer._load_daily_summaries(test_db, (datetime.now() - timedelta(days=7)).date())
+        assert analyzer._data_fingerprint(test_db) == before
+
+    def test_write_invalidates_day_summary(self, analyzer, test_db, sample_life_records):
+        """记录变更后当天的 summary_json 被清空"""
+        from app.models import DailySummary
+
+        yesterday = (datetime.now() - timedelta(days=1)).date()
+        analyzer._load_daily_summaries(test_db, yesterday)
+        assert test_db.get(DailySummary, yesterday).summary_json is not None
+
+        record = next(r for r in sample_life_records if r.created_at.date() == yesterday)
+        record.is_deleted = True
+        test_db.commit()
+        test_db.expire_all()
+
+        assert test_db.get(DailySummary, yesterday).summary_json is None
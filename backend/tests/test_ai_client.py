@@ -32,8 +32,10 @@ class TestAIClient:
     def test_init_with_api_key(self, ai_client):
         """测试客户端初始化"""
         assert ai_client.client is not None
-        assert ai_client.models["vision"] == "glm-4.6v"
-        assert ai_client.models["text_flash"] == "glm-4.7-flash"
+        assert ai_client.models.vision == "glm-4.6v"
+        assert ai_client.models.text_flash == "glm-4.7-flash"
+        with pytest.raises(AttributeError):
+            ai_client.models.text = "other"
     
     def test_init_without_api_key(self):
         """测试无 API Key 时的初始化"""
@@ -52,6 +54,18 @@ class TestAIClient:
             client = AIClient()
             assert client.client is None
     
+    def test_openai_client_shared(self, mock_settings):
+        """各服务共用同一个 AsyncOpenAI 客户端，配置变化时重建"""
+        with patch('app.services.ai_client.settings', mock_settings):
+            from app.services.ai_client import AIClient, get_openai_client
+            
+            assert AIClient().client is get_openai_client()
+            
+            mock_settings.get_ai_api_key.return_value = "other-key"
+            rebuilt = get_openai_client()
+            assert rebuilt.api_key == "other-key"
+            assert rebuilt is get_openai_client()
+    
     def test_is_retryable_error_rate_limit(self, ai_client):
         """测试速率限制错误可重试"""
         error = Exception("Error code: 429 - rate limit exceeded")
@@ -67,6 +81,38 @@ class TestAIClient:
         error = Exception("Invalid API key")
         assert ai_client._is_retryable_error(error) is False
     
+    def test_is_retryable_error_by_type(self, ai_client):
+        """测试按异常类型判断可重试"""
+        import httpx
+        import openai
+        
+        request = httpx.Request("POST", "https://test.api.com/chat/completions")
+        
+        def status_error(status, message):
+            response = httpx.Response(status, request=request)
+            return openai.APIStatusError(message, response=response, body=None)
+        
+        assert ai_client._is_retryable_error(status_error(503, "Service Unavailable")) is True
+        assert ai_client._is_retryable_error(openai.APITimeoutError(request=request)) is True
+        # 错误信息中包含数字不应误判
+        assert ai_client._is_retryable_error(status_error(400, "max_tokens 500 exceeds limit")) is False
+    
+    def test_get_retry_after(self, ai_client):
+        """测试从 429 响应头解析等待时间"""
+        import httpx
+        import openai
+        
+        def rate_limit_error(headers):
+            request = httpx.Request("POST", "https://test.api.com/chat/completions")
+            response = httpx.Response(429, headers=headers, request=request)
+            return openai.RateLimitError("Error code: 429", response=response, body=None)
+        
+        assert ai_client._get_retry_after(rate_limit_error({"retry-after": "2"})) == 2.0
+        assert ai_client._get_retry_after(rate_limit_error({"retry-after-ms": "1500"})) == 1.5
+        assert ai_client._get_retry_after(rate_limit_error({"x-ratelimit-reset-requests": "3s"})) == 3.0
+        assert ai_client._get_retry_after(rate_limit_error({})) is None
+        assert ai_client._get_retry_after(Exception("Error code: 429")) is None
+    
     def test_get_fallback_model(self, ai_client):
         """测试模型降级"""
         # 付费模型降级到免费模型
@@ -191,3 +237,455 @@ class TestAIClientAsync:
                 )
             
             assert "未配置" in str(exc_info.value)
+    
+    @pytest.fixture
+    def breaker(self):
+        """替换为独立的熔断器，避免测试间共享状态"""
+        from app.services.ai_client import ModelCircuitBreaker
+        breaker = ModelCircuitBreaker()
+        with patch('app.services.ai_client._circuit_breaker', breaker):
+            yield breaker
+    
+    def test_circuit_breaker_trips_and_recovers(self, ai_client_with_mock, breaker):
+        """连续失败熔断，冷却后半开，连续成功后恢复"""
+        from app.services.ai_client import ModelCircuitBreaker
+        
+        model = ai_client_with_mock.models.text
+        for _ in range(ModelCircuitBreaker.FAILURE_THRESHOLD):
+            breaker.record_failure(model)
+        assert breaker.state(model) == ModelCircuitBreaker.OPEN
+        assert not ai_client_with_mock.is_healthy()
+        assert breaker.metrics["opens"] == 1
+        
+        breaker._opened_at[model] -= ModelCircuitBreaker.COOLDOWN
+        assert breaker.allow(model)
+        assert breaker.state(model) == ModelCircuitBreaker.HALF_OPEN
+        breaker.record_success(model)
+        assert breaker.state(model) == ModelCircuitBreaker.HALF_OPEN
+        breaker.record_success(model)
+        assert breaker.state(model) == ModelCircuitBreaker.CLOSED
+        assert ai_client_with_mock.is_healthy()
+    
+    def test_half_open_allows_single_probe(self, breaker):
+        """半开状态同一时间只放行一个探测请求，探测结束或超时后才放行下一个"""
+        from app.services.ai_client import ModelCircuitBreaker
+        
+        model = "glm-4.7"
+        for _ in range(ModelCircuitBreaker.FAILURE_THRESHOLD):
+            breaker.record_failure(model)
+        breaker._opened_at[model] -= ModelCircuitBreaker.COOLDOWN
+        
+        assert breaker.allow(model)
+        assert not breaker.allow(model)
+        breaker.end_probe(model)
+        assert breaker.allow(model)
+        
+        breaker._probe_started[model] -= ModelCircuitBreaker.PROBE_TIMEOUT
+        assert breaker.allow(model)
+        breaker.record_failure(model)
+        assert breaker.state(model) == ModelCircuitBreaker.OPEN
+        assert breaker.metrics["half_open_probes"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_circuit_open_fails_fast(self, ai_client_with_mock, breaker):
+        """熔断中的模型不发起请求，直接报错"""
+        from app.services.ai_client import AIClientError, ModelCircuitBreaker
+        
+        model = ai_client_with_mock.models.text_flash
+        for _ in range(ModelCircuitBreaker.FAILURE_THRESHOLD):
+            breaker.record_failure(model)
+        
+        with pytest.raises(AIClientError) as exc_info:
+            await ai_client_with_mock.chat_completion(
+                messages=[{"role": "user", "content": "Hello"}],
+                model=model,
+                task_type="test"
+            )
+        assert exc_info.value.error_code == "CIRCUIT_OPEN"
+        ai_client_with_mock.client.chat.completions.create.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_get_embeddings_batches_in_order(self, ai_client_with_mock):
+        """批量 embedding 按 index 返回，超过批大小时分多次请求"""
+        from app.services import ai_client as ai_client_module
+        
+        async def fake_create(model, input):
+            response = MagicMock()
+            response.usage.prompt_tokens = len(input)
+            response.data = [
+                MagicMock(index=i, embedding=[float(len(text))])
+                for i, text in reversed(list(enumerate(input)))
+            ]
+            return response
+        
+        client = ai_client_with_mock
+        client.client.embeddings.create = AsyncMock(side_effect=fake_create)
+        texts = ["a" * (i + 1) for i in range(5)]
+        
+        with patch('app.services.ai_client.record_usage'), \
+                patch.object(ai_client_module, "EMBEDDING_BATCH_SIZE", 2):
+            result = await client.get_embeddings(texts)
+        
+        assert result == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+        assert client.client.embeddings.create.await_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_get_embedding_coalesces_concurrent_calls(self, ai_client_with_mock):
+        """并发的单条 embedding 请求合并为一次调用"""
+        import asyncio
+        
+        async def fake_create(model, input):
+            response = MagicMock()
+            response.usage.prompt_tokens = len(input)
+            response.data = [MagicMock(index=i, embedding=[float(i)]) for i in range(len(input))]
+            return response
+        
+        client = ai_client_with_mock
+        client.client.embeddings.create = AsyncMock(side_effect=fake_create)
+        
+        with patch('app.services.ai_client.record_usage'):
+            results = await asyncio.gather(*(client.get_embedding(t) for t in ["x", "y", "z"]))
+        
+        assert results == [[0.0], [1.0], [2.0]]
+        client.client.embeddings.create.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_slot_released_between_retries(self, ai_client_with_mock, breaker):
+        """退避等待期间不占用并发许可，结束后许可全部归还"""
+        from app.services.ai_client import AIClientError, _concurrency_limiter
+        
+        model = "glm-4.7-flash"
+        sem = _concurrency_limiter._get_semaphore(model)
+        initial = sem._value
+        held_during_sleep = []
+        
+        async def fake_sleep(delay):
+            held_during_sleep.append(sem._value)
+        
+        client = ai_client_with_mock
+        client.client.chat.completions.create = AsyncMock(side_effect=Exception("Error code: 503"))
+        with patch('app.services.ai_client.asyncio.sleep', new=fake_sleep):
+            with pytest.raises(AIClientError):
+                await client.chat_completion(
+                    messages=[{"role": "user", "content": "Hello"}],
+                    model=model,
+                    task_type="test"
+                )
+        
+        assert held_during_sleep and all(v == initial for v in held_during_sleep)
+        assert sem._value == initial
+    
+    @pytest.mark.asyncio
+    async def test_chat_completion_stream(self, ai_client_with_mock, breaker):
+        """流式输出逐段返回，结束后记录一次用量"""
+        def make_chunk(text=None, usage=None):
+            chunk = MagicMock()
+            chunk.usage = usage
+            if text is None:
+                chunk.choices = []
+            else:
+                chunk.choices = [MagicMock()]
+                chunk.choices[0].delta.content = text
+            return chunk
+        
+        usage = MagicMock(prompt_tokens=10, completion_tokens=3)
+        chunks = [make_chunk("你"), make_chunk("好"), make_chunk(None, usage)]
+        
+        async def fake_stream():
+            for chunk in chunks:
+                yield chunk
+        
+        client = ai_client_with_mock
+        client.client.chat.completions.create = AsyncMock(return_value=fake_stream())
+        
+        with patch('app.services.ai_client.record_usage') as mock_record:
+            parts = [
+                part async for part in client.chat_completion_stream(
+                    messages=[{"role": "user", "content": "Hello"}],
+                    task_type="test"
+                )
+            ]
+        
+        assert parts == ["你", "好"]
+        mock_record.assert_called_once()
+        assert mock_record.call_args.kwargs["completion_tokens"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_get_embedding_dedups_inflight(self, ai_client_with_mock):
+        """相同文本的并发请求只发送一次"""
+        import asyncio
+        
+        async def fake_create(model, input):
+            response = MagicMock()
+            response.usage.prompt_tokens = len(input)
+            response.data = [MagicMock(index=i, embedding=[0.5]) for i in range(len(input))]
+            return response
+        
+        client = ai_client_with_mock
+        client.client.embeddings.create = AsyncMock(side_effect=fake_create)
+        
+        with patch('app.services.ai_client.record_usage'):
+            results = await asyncio.gather(*(client.get_embedding("same") for _ in range(3)))
+        
+        assert results == [[0.5]] * 3
+        assert client.client.embeddings.create.await_args.kwargs["input"] == ["same"]
+        assert client._inflight_embeddings == {}
+    
+    @pytest.mark.asyncio
+    async def test_vision_completion_with_image_bytes(self, ai_client_with_mock):
+        """原始字节在客户端内编码为 data URL"""
+        client = ai_client_with_mock
+        with patch('app.services.ai_client.record_usage'):
+            await client.vision_completion(
+                prompt="描述图片",
+                image_bytes=b"\x89PNG",
+                mime="image/png",
+                task_type="test"
+            )
+        
+        messages = client.client.chat.completions.create.await_args.kwargs["messages"]
+        assert messages[0]["content"][1]["image_url"]["url"] == "data:image/png;base64,iVBORw=="
+    
+    @pytest.mark.asyncio
+    async def test_model_name_normalized(self, ai_client_with_mock):
+        """传入的模型名在入口统一转为小写"""
+        client = ai_client_with_mock
+        with patch('app.services.ai_client.record_usage'):
+            result = await client.chat_completion(
+                messages=[{"role": "user", "content": "你好"}],
+                model="GLM-4.7",
+                task_type="test"
+            )
+        
+        assert result["model"] == "glm-4.7"
+        assert client.client.chat.completions.create.await_args.kwargs["model"] == "glm-4.7"
+    
+    @pytest.mark.asyncio
+    async def test_json_mode_unsupported_falls_back(self, ai_client_with_mock):
+        """模型拒绝 response_format 时去掉该参数重发，并记住该模型"""
+        import httpx
+        import openai
+        
+        client = ai_client_with_mock
+        create = client.client.chat.completions.create
+        request = httpx.Request("POST", "https://test.api.com/chat/completions")
+        rejected = openai.BadRequestError(
+            "invalid response_format", response=httpx.Response(400, request=request), body=None
+        )
+        create.side_effect = [rejected, create.return_value, create.return_value]
+        
+        with patch('app.services.ai_client.record_usage'):
+            for _ in range(2):
+                result = await client.chat_completion(
+                    messages=[{"role": "user", "content": "Hello"}],
+                    model="glm-4.7-flash",
+                    json_response=True,
+                    task_type="test"
+                )
+        
+        assert result["content"] == {"test": "response"}
+        assert "glm-4.7-flash" in client._json_mode_unsupported
+        assert create.await_count == 3
+        assert "response_format" in create.await_args_list[0].kwargs
+        assert "response_format" not in create.await_args_list[2].kwargs
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_embedding_not_sent(self, ai_client_with_mock):
+        """合并窗口内调用方被取消时不再发起 embedding 请求"""
+        import asyncio
+        
+        client = ai_client_with_mock
+        client.client.embeddings.create = AsyncMock()
+        
+        task = asyncio.create_task(client.get_embedding("x"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.05)
+        
+        client.client.embeddings.create.assert_not_awaited()
+        assert client._inflight_embeddings == {}
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_embedding_owner_keeps_waiters(self, ai_client_with_mock):
+        """发起请求的调用方被取消后，等待相同文本的调用方重新发起并拿到结果"""
+        import asyncio
+        
+        async def fake_create(model, input):
+            response = MagicMock()
+            response.usage.prompt_tokens = len(input)
+            response.data = [MagicMock(index=i, embedding=[0.5]) for i in range(len(input))]
+            return response
+        
+        client = ai_client_with_mock
+        client.client.embeddings.create = AsyncMock(side_effect=fake_create)
+        
+        owner = asyncio.create_task(client.get_embedding("same"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(client.get_embedding("same"))
+        await asyncio.sleep(0)
+        owner.cancel()
+        
+        with patch('app.services.ai_client.record_usage'):
+            assert await waiter == [0.5]
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert client.client.embeddings.create.await_count == 1
+        assert client._inflight_embeddings == {}
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_acquire_keeps_permit(self):
+        """等待许可时被取消不会占用许可"""
+        import asyncio
+        from app.services.ai_client import ModelConcurrencyLimiter
+        
+        limiter = ModelConcurrencyLimiter()
+        sem = limiter._get_semaphore("glm-4.7-flash")
+        await sem.acquire()
+        
+        waiter = asyncio.create_task(limiter.acquire("glm-4.7-flash", timeout=5))
+        await asyncio.sleep(0)
+        sem.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        
+        assert sem._value == 1
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_spaces_requests(self):
+        """令牌桶用完后按速率等待，rate 为 0 时不限制"""
+        from app.services.ai_client import RequestRateLimiter
+        
+        limiter = RequestRateLimiter(rate=2, burst=2)
+        with patch('app.services.ai_client.asyncio.sleep', new=AsyncMock()) as sleep:
+            for _ in range(3):
+                await limiter.wait()
+            await RequestRateLimiter(rate=0).wait()
+        
+        sleep.assert_awaited_once()
+        assert sleep.await_args.args[0] == pytest.approx(0.5, abs=0.05)
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_waits_concurrently(self):
+        """等待令牌的调用方互不阻塞，按预留顺序顺延；取消时归还令牌"""
+        import asyncio
+        from app.services.ai_client import RequestRateLimiter
+        
+        limiter = RequestRateLimiter(rate=2, burst=1)
+        await limiter.wait()
+        gate = asyncio.Event()
+        delays = []
+        real_sleep = asyncio.sleep
+        
+        async def fake_sleep(delay):
+            delays.append(delay)
+            await gate.wait()
+        
+        with patch('app.services.ai_client.asyncio.sleep', new=fake_sleep):
+            waiters = [asyncio.create_task(limiter.wait()) for _ in range(2)]
+            await real_sleep(0)
+            # 第一个调用方等待期间，第二个已预留下一个令牌并开始等待
+            assert delays == [pytest.approx(0.5, abs=0.05), pytest.approx(1.0, abs=0.05)]
+            
+            waiters[1].cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiters[1]
+            assert limiter._tokens == pytest.approx(-1, abs=0.1)
+            gate.set()
+            await waiters[0]
+    
+    @pytest.mark.asyncio
+    async def test_rate_wait_before_permit(self):
+        """等待速率令牌期间不占用并发许可"""
+        import asyncio
+        from app.services.ai_client import ModelConcurrencyLimiter
+        
+        limiter = ModelConcurrencyLimiter()
+        gate = asyncio.Event()
+        
+        async def slow_wait():
+            await gate.wait()
+        
+        with patch('app.services.ai_client._rate_limiter.wait', new=slow_wait):
+            task = asyncio.create_task(limiter.acquire_with_upgrade("glm-4.7-flash"))
+            await asyncio.sleep(0)
+            assert limiter._get_semaphore("glm-4.7-flash")._value == 1
+            gate.set()
+            assert await task == (True, "glm-4.7-flash")
+        
+        assert limiter._get_semaphore("glm-4.7-flash")._value == 0
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_cancel_releases_permit(self):
+        """等待速率令牌时被取消不会占用并发许可"""
+        import asyncio
+        from app.services.ai_client import ModelConcurrencyLimiter
+        
+        limiter = ModelConcurrencyLimiter()
+        with patch('app.services.ai_client._rate_limiter.wait', new=AsyncMock(side_effect=asyncio.CancelledError)):
+            with pytest.raises(asyncio.CancelledError):
+                await limiter.acquire_with_upgrade("glm-4.7-flash")
+        
+        assert limiter._get_semaphore("glm-4.7-flash")._value == 1
+    
+    @pytest.mark.asyncio
+    async def test_limiter_normalizes_model_name(self):
+        """直接使用并发控制器时，大写模型名与小写共用同一个信号量和升级规则"""
+        from app.services.ai_client import ModelConcurrencyLimiter
+        
+        limiter = ModelConcurrencyLimiter()
+        async with limiter.slot("GLM-4.7-Flash") as actual_model:
+            assert actual_model == "glm-4.7-flash"
+            assert limiter._get_semaphore("glm-4.7-flash")._value == 0
+            acquired, upgraded = await limiter.acquire_with_upgrade("GLM-4.7-FLASH", timeout=0.1)
+            assert (acquired, upgraded) == (True, "glm-4.7")
+            limiter.release("GLM-4.7")
+        
+        assert set(limiter._semaphores) == {"glm-4.7-flash", "glm-4.7"}
+        assert limiter._get_semaphore("glm-4.7-flash")._value == 1
+        assert limiter._get_semaphore("glm-4.7")._value == ModelConcurrencyLimiter.MODEL_LIMITS["glm-4.7"]
+    
+    def test_retry_delay_jitter(self, ai_client_with_mock):
+        """指数退避带 0.5~1.5 倍随机抖动"""
+        error = Exception("Error code: 500")
+        delays = {ai_client_with_mock._get_retry_delay(error, 2) for _ in range(20)}
+        
+        assert len(delays) > 1
+        assert all(1.0 <= d <= 3.0 for d in delays)
+    
+    @pytest.mark.asyncio
+    async def test_retry_budget_stops_retries(self, ai_client_with_mock, breaker):
+        """重试等待会超出总时长时直接放弃"""
+        from app.services.ai_client import AIClientError
+        
+        client = ai_client_with_mock
+        client.retry_budget = 0.0
+        client.client.chat.completions.create.side_effect = Exception("Error code: 503")
+        
+        with patch('app.services.ai_client.asyncio.sleep', new=AsyncMock()) as sleep:
+            with pytest.raises(AIClientError) as exc_info:
+                await client.chat_completion(
+                    messages=[{"role": "user", "content": "Hello"}],
+                    task_type="test",
+                    allow_fallback=False
+                )
+        
+        assert exc_info.value.error_code == "MAX_RETRIES_EXCEEDED"
+        assert client.client.chat.completions.create.await_count == 1
+        sleep.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_warmup_failure_is_swallowed(self, ai_client_with_mock):
+        """预热失败只记录日志，不抛出异常"""
+        client = ai_client_with_mock
+        http_client = Mock()
+        http_client.get = AsyncMock(side_effect=Exception("connection refused"))
+        client.client.embeddings.create = AsyncMock()
+        
+        with patch('app.services.ai_client.get_shared_http_client', return_value=http_client):
+            await client.warmup(probe=True)
+        
+        http_client.get.assert_awaited_once()
+        client.client.embeddings.create.assert_not_awaited()
@@ -0,0 +1,227 @@
+"""AI 解析服务单元测试"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def _response(content: str):
+    """构造模拟的补全响应"""
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.usage = None
+    return response
+
+
+class TestAIParser:
+    """测试 AIParser"""
+
+    @pytest.fixture
+    def parser(self):
+        """使用模拟客户端的 AIParser"""
+        with patch('app.services.ai_parser.get_openai_client', return_value=MagicMock()):
+            from app.services.ai_parser import AIParser
+            parser = AIParser()
+        parser.client.chat.completions.create = AsyncMock()
+        return parser
+
+    async def test_invalid_result_repaired(self, parser):
+        """返回内容不符合结构时只发送一次格式修复请求"""
+        create = parser.client.chat.completions.create
+        create.side_effect = [
+            _response('{"category": "UNKNOWN", "reply_text": "x"}'),
+            _response('{"category": "MOOD", "reply_text": "好心情", "tags": ["#心情/开心"]}'),
+        ]
+
+        result = await parser.parse(text="今天心情不错")
+
+        assert create.await_count == 2
+        repair = create.await_args.kwargs
+        assert repair["model"] == parser.text_model
+        assert repair["messages"][1]["content"] == '{"category": "UNKNOWN", "reply_text": "x"}'
+        assert result == {
+            "category": "MOOD",
+            "meta_data": {},
+            "reply_text": "好心情",
+            "tags": ["#心情/开心"],
+        }
+
+    async def test_falls_back_to_mock_after_repair(self, parser):
+        """修复后仍不合法时退回本地解析"""
+        parser.client.chat.completions.create.return_value = _response('{"category": "MOOD"')
+
+        result = await parser.parse(text="今天去跑步了")
+
+        assert parser.client.chat.completions.create.await_count == 2
+        assert result["category"] == "ACTIVITY"
+
+    def test_mock_parse_keyword_priority(self, parser):
+        """本地解析按规则顺序匹配关键词"""
+        assert parser._mock_parse("喝完咖啡睡了一觉", None, None)["category"] == "SLEEP"
+        assert parser._mock_parse("晚饭后去跑步", None, None)["category"] == "DIET"
+        assert parser._mock_parse("Sleep well", None, None)["reply_text"] == "睡眠记录已保存。"
+        assert parser._mock_parse("随便写点", None, None) == {
+            "category": "MOOD",
+            "meta_data": {},
+            "reply_text": "已记录。",
+        }
+
+    async def test_system_prompt_stable(self, parser):
+        """系统提示与输入无关，可变内容都在用户消息中"""
+        from app.services.ai_parser import PARSE_SYSTEM_PROMPT
+
+        create = parser.client.chat.completions.create
+        create.return_value = _response('{"category": "MOOD", "reply_text": "好"}')
+
+        await parser.parse(text="今天心情不错，下午和朋友聊了很久，晚上又去散步看了日落", category_hint="MOOD")
+        await parser.parse(image_base64="aGk=")
+
+        first, second = (call.kwargs["messages"] for call in create.await_args_list)
+        assert first[0]["content"] == second[0]["content"] == PARSE_SYSTEM_PROMPT
+        assert "仅有文字" in first[1]["content"][0]["text"]
+        assert "包含图片" in second[1]["content"][0]["text"]
+        assert [call.kwargs["max_tokens"] for call in create.await_args_list] == [384, 1024]
+
+    async def test_image_url_preferred(self, parser):
+        """提供图片地址时直接引用，不再内联 Base64"""
+        create = parser.client.chat.completions.create
+        create.return_value = _response('{"category": "DIET", "reply_text": "好"}')
+
+        await parser.parse(
+            image_base64="aGk=",
+            image_url="https://example.com/meal.jpg",
+            image_detail="low",
+        )
+
+        image_part = create.await_args.kwargs["messages"][1]["content"][1]
+        assert image_part["image_url"] == {"url": "https://example.com/meal.jpg", "detail": "low"}
+        assert create.await_args.kwargs["model"] == parser.vision_model
+
+    async def test_parse_holds_model_slot(self, parser):
+        """调用期间占用模型并发许可，结束后归还"""
+        from app.services.ai_client import _concurrency_limiter
+
+        sem = _concurrency_limiter._get_semaphore(parser.text_model)
+        initial = sem._value
+        held = []
+
+        async def fake_create(**kwargs):
+            held.append(sem._value)
+            return _response('{"category": "MOOD", "reply_text": "好"}')
+
+        parser.client.chat.completions.create.side_effect = fake_create
+        await parser.parse(text="今天心情不错")
+
+        assert held == [initial - 1]
+        assert sem._value == initial
+
+    async def test_concurrent_text_parses_batched(self, parser):
+        """同一窗口内的纯文字输入合并为一次调用"""
+        import asyncio
+
+        create = parser.client.chat.completions.create
+        create.return_value = _response(
+            '{"results": ['
+            '{"category": "SLEEP", "reply_text": "早睡"},'
+            '{"category": "DIET", "reply_text": "好吃"}'
+            ']}'
+        )
+
+        results = await asyncio.gather(
+            parser.parse(text="昨晚十点睡"),
+            parser.parse(text="午饭吃了面"),
+        )
+
+        create.assert_awaited_once()
+        assert [r["category"] for r in results] == ["SLEEP", "DIET"]
+        prompt = create.await_args.kwargs["messages"][1]["content"]
+        assert "1. 用户输入: 昨晚十点睡" in prompt and "2. 用户输入: 午饭吃了面" in prompt
+
+    async def test_batch_mismatch_falls_back_to_single(self, parser):
+        """合并结果条数不符时逐条单独解析"""
+        import asyncio
+
+        create = parser.client.chat.completions.create
+        create.side_effect = [
+            _response('{"results": [{"category": "SLEEP", "reply_text": "早睡"}]}'),
+            _response('{"category": "SLEEP", "reply_text": "早睡"}'),
+            _response('{"category": "DIET", "reply_text": "好吃"}'),
+        ]
+
+        results = await asyncio.gather(
+            parser.parse(text="昨晚十点睡"),
+            parser.parse(text="午饭吃了面"),
+        )
+
+        assert create.await_count == 3
+        assert sorted(r["category"] for r in results) == ["DIET", "SLEEP"]
+
+    async def test_identical_inputs_cached(self, parser):
+        """相同输入只调用一次，并发的相同请求共用结果"""
+        import asyncio
+
+        create = parser.client.chat.completions.create
+        create.return_value = _response('{"category": "DIET", "meta_data": {"food_name": "冰美式"}, "reply_text": "好"}')
+
+        first, second = await asyncio.gather(
+            parser.parse(text="喝了一杯冰美式"),
+            parser.parse(text="喝了一杯冰美式"),
+        )
+        first["meta_data"]["food_name"] = "已修改"
+        third = await parser.parse(text="喝了一杯冰美式")
+
+        create.assert_awaited_once()
+        assert second["meta_data"]["food_name"] == "冰美式"
+        assert third["meta_data"]["food_name"] == "冰美式"
+
+    def test_current_minute(self):
+        """分钟时间与 datetime.now 一致"""
+        from datetime import datetime
+        from app.services.ai_parser import _current_minute
+
+        before = datetime.now().strftime("%Y-%m-%d %H:%M")
+        value = _current_minute()
+        after = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+        assert value in (before, after)
+        assert _current_minute() in (value, after)
+
+    async def test_short_hinted_text_skips_ai(self, parser):
+        """带分类提示的短文本不调用模型"""
+        result = await parser.parse(text="冰美式", category_hint="diet")
+
+        parser.client.chat.completions.create.assert_not_awaited()
+        assert result == {
+            "category": "DIET",
+            "meta_data": {"food_name": "冰美式"},
+            "reply_text": "饮食记录已保存。",
+            "tags": ["#饮食/进食"],
+        }
+        assert parser.fast_path_count == 1
+
+    async def test_hint_without_template_uses_ai(self, parser):
+        """分类提示没有本地模板时仍调用模型"""
+        parser.client.chat.completions.create = AsyncMock(side_effect=Exception("offline"))
+
+        await parser.parse(text="开会", category_hint="work")
+
+        parser.client.chat.completions.create.assert_awaited()
+        assert parser.fast_path_count == 0
+
+    async def test_parse_stream_yields_partial_reply(self, parser):
+        """流式解析先逐步产出回复，最后产出完整结果"""
+        pieces = ['{"category": "MOOD", "reply_', 'text": "好心', '情是一天', '的好开始"}']
+
+        async def fake_stream():
+            for piece in pieces:
+                chunk = MagicMock()
+                chunk.usage = None
+                chunk.choices[0].delta.content = piece
+                yield chunk
+
+        parser.client.chat.completions.create.return_value = fake_stream()
+
+        frames = [frame async for frame in parser.parse_stream(text="今天心情不错")]
+
+        assert frames[:-1] == [{"partial": "好心"}, {"partial": "好心情是一天"}, {"partial": "好心情是一天的好开始"}]
+        assert frames[-1]["result"]["reply_text"] == "好心情是一天的好开始"
+        assert parser.client.chat.completions.create.await_args.kwargs["stream"] is True
@@ -0,0 +1,402 @@
+"""对话助手单元测试"""
+import re
+import pytest
+from contextlib import nullcontext
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
+
+from app.models import LifeStream
+
+
+class TestChatContext:
+    """测试数据库上下文构建"""
+
+    @pytest.fixture
+    def assistant(self, test_db):
+        """使用测试数据库的 ChatAssistant"""
+        with patch('app.services.chat_assistant.get_openai_client', return_value=MagicMock()):
+            from app.services.chat_assistant import ChatAssistant
+            assistant = ChatAssistant()
+        with patch.object(assistant, "_get_db", return_value=nullcontext(test_db)):
+            yield assistant
+
+    def test_avg_score_maintained_on_write(self, test_db):
+        """写入和修改记录时同步计算维度平均分"""
+        record = LifeStream(input_type="TEXT", category="MOOD", dimension_scores={"body": 60, "mood": 80})
+        test_db.add(record)
+        test_db.commit()
+        assert record.avg_score == 70
+
+        record.dimension_scores = None
+        test_db.commit()
+        assert record.avg_score is None
+
+    def test_daily_window_from_rollup(self, assistant, test_db, sample_life_records):
+        """按天返回记录数与平均分，来自写入时维护的每日汇总"""
+        daily = assistant._daily_window(test_db)
+
+        assert len(daily) == 7
+        assert sum(n for _, n, _, _ in daily) == 21
+        day, count, avg, scored_count = daily[-1]
+        assert day == datetime.now().strftime("%Y-%m-%d")
+        assert count == 3
+        scored = [r.avg_score for r in sample_life_records if r.created_at.date() == datetime.now().date()]
+        assert scored_count == len(scored)
+        assert avg == pytest.approx(sum(scored) / len(scored))
+
+    def test_daily_window_follows_soft_delete(self, assistant, test_db, sample_life_records):
+        """软删除后汇总同步更新，删空的日期不再出现"""
+        oldest = min(r.created_at.date() for r in sample_life_records)
+        for r in sample_life_records:
+            if r.created_at.date() == oldest:
+                r.is_deleted = True
+        test_db.commit()
+
+        daily = assistant._daily_window(test_db)
+
+        assert len(daily) == 6
+        assert oldest.isoformat() not in [day for day, _, _, _ in daily]
+
+    def test_trend_context(self, assistant, test_db, sample_life_records):
+        """趋势上下文每天一行"""
+        context = assistant._get_trend_context(test_db)
+
+        assert context.startswith("[趋势] 每日平均状态分:")
+        assert len(context.splitlines()) == 8
+        assert datetime.now().strftime("%m/%d") in context
+        assert "██████░░░░ 64" in context
+
+    def test_category_stats(self, assistant, test_db, sample_life_records):
+        """按类别返回记录数、平均分和总数"""
+        cats, total = assistant._category_stats(test_db, datetime.now() - timedelta(days=30))
+
+        assert total == 21
+        assert {c: n for c, (n, _) in cats.items()} == {"SLEEP": 7, "DIET": 7, "MOOD": 7}
+        sleep = [r.avg_score for r in sample_life_records if r.category == "SLEEP"]
+        assert cats["SLEEP"][1] == pytest.approx(sum(sleep) / len(sleep))
+
+    def test_today_context(self, assistant, test_db, sample_life_records):
+        """今日上下文只统计今天的记录"""
+        context = assistant._get_today_context(test_db)
+
+        assert context.startswith("[今日] 共 3 条。类别: ")
+        assert "SLEEP: 1" in context
+
+    def test_category_query_uses_index(self, test_db, sample_life_records):
+        """分类 + 时间范围查询使用复合索引（类别等值 + 时间范围）"""
+        from sqlalchemy import text
+
+        test_db.execute(text("ANALYZE"))
+        plan = test_db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM life_stream "
+            "WHERE is_deleted = 0 AND category = 'SLEEP' AND created_at >= '2026-01-01'"
+        )).all()
+
+        assert any(
+            re.search(r"ix_life_stream_(active_)?category_time \(.*category=\? AND created_at>\?\)", row[-1])
+            for row in plan
+        )
+
+    def test_context_cached_until_write(self, assistant, test_db, sample_life_records):
+        """数据未变化时复用统计文本，新增记录后重新查询"""
+        with patch.object(assistant, "_get_today_context", wraps=assistant._get_today_context) as today:
+            first = assistant._gather_db_context("今天怎么样")
+            assert assistant._gather_db_context("今天呢") == first
+            assert today.call_count == 1
+
+            test_db.add(LifeStream(input_type="TEXT", category="WORK", created_at=datetime.now()))
+            test_db.commit()
+            second = assistant._gather_db_context("今天怎么样")
+
+        assert today.call_count == 2
+        assert "[今日] 共 4 条" in second
+
+    def test_context_keywords_single_scan(self, assistant):
+        """一次扫描命中所有关键词，按固定顺序补充上下文"""
+        from app.services.chat_assistant import _CONTEXT_KEYWORDS
+
+        built = []
+        for key, _ in _CONTEXT_KEYWORDS:
+            setattr(assistant, f"_get_{key}_context", lambda db, key=key: built.append(key) or key)
+        assistant._get_overview_context = lambda db: "overview"
+
+        context = assistant._gather_db_context("最近一周的睡眠趋势怎么样，今天最好")
+
+        assert built == ["today", "week", "sleep", "trend", "best_day"]
+        assert context == "overview\n\ntoday\n\nweek\n\nsleep\n\ntrend\n\nbest_day"
+
+    def test_daily_window_shared(self, assistant, test_db, sample_life_records):
+        """本周、本月、趋势和最佳日共用一次按天统计查询，构建结束后不残留"""
+        from app.services.chat_assistant import _DAILY_WINDOW_KEY
+
+        with patch.object(assistant, "_daily_window", wraps=assistant._daily_window) as window, \
+                patch.object(test_db, "execute", wraps=test_db.execute) as execute:
+            context = assistant._gather_db_context("本周和本月的趋势，哪天最好")
+
+        daily_queries = [c for c in execute.call_args_list if "daily_summary.record_count" in str(c.args[0])]
+        assert window.call_count == 4
+        assert len(daily_queries) == 1
+        assert "[本周] 共 21 条" in context
+        assert "[本月] 共 21 条, 平均状态分" in context
+        assert "[最佳日] 最近30天最佳日:" in context
+        assert _DAILY_WINDOW_KEY not in test_db.info
+
+    async def test_fallback_reuses_db_context(self, assistant):
+        """LLM 调用失败时复用已生成的数据上下文"""
+        from unittest.mock import AsyncMock
+
+        assistant._gather_rag_context = lambda message: ""
+        assistant._embed_message = lambda message: None
+        assistant.client.chat.completions.create = AsyncMock(side_effect=RuntimeError("down"))
+
+        with patch.object(assistant, "_gather_db_context", return_value="[概览] 总记录 0 条") as gather:
+            result = await assistant.chat("今天怎么样")
+
+        gather.assert_called_once()
+        assert "[概览] 总记录 0 条" in result["content"]
+
+    def test_category_contexts_stream_columns(self, assistant, test_db, sample_life_records):
+        """睡眠和心情上下文只读取所需列"""
+        sleep = assistant._get_sleep_context(test_db).splitlines()
+        mood = assistant._get_mood_context(test_db).splitlines()
+
+        assert sleep[0] == "[睡眠] 最近14天共 7 条"
+        assert len(sleep) == 8
+        assert re.fullmatch(r"  \d\d/\d\d: \d+h", sleep[1])
+        assert mood[0] == "[心情] 最近14天共 7 条"
+        assert mood[1].endswith("#心情/开心, #时间/下午")
+        assert assistant._get_activity_context(test_db) == "[运动] 最近14天无运动记录"
+
+    def test_overview_context(self, assistant, test_db, sample_life_records):
+        """概览的总数、近 7 天数和类别数来自同一次查询"""
+        test_db.add(LifeStream(input_type="TEXT", category="WORK", created_at=datetime.now() - timedelta(days=20)))
+        test_db.commit()
+
+        context = assistant._get_overview_context(test_db)
+
+        assert context.startswith("[概览] 总记录 22 条, 最近7天 21 条。各类别: ")
+        assert "WORK: 1条" in context
+
+    def test_overview_query_covered_by_index(self, test_db, sample_life_records):
+        """概览分组统计只读覆盖索引，不回表也不额外排序"""
+        from sqlalchemy import text
+
+        test_db.execute(text("ANALYZE"))
+        plan = test_db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT category, count(*), "
+            "sum(CASE WHEN created_at >= '2026-01-01' THEN 1 ELSE 0 END) "
+            "FROM life_stream WHERE is_deleted = 0 GROUP BY category"
+        )).all()
+        details = [row[-1] for row in plan]
+
+        assert any("COVERING INDEX ix_life_stream_active_category_time" in d for d in details)
+        assert not any("TEMP B-TREE" in d for d in details)
+
+    async def test_system_prompt_stable(self, assistant):
+        """系统提示与时间和数据无关，当前时间放在用户消息中"""
+        from unittest.mock import AsyncMock
+        from app.services.chat_assistant import CHAT_SYSTEM_PROMPT
+
+        response = MagicMock()
+        response.choices[0].message.content = "好"
+        create = assistant.client.chat.completions.create = AsyncMock(return_value=response)
+        assistant._embed_message = lambda message: None
+        assistant._gather_contexts = AsyncMock(side_effect=[("db1", ""), ("db2", "rag")])
+
+        await assistant.chat("今天怎么样")
+        await assistant.chat("本周呢", history=[{"role": "user", "content": "你好"}])
+
+        first, second = (call.kwargs["messages"] for call in create.await_args_list)
+        assert first[0] == second[0] == {"role": "system", "content": CHAT_SYSTEM_PROMPT}
+        assert first[-1]["content"].startswith(f"当前: {datetime.now():%Y-%m-%d}")
+
+    async def test_contexts_gathered_in_threads(self, assistant):
+        """数据库和 RAG 上下文在工作线程中获取"""
+        import threading
+
+        main = threading.get_ident()
+        seen = []
+        assistant._gather_db_context = lambda message: seen.append(threading.get_ident()) or "db"
+        assistant._gather_rag_context = lambda message: seen.append(threading.get_ident()) or "rag"
+
+        assert await assistant._gather_contexts("今天") == ("db", "rag")
+        assert len(seen) == 2 and main not in seen
+
+
+class TestSemanticResponseCache:
+    """测试语义回答缓存"""
+
+    def test_similar_question_hits(self):
+        """相似问题且数据上下文一致时命中"""
+        from app.services.chat_assistant import SemanticResponseCache
+
+        cache = SemanticResponseCache(threshold=0.9)
+        cache.set([1.0, 0.0], "ctx", "今天状态不错")
+
+        assert cache.get([0.99, 0.05], "ctx") == "今天状态不错"
+        assert cache.get([0.0, 1.0], "ctx") is None
+        assert cache.get([1.0, 0.0], "other") is None
+
+    def test_expired_and_full(self):
+        """过期条目不命中，写满时清理"""
+        from app.services.chat_assistant import SemanticResponseCache
+
+        cache = SemanticResponseCache(ttl=0, max_entries=2)
+        cache.set([1.0, 0.0], "ctx", "a")
+        assert cache.get([1.0, 0.0], "ctx") is None
+
+        cache.set([1.0, 0.0], "ctx", "b")
+        cache.set([0.0, 1.0], "ctx", "c")
+        assert cache._size == 1
+
+    async def test_chat_reuses_answer(self, test_db):
+        """无历史的相似问题第二次不调用 LLM"""
+        from contextlib import nullcontext
+        from unittest.mock import AsyncMock
+        from app.services.chat_assistant import ChatAssistant
+
+        with patch('app.services.chat_assistant.get_openai_client', return_value=MagicMock()):
+            assistant = ChatAssistant()
+        response = MagicMock()
+        response.choices[0].message.content = "今天状态不错"
+        assistant.client.chat.completions.create = AsyncMock(return_value=response)
+        assistant._gather_rag_context = lambda message: ""
+        assistant._embed_message = lambda message: [1.0, 0.0] if "今天" in message else [0.0, 1.0]
+
+        with patch.object(assistant, "_get_db", return_value=nullcontext(test_db)):
+            first = await assistant.chat("今天怎么样")
+            second = await assistant.chat("今天过得如何")
+            await assistant.chat("今天怎么样", history=[{"role": "user", "content": "你好"}])
+
+        assert first == second == {"type": "markdown", "content": "今天状态不错"}
+        assert assistant.client.chat.completions.create.await_count == 2
+
+    async def test_cache_key_and_relative_days(self, test_db):
+        """检索结果不同不共用缓存；问其他日期的问题不走缓存"""
+        from unittest.mock import AsyncMock
+        from app.services.chat_assistant import ChatAssistant, SemanticResponseCache
+
+        assert SemanticResponseCache.context_key("db", "昨天的记录") != SemanticResponseCache.context_key("db", "前天的记录")
+
+        with patch('app.services.chat_assistant.get_openai_client', return_value=MagicMock()):
+            assistant = ChatAssistant()
+        response = MagicMock()
+        response.choices[0].message.content = "睡得不错"
+        assistant.client.chat.completions.create = AsyncMock(return_value=response)
+        assistant._gather_contexts = AsyncMock(return_value=("db", ""))
+        assistant._embed_message = lambda message: [1.0, 0.0]
+
+        await assistant.chat("我昨天睡得好吗")
+        await assistant.chat("我前天睡得好吗")
+
+        assert assistant.client.chat.completions.create.await_count == 2
+        assert assistant._response_cache._size == 0
+
+    async def test_stream_sends_thinking_frame_first(self, test_db):
+        """准备上下文之前先推送思考中帧"""
+        import asyncio
+        import json
+        from app.services.chat_assistant import ChatAssistant
+
+        with patch('app.services.chat_assistant.get_openai_client', return_value=MagicMock()):
+            assistant = ChatAssistant()
+        gate = asyncio.Event()
+
+        async def slow_contexts(message):
+            await gate.wait()
+            return "db", ""
+
+        assistant._gather_contexts = slow_contexts
+        assistant._embed_message = lambda message: [1.0, 0.0]
+        assistant._response_cache.set([1.0, 0.0], assistant._response_cache.context_key("db", ""), "缓存回答")
+
+        stream = assistant.chat_stream("今天怎么样")
+        first = json.loads((await stream.__anext__())[6:])
+        gate.set()
+        rest = [json.loads(frame[6:]) async for frame in stream]
+
+        assert first == {"content": "", "done": False, "thinking": True}
+        assert rest == [{"content": "缓存回答", "done": False}, {"content": "", "done": True}]
+
+    async def test_stream_frames_are_utf8_bytes(self, test_db):
+        """逐 token 输出 UTF-8 编码的 SSE 帧，中文不转义"""
+        from unittest.mock import AsyncMock
+        from app.services.chat_assistant import ChatAssistant
+
+        with patch('app.services.chat_assistant.get_openai_client', return_value=MagicMock()):
+            assistant = ChatAssistant()
+
+        async def fake_stream():
+            for token in ("状态", "不错"):
+                chunk = MagicMock()
+                chunk.choices[0].delta.content = token
+                yield chunk
+
+        assistant.client.chat.completions.create = AsyncMock(return_value=fake_stream())
+        assistant._gather_contexts = AsyncMock(return_value=("db", ""))
+        assistant._embed_message = lambda message: None
+
+        frames = [frame async for frame in assistant.chat_stream("今天怎么样")]
+
+        assert frames[1:] == [
+            'data: {"content":"状态","done":false}\n\n'.encode(),
+            'data: {"content":"不错","done":false}\n\n'.encode(),
+            b'data: {"content":"","done":true}\n\n',
+        ]
+
+
+class TestChatHistory:
+    """测试发给 LLM 的对话历史"""
+
+    def test_history_messages_truncated(self):
+        """只保留最近几条，超长内容截断"""
+        from app.services.chat_assistant import ChatAssistant, HISTORY_MAX_CHARS
+
+        history = [{"role": "user", "content": "旧消息"}] + [
+            {"role": "assistant", "content": "长" * 400},
+            {"content": "短"},
+            {"role": "assistant", "content": "好"},
+        ]
+
+        assert ChatAssistant._history_messages(history) == [
+            {"role": "assistant", "content": "长" * HISTORY_MAX_CHARS + "..."},
+            {"role": "user", "content": "短"},
+            {"role": "assistant", "content": "好"},
+        ]
+
+    async def test_stream_route_loads_recent_history(self, test_db):
+        """流式接口只从数据库读取最近几条历史，内容在数据库端截断"""
+        from app.models.chat import ChatConversation, ChatMessage
+        from app.routers.chat import stream_message, StreamChatRequest
+        from app.services.chat_assistant import HISTORY_MAX_CHARS
+
+        conv = ChatConversation(title="旧会话")
+        test_db.add(conv)
+        test_db.commit()
+        base = datetime.now() - timedelta(minutes=10)
+        for i in range(6):
+            test_db.add(ChatMessage(
+                conversation_id=conv.id,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"{i}" + "字" * 500,
+                created_at=base + timedelta(minutes=i),
+            ))
+        test_db.commit()
+
+        seen = {}
+
+        async def fake_stream(message, history):
+            seen["history"] = history
+            yield b'data: {"content":"\xe5\xa5\xbd","done":false}\n\n'
+
+        assistant = MagicMock()
+        assistant.chat_stream = fake_stream
+        with patch("app.routers.chat.get_chat_assistant", return_value=assistant), \
+                patch("app.database.SessionLocal", return_value=test_db):
+            response = await stream_message(StreamChatRequest(message="最新问题", conversation_id=conv.id), db=test_db)
+            [chunk async for chunk in response.body_iterator]
+
+        history = seen["history"]
+        assert [h["content"][0] for h in history] == ["3", "4", "5"]
+        assert [h["role"] for h in history] == ["assistant", "user", "assistant"]
+        assert all(len(h["content"]) == HISTORY_MAX_CHARS + 1 for h in history)
@@ -0,0 +1,197 @@
+"""数据提取器单元测试"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def _response(content: str):
+    """构造模拟的补全响应"""
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.choices[0].finish_reason = "stop"
+    response.usage = None
+    return response
+
+
+def _stream(*deltas: str):
+    """构造模拟的流式响应"""
+    chunks = []
+    for i, delta in enumerate(deltas):
+        chunk = MagicMock()
+        chunk.usage = None
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = delta
+        chunk.choices[0].finish_reason = "stop" if i == len(deltas) - 1 else None
+        chunks.append(chunk)
+
+    async def iterate():
+        for chunk in chunks:
+            yield chunk
+
+    return iterate()
+
+
+class TestDataExtractor:
+    """测试 DataExtractor"""
+
+    @pytest.fixture
+    def extractor(self):
+        """使用模拟客户端的 DataExtractor"""
+        with patch('app.services.data_extractor.get_openai_client', return_value=MagicMock()):
+            from app.services.data_extractor import DataExtractor
+            extractor = DataExtractor()
+        extractor.client.chat.completions.create = AsyncMock(
+            return_value=_response('{"category": "DIET", "reply_text": "这顿饭很均衡"}')
+        )
+        return extractor
+
+    async def test_image_url_preferred(self, extractor):
+        """提供图片地址时直接引用，不再内联 Base64"""
+        result = await extractor.extract(
+            image_type="sleep_screenshot",
+            image_base64="aGk=",
+            image_url="https://example.com/sleep.jpg",
+        )
+
+        create = extractor.client.chat.completions.create
+        image_part = create.await_args.kwargs["messages"][1]["content"][0]
+        assert image_part["image_url"]["url"] == "https://example.com/sleep.jpg"
+        assert create.await_args.kwargs["model"] == extractor.vision_model
+        assert result["reply_text"] == "这顿饭很均衡"
+
+    async def test_base64_wrapped_as_data_url(self, extractor):
+        """只有 Base64 时包装为 data URL，纯文本走文本模型"""
+        await extractor.extract(image_type="sleep_screenshot", image_base64="aGk=", text="昨晚")
+        await extractor.extract(image_type="other", text="午饭吃了面")
+
+        first, second = extractor.client.chat.completions.create.await_args_list
+        content = first.kwargs["messages"][1]["content"]
+        assert content[0] == {"type": "text", "text": "用户说明: 昨晚"}
+        assert content[1]["image_url"]["url"] == "data:image/jpeg;base64,aGk="
+        assert second.kwargs["model"] == extractor.text_model
+
+    async def test_images_resized_per_type(self, extractor):
+        """食物照片缩到 1024 像素，风景照用 low，文字截图保留高清"""
+        import base64
+        import io
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGBA", (3000, 1500), (200, 100, 50, 255)).save(buffer, "PNG")
+        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+
+        await extractor.extract(image_type="food", image_base64=image_base64)
+        await extractor.extract(image_type="scenery", image_base64=image_base64)
+        await extractor.extract(image_type="screenshot", image_base64=image_base64)
+
+        sent = [
+            call.kwargs["messages"][1]["content"][0]["image_url"]
+            for call in extractor.client.chat.completions.create.await_args_list
+        ]
+        sizes = [
+            Image.open(io.BytesIO(base64.b64decode(part["url"].split(",", 1)[1]))).size
+            for part in sent
+        ]
+        assert sizes == [(1024, 512), (512, 256), (2048, 1024)]
+        assert [part["detail"] for part in sent] == ["auto", "low", "high"]
+
+    async def test_extract_stream_yields_reply_first(self, extractor):
+        """流式提取先推送 reply_text 增量，最后产出完整结果"""
+        extractor.client.chat.completions.create = AsyncMock(return_value=_stream(
+            '{"category": "DIET", "reply_text": "这顿',
+            '饭很均衡", "meta_data": {"food_items": ["面"]}}',
+        ))
+
+        events = [event async for event in extractor.extract_stream(image_type="other", text="午饭吃了面")]
+
+        assert events[:-1] == [{"partial": "这顿"}, {"partial": "这顿饭很均衡"}]
+        result = events[-1]["result"]
+        assert result["category"] == "DIET"
+        assert result["reply_text"] == "这顿饭很均衡"
+        assert extractor.client.chat.completions.create.await_args.kwargs["stream"] is True
+
+    async def test_extract_many_concurrent(self, extractor):
+        """批量提取并发执行，结果按输入顺序返回，昵称互不覆盖，单条异常回退本地结果"""
+        import asyncio
+
+        async def create(**kwargs):
+            system_prompt = kwargs["messages"][0]["content"]
+            # 第一条等待更久，确保两条请求交错进行
+            await asyncio.sleep(0.02 if "小明" in system_prompt else 0)
+            name = "小明" if "小明" in system_prompt else "小红"
+            return _response(f'{{"category": "MOOD", "reply_text": "{name}，记下了"}}')
+
+        extractor.client.chat.completions.create = AsyncMock(side_effect=create)
+        results = await extractor.extract_many([
+            {"image_type": "other", "text": "心情不错", "nickname": "小明"},
+            {"image_type": "other", "text": "有点累", "nickname": "小红"},
+        ])
+        assert [r["reply_text"] for r in results] == ["小明，记下了", "小红，记下了"]
+
+        from app.services.data_extractor import _nickname_var
+        await extractor.extract(image_type="other", text="心情不错", nickname="小明")
+        assert _nickname_var.get() is None
+
+        with patch.object(extractor, "extract", AsyncMock(side_effect=[RuntimeError("boom"), results[1]])):
+            fallback = await extractor.extract_many([
+                {"image_type": "screenshot", "text": "屏幕"},
+                {"image_type": "other", "text": "有点累"},
+            ])
+        assert fallback[0]["category"] == "SCREEN"
+        assert fallback[1] is results[1]
+
+    async def test_extract_many_bounded(self, extractor):
+        """批量提取同时进行的条数不超过上限"""
+        import asyncio
+        from app.services.data_extractor import MAX_PARALLEL_EXTRACTIONS
+
+        running = peak = 0
+
+        async def create(**kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return _response('{"category": "MOOD", "reply_text": "状态不错哦"}')
+
+        extractor.client.chat.completions.create = AsyncMock(side_effect=create)
+        # 模型并发上限放宽，只观察批量提取自身的上限
+        with patch('app.services.ai_client._concurrency_limiter._semaphores', {}), \
+                patch('app.services.ai_client._concurrency_limiter.MODEL_LIMITS', {}), \
+                patch('app.services.ai_client._concurrency_limiter.DEFAULT_LIMIT', 100):
+            results = await extractor.extract_many(
+                [{"image_type": "other", "text": f"第{i}条"} for i in range(MAX_PARALLEL_EXTRACTIONS * 2)]
+            )
+
+        assert len(results) == MAX_PARALLEL_EXTRACTIONS * 2
+        assert peak == MAX_PARALLEL_EXTRACTIONS
+
+    async def test_prompt_rendered_once_per_minute(self, extractor):
+        """同一分钟内的提示词复用缓存，JSON 示例的花括号保留原样"""
+        from app.services.data_extractor import _render_prompt
+
+        _render_prompt.cache_clear()
+        for _ in range(2):
+            await extractor.extract(image_type="other", text="午饭吃了面", client_time="2026-10-16T12:30:00+08:00")
+
+        assert _render_prompt.cache_info().hits == 1
+        system_prompt = extractor.client.chat.completions.create.await_args.kwargs["messages"][0]["content"]
+        assert "当前时间：2026年10月16日 12:30（中午）" in system_prompt
+        assert '"record_time": "事件实际发生时间，ISO格式如 2026-10-16T12:30:00' in system_prompt
+        assert '"dimension_scores": {\n    "body": 0-100,' in system_prompt
+
+    def test_small_or_remote_image_unchanged(self):
+        """未超尺寸的图片和公开 URL 不重新编码"""
+        import base64
+        import io
+        from PIL import Image
+        from app.services.data_extractor import _prepare_image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600)).save(buffer, "JPEG")
+        small = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+        assert _prepare_image(small, 1024) is small
+        assert _prepare_image("https://example.com/a.jpg", 512) == "https://example.com/a.jpg"
+        assert _prepare_image("data:image/jpeg;base64,aGk=", 512) == "data:image/jpeg;base64,aGk="
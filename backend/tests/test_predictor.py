@@ -69,6 +69,23 @@ class TestPredictor:
         
         assert len(recommendations) > 0
         assert any("咖啡因" in r for r in recommendations)
+    
+    def test_check_mood_pattern_negative(self, predictor, test_db):
+        """测试心情模式 - 负面关键词偏多"""
+        from app.models import LifeStream
+        
+        contents = ["有点焦虑", "好累", "压力好大", "失眠了", "今天很开心"]
+        test_db.add_all([
+            LifeStream(input_type="TEXT", category="MOOD", raw_content=c,
+                       created_at=datetime.now() - timedelta(days=1))
+            for c in contents
+        ])
+        test_db.commit()
+        
+        alert = predictor._check_mood_pattern()
+        
+        assert alert["level"] == "warning"
+        assert alert["message"] == "最近负面情绪记录较多（4 条）"
 
 
 class TestPredictorWithData:
@@ -94,6 +111,13 @@ class TestPredictorWithData:
         # 分数应该在合理范围
         assert 0 <= result["predicted_score"] <= 100
     
+    def test_recent_trend(self, predictor_with_data):
+        """测试近期趋势（后半段日均分低于前半段）"""
+        trend = predictor_with_data._get_recent_trend(30)
+        
+        assert trend["direction"] == "down"
+        assert trend["strength"] == pytest.approx(3.5)
+    
     def test_detect_anomalies(self, predictor_with_data):
         """测试异常检测"""
         result = predictor_with_data.detect_anomalies(days=30)
@@ -117,6 +117,33 @@ class TestRAGServiceWithMockEmbedding:
         results = rag_service_mocked.search("睡眠", n_results=5)
         
         assert isinstance(results, list)
+    
+    def test_query_embedding_cached(self, rag_service_mocked):
+        """测试重复查询只请求一次嵌入"""
+        create = rag_service_mocked.openai_client.embeddings.create
+        
+        rag_service_mocked.search("睡眠", n_results=5)
+        rag_service_mocked.search("睡眠", n_results=5)
+        rag_service_mocked.search("心情", n_results=5)
+        
+        assert create.call_count == 2
+
+    def test_search_results_cached_until_index_changes(self, rag_service_mocked, sample_life_records):
+        """相同查询复用检索结果，索引变更后重新检索"""
+        rag_service_mocked.index_record(sample_life_records[0])
+
+        with patch.object(rag_service_mocked, "collection", wraps=rag_service_mocked.collection) as collection:
+            first = rag_service_mocked.search("睡眠", n_results=5)
+            again = rag_service_mocked.search("睡眠", n_results=5)
+            rag_service_mocked.search("睡眠", n_results=3)
+            assert collection.query.call_count == 2
+
+            rag_service_mocked.index_record(sample_life_records[1])
+            after = rag_service_mocked.search("睡眠", n_results=5)
+            assert collection.query.call_count == 3
+
+        assert again == first and len(first) == 1
+        assert len(after) == 2
 
 
 class TestRAGServiceAsk:
@@ -98,6 +98,16 @@ class TestTimeIntelligence:
         assert time_intel.get_time_period_name(22) == "夜晚"
         assert time_intel.get_time_period_name(2) == "深夜"
 
+    def test_classify_mood(self):
+        """测试心情分类按优先级取命中的心情"""
+        from app.services.time_intelligence import _classify_mood
+
+        assert _classify_mood("#心情/开心") == "开心"
+        assert _classify_mood("有点累但是很充实") == "疲惫"
+        assert _classify_mood("很焦虑，后来放松了") == "平静"
+        assert _classify_mood("心里不安宁") == "平静"
+        assert _classify_mood("#时间/早晨") is None
+
 
 class TestTimeIntelligenceWithData:
     """测试带数据的 TimeIntelligence"""
@@ -160,6 +170,13 @@ class TestTimeIntelligenceWithData:
         # 检查生物钟类型
         assert "name" in result["chronotype"]
         assert "description" in result["chronotype"]
+    
+    def test_get_mood_distribution(self, time_intel_with_data):
+        """测试心情分布"""
+        result = time_intel_with_data.get_mood_distribution(days=30)
+        
+        assert result["total_mood_records"] == 7
+        assert result["distribution"] == [{"mood": "开心", "count": 7, "percentage": 100.0}]
 
 
 class TestTimeIntelligenceAsync:
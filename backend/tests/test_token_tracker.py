@@ -0,0 +1,33 @@
+"""Token 用量追踪单元测试"""
+import pytest
+from unittest.mock import patch
+
+
+class TestUsageRecorder:
+    """测试后台批量记录"""
+
+    @pytest.mark.asyncio
+    async def test_record_usage_queued_and_flushed(self):
+        """事件循环内只入队，flush 时批量写入"""
+        from app.services.token_tracker import UsageRecorder
+
+        recorder = UsageRecorder()
+        written = []
+        with patch('app.services.token_tracker._usage_recorder', recorder), \
+                patch('app.services.token_tracker.record_usage_batch', side_effect=written.extend):
+            from app.services.token_tracker import record_usage, flush_usage
+
+            for i in range(3):
+                assert record_usage("glm-4.7", 10 + i, 5, "chat") is None
+            await flush_usage()
+
+        assert [r.prompt_tokens for r in written] == [10, 11, 12]
+
+    def test_build_usage_model_type(self):
+        """测试模型类型和费用计算"""
+        from app.services.token_tracker import build_usage
+
+        assert build_usage("glm-4.7-flash", 100, 50, "chat").model_type == "text_free"
+        assert build_usage("glm-4.6v-flash", 100, 50, "vision").model_type == "vision_free"
+        assert build_usage("embedding-3", 100, 0, "embedding").model_type == "embedding"
+        assert build_usage("glm-4.7", 100, 50, "chat").total_tokens == 150